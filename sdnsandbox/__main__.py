@@ -1,14 +1,13 @@
+import json
 import sys
 from os import makedirs
-from mininet.log import setLogLevel
 import logging
 import argparse
 from os.path import join as pj
 
-from sdnsandbox.runner import RunnerFactory
-
 
 def setup_logging(sdnsandbox_debug, mininet_debug, output_dir):
+    from mininet.log import setLogLevel
     root_logger = logging.getLogger()
     if sdnsandbox_debug:
         root_logger.setLevel(logging.DEBUG)
@@ -30,13 +29,28 @@ def setup_logging(sdnsandbox_debug, mininet_debug, output_dir):
 def parse_arguments():
     parser = argparse.ArgumentParser(prog="sdnsandbox")
     parser.add_argument("-c", "--config", required=True, help="JSON configuration file")
-    parser.add_argument("-o", "--output-dir", required=True, help="The experiment output directory")
+    parser.add_argument("-o", "--output-dir", help="The experiment output directory")
     parser.add_argument("-d", "--debug", action="store_true", help="Set SDNSandbox verbosity to debug level")
     parser.add_argument("--mininet-debug", action="store_true", help="Set mininet verbosity to debug level")
-    return parser.parse_args()
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only compute and summarise the load schedule (saved to the output directory if given)")
+    parser.add_argument("--hosts", type=int, help="The number of hosts to schedule in a dry run "
+                                                  "(default: those of the configured topology)")
+    args = parser.parse_args()
+    if args.output_dir is None and not args.dry_run:
+        parser.error("the following arguments are required: -o/--output-dir")
+    return args
 
 
 args = parse_arguments()
+if args.dry_run:
+    logging.basicConfig(stream=sys.stdout, level=logging.DEBUG if args.debug else logging.INFO,
+                        format='%(asctime)s->%(name)s-%(levelname)s: %(message)s')
+    from sdnsandbox.dry_run import dry_run
+    print(json.dumps(dry_run(args.config, args.hosts, args.output_dir), indent=4))
+    sys.exit(0)
+
+from sdnsandbox.runner import RunnerFactory
 logs_path = pj(args.output_dir, "logs")
 makedirs(logs_path, exist_ok=True)
 setup_logging(args.debug, args.mininet_debug, logs_path)
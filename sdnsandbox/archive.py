@@ -0,0 +1,143 @@
+import json
+import logging
+from os import makedirs, replace
+from os.path import join as pj, isfile
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# fixed width records, so each partition file can be memory-mapped as is
+RAW_SAMPLE_DTYPE = np.dtype([('time', '<i8'), ('ifIndex', '<u4'), ('value', '<u8')])
+
+
+class RawSamplesWriter(object):
+    """Appends raw (time, ifIndex, value) samples to record files partitioned by time.
+    A JSON manifest describing the partitions is rewritten on every flush, so a crash keeps all flushed data."""
+    manifest_filename = 'manifest.json'
+
+    def __init__(self, path: str, partition_seconds: int = 3600):
+        self.path = path
+        self.partition_seconds = partition_seconds
+        self.partitions = {}  # type: Dict[int, Dict]
+        makedirs(path, exist_ok=True)
+        manifest_path = pj(path, self.manifest_filename)
+        if isfile(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest['partition_seconds'] != partition_seconds:
+                raise ValueError("Existing raw samples archive at %s is partitioned by %d seconds, not %d" %
+                                 (path, manifest['partition_seconds'], partition_seconds))
+            self.partitions = {p['start']: p for p in manifest['partitions']}
+
+    def append(self, times: np.ndarray, intf_indexes: np.ndarray, values: np.ndarray):
+        records = np.empty(len(times), dtype=RAW_SAMPLE_DTYPE)
+        records['time'] = times
+        records['ifIndex'] = intf_indexes
+        records['value'] = values
+        starts = records['time'] - records['time'] % self.partition_seconds
+        for start in np.unique(starts):
+            self.append_partition(int(start), records[starts == start])
+
+    def append_partition(self, start: int, records: np.ndarray):
+        partition = self.partitions.get(start)
+        if partition is None:
+            partition = {'start': start,
+                         'filename': 'samples-%d.bin' % start,
+                         'rows': 0,
+                         'min_time': int(records['time'].min()),
+                         'max_time': int(records['time'].max()),
+                         'sorted': True}
+            self.partitions[start] = partition
+        times = records['time']
+        partition['sorted'] = bool(partition['sorted'] and
+                                   (partition['rows'] == 0 or times[0] >= partition['max_time']) and
+                                   np.all(times[1:] >= times[:-1]))
+        partition['min_time'] = min(partition['min_time'], int(times.min()))
+        partition['max_time'] = max(partition['max_time'], int(times.max()))
+        partition['rows'] += len(records)
+        with open(pj(self.path, partition['filename']), 'ab') as f:
+            f.write(records.tobytes())
+
+    def flush(self):
+        manifest = {'dtype': RAW_SAMPLE_DTYPE.descr,
+                    'partition_seconds': self.partition_seconds,
+                    'partitions': [self.partitions[start] for start in sorted(self.partitions)]}
+        # write aside and rename, so the manifest is never seen half written
+        manifest_path = pj(self.path, self.manifest_filename)
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=4)
+        replace(manifest_path + '.tmp', manifest_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    @staticmethod
+    def from_csv(csv_file, path: str, partition_seconds: int = 3600, block_bytes: int = 1 << 24):
+        """Converts an sFlow CSV of 'time,ifIndex,value' lines into a raw samples archive, one block at a time"""
+        # imported here as the monitor module depends on this one
+        from sdnsandbox.monitor import SFlowMonitor
+        with RawSamplesWriter(path, partition_seconds) as writer:
+            leftover = ''
+            while True:
+                text = csv_file.read(block_bytes)
+                if not text:
+                    break
+                last_newline = text.rfind('\n')
+                if last_newline == -1:
+                    leftover += text
+                    continue
+                samples = SFlowMonitor.parse_samples_block(leftover + text[:last_newline + 1])
+                writer.append(samples[:, 0], samples[:, 1], samples[:, 2])
+                leftover = text[last_newline + 1:]
+            samples = SFlowMonitor.parse_samples_block(leftover)
+            if len(samples):
+                writer.append(samples[:, 0], samples[:, 1], samples[:, 2])
+        return writer
+
+
+class RawSamplesReader(object):
+    """Memory-maps only the partitions of a raw samples archive that overlap a requested time window"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(pj(path, RawSamplesWriter.manifest_filename)) as f:
+            manifest = json.load(f)
+        self.partition_seconds = manifest['partition_seconds']
+        self.partitions = manifest['partitions']  # type: List[Dict]
+
+    def partitions_for(self, start: Optional[int] = None, end: Optional[int] = None) -> List[Dict]:
+        return [p for p in self.partitions
+                if (start is None or p['max_time'] >= start) and (end is None or p['min_time'] < end)]
+
+    def read(self, start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+        """Returns the records with start <= time < end, as a view of the mapped file when possible"""
+        chunks = []
+        for partition in self.partitions_for(start, end):
+            records = np.memmap(pj(self.path, partition['filename']), dtype=RAW_SAMPLE_DTYPE, mode='r',
+                                shape=(partition['rows'],))
+            times = records['time']
+            if partition['sorted']:
+                first = 0 if start is None else np.searchsorted(times, start, side='left')
+                last = len(records) if end is None else np.searchsorted(times, end, side='left')
+                records = records[first:last]
+            else:
+                in_window = np.ones(len(records), dtype=bool)
+                if start is not None:
+                    in_window &= times >= start
+                if end is not None:
+                    in_window &= times < end
+                records = records[in_window]
+            chunks.append(records)
+        if not chunks:
+            return np.empty(0, dtype=RAW_SAMPLE_DTYPE)
+        return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+    def time_span(self):
+        if not self.partitions:
+            return None
+        return min(p['min_time'] for p in self.partitions), max(p['max_time'] for p in self.partitions)
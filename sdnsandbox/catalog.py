@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, asdict, field
+from os import stat, listdir, replace
+from os.path import join as pj, isfile, isdir, basename, splitext, abspath
+from typing import List, Optional, Dict, Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+from dacite import from_dict
+
+from sdnsandbox.store import StoredSamples
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CatalogEntry:
+    directory: str
+    topology: str
+    switches: int
+    links: int
+    hd5_filename: str
+    hd5_key: str
+    rows: int
+    columns: List[str]
+    # unix nanoseconds of the first and last samples
+    start: Optional[int]
+    end: Optional[int]
+    config_hash: Optional[str]
+    # the sample time at every row_offsets_stride rows, for reading time ranges without scanning the store
+    row_offsets_stride: int
+    offset_times: List[int] = field(default_factory=list)
+    # size and modification time of the samples file, to know when the entry is stale
+    hd5_size: int = 0
+    hd5_mtime_ns: int = 0
+
+    @property
+    def hd5_path(self) -> str:
+        return pj(self.directory, self.hd5_filename)
+
+    def rows_for(self, start: Optional[int] = None, end: Optional[int] = None) -> Tuple[int, int]:
+        """A range of rows holding (at least) all samples with start <= time <= end"""
+        offset_times = np.asarray(self.offset_times, dtype=np.int64)
+        first = 0 if start is None else max(0, int(np.searchsorted(offset_times, start, side='right')) - 1)
+        last = len(offset_times) if end is None else int(np.searchsorted(offset_times, end, side='right'))
+        return first * self.row_offsets_stride, min(self.rows, last * self.row_offsets_stride)
+
+
+class CatalogBuilder(object):
+    """Scans experiment output directories and records what each holds in one index file"""
+
+    def __init__(self, hd5_filename: str = 'sdnsandbox.hd5', hd5_key: str = 'sdnsandbox_data',
+                 network_data_filename: str = 'network_data.json', config_filename: str = 'config.json',
+                 row_offsets_stride: int = 3600):
+        self.hd5_filename = hd5_filename
+        self.hd5_key = hd5_key
+        self.network_data_filename = network_data_filename
+        self.config_filename = config_filename
+        self.row_offsets_stride = row_offsets_stride
+
+    def find_experiment_dirs(self, roots: List[str]) -> List[str]:
+        """The given directories and their direct subdirectories holding samples"""
+        found = []  # type: List[str]
+        for root in roots:
+            candidates = [root] + sorted(pj(root, name) for name in listdir(root) if isdir(pj(root, name)))
+            found.extend(abspath(d) for d in candidates if isfile(pj(d, self.hd5_filename)))
+        return found
+
+    def build(self, roots: List[str], catalog_path: str) -> 'Catalog':
+        """Writes the catalog of all experiments under the roots, reusing the entries of unchanged ones"""
+        previous = {}  # type: Dict[str, CatalogEntry]
+        if isfile(catalog_path):
+            previous = {entry.directory: entry for entry in Catalog.load(catalog_path).entries}
+        entries = []
+        for directory in self.find_experiment_dirs(roots):
+            hd5_stat = stat(pj(directory, self.hd5_filename))
+            entry = previous.get(directory)
+            if entry is None or (entry.hd5_size, entry.hd5_mtime_ns) != (hd5_stat.st_size, hd5_stat.st_mtime_ns):
+                logger.info("Cataloging %s", directory)
+                entry = self.create_entry(directory)
+            entries.append(entry)
+        catalog = Catalog(entries)
+        catalog.save(catalog_path)
+        logger.info("Cataloged %d experiments in %s", len(entries), catalog_path)
+        return catalog
+
+    def create_entry(self, directory: str) -> CatalogEntry:
+        network_data = {}
+        if isfile(pj(directory, self.network_data_filename)):
+            with open(pj(directory, self.network_data_filename)) as f:
+                network_data = json.load(f)
+        config_hash, topology = None, None
+        if isfile(pj(directory, self.config_filename)):
+            with open(pj(directory, self.config_filename), 'rb') as f:
+                config_bytes = f.read()
+            config_hash = hashlib.sha256(config_bytes).hexdigest()
+            topology = self.get_topology_name(json.loads(config_bytes.decode('utf-8')))
+        if topology is None:
+            # run_list_of_experiments.sh names the directories SDNSandbox-<ISP>
+            topology = basename(directory).split('SDNSandbox-', 1)[-1]
+        rows = 0
+        columns = []  # type: List[str]
+        offset_times = []  # type: List[int]
+        hd5_path = pj(directory, self.hd5_filename)
+        for chunk in StoredSamples(hd5_path, self.hd5_key).iter_chunks(self.row_offsets_stride):
+            if not columns:
+                columns = ['-'.join(c) if isinstance(c, tuple) else str(c) for c in chunk.columns]
+            offset_times.append(int(chunk.index[0].value))
+            rows += len(chunk)
+            end = int(chunk.index[-1].value)
+        hd5_stat = stat(hd5_path)
+        return CatalogEntry(directory=directory,
+                            topology=topology,
+                            switches=len(network_data.get('switches', {})),
+                            links=len(network_data.get('switch_links', [])),
+                            hd5_filename=self.hd5_filename,
+                            hd5_key=self.hd5_key,
+                            rows=rows,
+                            columns=columns,
+                            start=offset_times[0] if rows else None,
+                            end=end if rows else None,
+                            config_hash=config_hash,
+                            row_offsets_stride=self.row_offsets_stride,
+                            offset_times=offset_times,
+                            hd5_size=hd5_stat.st_size,
+                            hd5_mtime_ns=hd5_stat.st_mtime_ns)
+
+    @staticmethod
+    def get_topology_name(config: Dict) -> Optional[str]:
+        graphml = config.get('runner', {}).get('network', {}).get('topology_creator', {}).get('graphml')
+        return splitext(basename(graphml))[0] if graphml else None
+
+
+class Catalog(object):
+    """The cataloged experiments, whose samples are only read for the entries and time ranges a query asks for"""
+
+    def __init__(self, entries: List[CatalogEntry]):
+        self.entries = entries
+
+    @staticmethod
+    def load(catalog_path: str) -> 'Catalog':
+        with open(catalog_path) as f:
+            return Catalog([from_dict(CatalogEntry, entry) for entry in json.load(f)['entries']])
+
+    def save(self, catalog_path: str):
+        with open(catalog_path + '.tmp', 'w') as f:
+            json.dump({'entries': [asdict(entry) for entry in self.entries]}, f, separators=(',', ':'))
+        replace(catalog_path + '.tmp', catalog_path)
+
+    def query(self, topology: Optional[str] = None, min_switches: int = 0, max_switches: Optional[int] = None,
+              column: Optional[str] = None, start: Optional[int] = None, end: Optional[int] = None) \
+            -> List[CatalogEntry]:
+        """The entries matching all given conditions, with start and end as unix nanoseconds of an overlapped span"""
+        return [entry for entry in self.entries
+                if (topology is None or entry.topology == topology) and
+                entry.switches >= min_switches and (max_switches is None or entry.switches <= max_switches) and
+                (column is None or column in entry.columns) and
+                (start is None or (entry.end is not None and entry.end >= start)) and
+                (end is None or (entry.start is not None and entry.start <= end))]
+
+    @staticmethod
+    def read(entry: CatalogEntry, start: Optional[int] = None, end: Optional[int] = None,
+             columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Reads only the rows of the entry's store around the requested time range"""
+        first, last = entry.rows_for(start, end)
+        with pd.HDFStore(entry.hd5_path, mode='r') as store:
+            samples_df = store.select(entry.hd5_key, start=first, stop=last)
+        if start is not None:
+            samples_df = samples_df[samples_df.index >= pd.Timestamp(start)]
+        if end is not None:
+            samples_df = samples_df[samples_df.index <= pd.Timestamp(end)]
+        if columns is not None:
+            samples_df = samples_df[columns]
+        return samples_df
+
+    def read_all(self, entries: List[CatalogEntry], start: Optional[int] = None, end: Optional[int] = None,
+                 columns: Optional[List[str]] = None) -> Iterator[Tuple[CatalogEntry, pd.DataFrame]]:
+        """Lazily reads the entries one after the other"""
+        for entry in entries:
+            yield entry, self.read(entry, start, end, columns)
@@ -0,0 +1,69 @@
+import logging
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def min_max_indices(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """Indices of the minimum and maximum of each of points/2 equal buckets, so every peak and dip stays visible"""
+    n = len(y)
+    buckets = max(1, points // 2)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    # NaNs are never picked, unless a whole bucket is NaN
+    offsets = np.arange(buckets) * size
+    mins = offsets + np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    maxs = offsets + np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    indices = np.unique(np.concatenate([mins, maxs]))
+    return indices[indices < n]
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """Indices picked by Largest-Triangle-Three-Buckets (Steinarsson, "Downsampling Time Series for Visual
+    Representation", 2013): the first and last points, and per bucket the point forming the largest triangle with
+    the previously picked point and the next bucket's average"""
+    n = len(y)
+    points = max(3, points)
+    x = x.astype(np.float64)
+    y = np.where(np.isnan(y), 0.0, y)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    # averages of every bucket, the last "bucket" being the last point
+    sums_x = np.add.reduceat(x[:n - 1], edges[:-1])
+    sums_y = np.add.reduceat(y[:n - 1], edges[:-1])
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+    indices = np.empty(points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # twice the triangles' areas, all of the bucket's candidates at once
+        areas = np.abs((x[previous] - avg_x[bucket + 1]) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (avg_y[bucket + 1] - y[previous]))
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+    return indices
+
+
+METHODS: Dict[str, Callable[[np.ndarray, np.ndarray, int], np.ndarray]] = {'minmax': min_max_indices,
+                                                                         'lttb': lttb_indices}
+
+
+def downsample(series: pd.Series, method: str = 'minmax', points: int = 640) -> pd.Series:
+    """Reduces a series to about the given number of its own points, unchanged if it is not longer than that"""
+    if method not in METHODS:
+        raise ValueError("Unknown downsampling method %s, expected one of %s" % (method, sorted(METHODS)))
+    if len(series) <= points:
+        return series
+    index = series.index
+    x = index.asi8 if isinstance(index, pd.DatetimeIndex) else np.arange(len(series))
+    indices = METHODS[method](x, series.to_numpy(dtype=np.float64), points)
+    logger.debug("Downsampled %d points to %d using %s", len(series), len(indices), method)
+    return series.iloc[indices]
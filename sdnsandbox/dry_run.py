@@ -0,0 +1,48 @@
+"""Computes and summarises the load schedule of a config, without starting a network, to validate the config
+before running a long experiment:
+
+    python -m sdnsandbox --dry-run -c config.json [--hosts N] [-o output_dir]
+"""
+import json
+import logging
+from os import makedirs
+from os.path import join as pj
+from time import perf_counter
+from typing import Optional, Dict, Any
+
+from sdnsandbox.load_generator import LoadGeneratorFactory
+from sdnsandbox.schedule import SCHEDULE_FILENAME
+from sdnsandbox.topology import TopologyCreatorFactory
+
+logger = logging.getLogger(__name__)
+
+
+def dry_run(config_path: str, hosts_count: Optional[int] = None, output_dir: Optional[str] = None) -> Dict[str, Any]:
+    """The summary of the config's schedule, for the given number of hosts or else those of its topology
+    (which is then also given to the load generator).
+    The schedule is also saved to the output directory when one is given, so it can be run as is."""
+    with open(config_path) as conf_file:
+        conf = json.load(conf_file)['runner']
+    # nothing is sent, so the senders need not be installed
+    load_generator = LoadGeneratorFactory.create(dict(conf['load_generator'], disable_cmd_ensure=True))
+    if hosts_count is None:
+        topology_creator = TopologyCreatorFactory.create(conf['network']['topology_creator'])
+        load_generator.use_topology(topology_creator.switches, topology_creator.switch_links)
+        # the network has a host for every switch of the topology
+        hosts_count = len(topology_creator.switches)
+    start = perf_counter()
+    schedule = load_generator.create_schedule(hosts_count)
+    seconds = perf_counter() - start
+    if schedule is None:
+        # e.g. a trace replay, which sends what the trace does rather than by a schedule
+        logger.info("The %s load generator has no schedule", conf['load_generator']['type'])
+        return {'load_generator': conf['load_generator']['type'], 'hosts': hosts_count, 'schedule': None}
+    if output_dir is not None:
+        makedirs(output_dir, exist_ok=True)
+        schedule_path = pj(output_dir, SCHEDULE_FILENAME)
+        schedule.save(schedule_path)
+        logger.info("Saved the schedule to %s", schedule_path)
+    summary = schedule.summary()
+    summary['load_generator'] = conf['load_generator']['type']
+    summary['schedule_seconds'] = seconds
+    return summary
@@ -0,0 +1,67 @@
+import json
+import logging
+from typing import Optional, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+ARROW_FORMATS = ['arrow', 'parquet']
+NETWORK_DATA_METADATA_KEY = b'sdnsandbox.network_data'
+
+
+def import_pyarrow():
+    # pyarrow is only needed for these exports, so it is an optional dependency
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Exporting samples to Arrow or Parquet requires pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def samples_to_table(samples_df: pd.DataFrame, network_data: Optional[Dict] = None):
+    """An Arrow table of a timestamp column followed by a float32 column per sampled port (or port-counter),
+    with the network data as schema metadata"""
+    pa = import_pyarrow()
+    time_name = samples_df.index.name or 'time'
+    columns = [pa.array(samples_df.index.to_numpy(dtype='datetime64[ns]'), type=pa.timestamp('ns'))]
+    names = [time_name]
+    for position, column in enumerate(samples_df.columns):
+        columns.append(pa.array(samples_df.iloc[:, position].to_numpy(dtype=np.float32)))
+        names.append('-'.join(column) if isinstance(column, tuple) else str(column))
+    metadata = {}
+    if network_data is not None:
+        metadata[NETWORK_DATA_METADATA_KEY] = json.dumps(network_data, sort_keys=True).encode('utf-8')
+    return pa.Table.from_arrays(columns, names=names).replace_schema_metadata(metadata)
+
+
+def export_samples(samples_df: pd.DataFrame, path: str, export_format: str = 'arrow',
+                   network_data: Optional[Dict] = None):
+    """Writes the samples as an Arrow IPC file (which can be memory-mapped) or as a (smaller) Parquet file"""
+    if export_format not in ARROW_FORMATS:
+        raise ValueError("Unknown export format %s, expected one of %s" % (export_format, ARROW_FORMATS))
+    pa = import_pyarrow()
+    table = samples_to_table(samples_df, network_data)
+    logger.info("Exporting %d samples of %d ports to %s", table.num_rows, table.num_columns - 1, path)
+    if export_format == 'parquet':
+        pa.parquet.write_table(table, path)
+    else:
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_exported_samples(path: str) -> Tuple[np.ndarray, Dict[str, np.ndarray], Optional[Dict]]:
+    """Maps an exported Arrow IPC file, returning its times, float32 column arrays and network data.
+    The arrays are views of the mapped file, so nothing is copied (or read before it is used)."""
+    pa = import_pyarrow()
+    source = pa.memory_map(path, 'r')
+    table = pa.ipc.open_file(source).read_all()
+    arrays = {name: table.column(name).chunk(0).to_numpy(zero_copy_only=True)
+              for name in table.column_names}
+    times = arrays.pop(table.column_names[0])
+    metadata = table.schema.metadata or {}
+    network_data = json.loads(metadata[NETWORK_DATA_METADATA_KEY].decode('utf-8')) \
+        if NETWORK_DATA_METADATA_KEY in metadata else None
+    return times, arrays, network_data
@@ -1,23 +1,51 @@
+import heapq
+import json
 import logging
+import math
+import selectors
 import subprocess
+import sys
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from math import pi, sin
-from multiprocessing import Process
 from os.path import join as pj
-from subprocess import STDOUT
+from subprocess import STDOUT, PIPE
 from time import monotonic, sleep
-from typing import IO, List, Dict
+from typing import List, Dict, Optional, Tuple, Any
 import dacite
+import numpy as np
+import pandas as pd
 
-from sdnsandbox.util import ensure_cmd_exists
+from sdnsandbox.log_sink import LogSink, LogSinkConfig, LogStream
+from sdnsandbox.metrics import REGISTRY
+from sdnsandbox.rates import RateRecorder, NpingStats, ITGSendStats
+from sdnsandbox.schedule import LoadSchedule, SCHEDULE_FILENAME, calculate_periods_pps, destinations_to_shares, \
+    traffic_to_shares
+from sdnsandbox.topology import Switch, Link, ITZSwitch
+from sdnsandbox.trace_replay import open_trace, prepare_host_traces
+from sdnsandbox.udp_engine import LineReader
+from sdnsandbox.util import ensure_cmd_exists, ChildExitWatcher, calculate_distances_km
 
 from mininet.node import Host
 
 logger = logging.getLogger(__name__)
 
+PERIOD = REGISTRY.gauge('sdnsandbox_period', 'The index of the load period currently running')
+PERIODS = REGISTRY.gauge('sdnsandbox_periods', 'The number of load periods in the experiment')
+SENDERS_STARTED = REGISTRY.counter('sdnsandbox_senders_started_total', 'Sender processes started')
+SENDERS_SUCCEEDED = REGISTRY.counter('sdnsandbox_senders_succeeded_total',
+                                     'Senders that completed their period successfully')
+SENDERS_FAILED = REGISTRY.counter('sdnsandbox_senders_failed_total', 'Senders that finished their period failed')
+SENDERS_RERUN = REGISTRY.counter('sdnsandbox_senders_rerun_total', 'Crashed senders that were run again')
+SENDERS_TIMED_OUT = REGISTRY.counter('sdnsandbox_senders_timed_out_total',
+                                     'Senders killed for not finishing within their period')
+SENDER_PROCESSES = REGISTRY.gauge('sdnsandbox_sender_processes', 'Sender processes of the current period')
+RECEIVER_PROCESSES = REGISTRY.gauge('sdnsandbox_receiver_processes', 'Receiver processes running on the hosts')
+REPLAY_LAG = REGISTRY.labeled_gauge('sdnsandbox_replay_lag_seconds',
+                                    'The most a host sent packets behind the trace in the last second', 'host')
+
 
 class Protocol(Enum):
     UDP = 0
@@ -35,22 +63,39 @@ class Protocol(Enum):
 
 class DestinationCalculator(ABC):
     @abstractmethod
+    def calculate_destinations(self, periods, host_indices, hosts_count) -> np.ndarray:
+        """The indices (in the host addresses) of the destinations of the hosts in the periods,
+        given as arrays that broadcast together"""
+        pass
+
     def calculate_destination(self, period, host_index, host_addresses):
+        dest_index = self.calculate_destinations(np.asarray(period), np.asarray(host_index), len(host_addresses))
+        return host_addresses[int(dest_index)]
+
+    def calculate_shares(self, periods_count, hosts_count):
+        """The share of each host's rate sent to each destination, by default all of it to a single one,
+        as the rows (period * hosts_count + host_index) of a sparse matrix"""
+        periods = np.arange(periods_count)[:, None]
+        host_indices = np.arange(hosts_count)[None, :]
+        destinations = np.broadcast_to(self.calculate_destinations(periods, host_indices, hosts_count),
+                                       (periods_count, hosts_count))
+        return destinations_to_shares(destinations)
+
+    def use_topology(self, switches: Dict[int, Switch], switch_links: List[Link]):
+        """Called with the topology of the network before calculating, with a host per switch (by ID order)"""
         pass
 
     @staticmethod
-    def get_other_addresses(host_addresses, host_index):
-        other_addresses = list(host_addresses)
-        other_addresses.remove(host_addresses[host_index])
-        return other_addresses
+    def get_other_host_indices(other_indices, host_indices):
+        # indexes the addresses other than the host's own, which are shifted by one from the host's index on
+        return other_indices + (other_indices >= host_indices)
 
 
 class RoundRobinDestinationCalculator(DestinationCalculator):
-    def calculate_destination(self, period, host_index, host_addresses):
-        other_addresses = self.get_other_addresses(host_addresses, host_index)
+    def calculate_destinations(self, periods, host_indices, hosts_count):
         # adding the host_index to space out the destinations
-        period_dest_index = period + host_index
-        return other_addresses[period_dest_index % len(other_addresses)]
+        other_indices = (periods + host_indices) % (hosts_count - 1)
+        return self.get_other_host_indices(other_indices, host_indices)
 
 
 @dataclass
@@ -58,9 +103,112 @@ class StaticDeltaDestinationCalculator(DestinationCalculator):
     # default of zero delta means the next host after the current host
     delta: int = 0
 
-    def calculate_destination(self, period, host_index, host_addresses):
-        other_addresses = self.get_other_addresses(host_addresses, host_index)
-        return other_addresses[(host_index + self.delta) % len(other_addresses)]
+    def calculate_destinations(self, periods, host_indices, hosts_count):
+        other_indices = (host_indices + self.delta) % (hosts_count - 1)
+        dest_indices = self.get_other_host_indices(other_indices, host_indices)
+        return np.broadcast_to(dest_indices, np.broadcast(periods, host_indices).shape)
+
+
+@dataclass
+class TrafficMatrixDestinationCalculator(DestinationCalculator):
+    """Splits each host's rate between many destinations, by the traffic of a traffic matrix"""
+    # 'gravity' calculates the traffic between each two hosts from their switches, 'matrix' takes the given one
+    model: str = 'gravity'
+    # the hosts' gravity, by their switches' 'degree' or 'uniform'
+    weight: str = 'degree'
+    # how fast the gravity model's traffic decays with the distance between the switches (0 ignores geography)
+    distance_exponent: float = 0.0
+    # the traffic between hosts, as hosts x hosts (for all periods) or periods x hosts x hosts,
+    # given as is or as a .npy file
+    matrix: Optional[List[Any]] = None
+    matrix_path: Optional[str] = None
+    # the most destinations each host splits its rate between, keeping the ones it sends the most
+    # (None keeps all, which only the NATIVE-UDP-IMIX load generator can send, the others running a sender per flow)
+    max_destinations: Optional[int] = 4
+    switches: Dict[int, Switch] = field(default_factory=dict, repr=False)
+    switch_links: List[Link] = field(default_factory=list, repr=False)
+    # the traffic calculated for the current topology (or matrix), and each host's heaviest destination in it
+    traffic: Optional[np.ndarray] = field(default=None, init=False, repr=False)
+    heaviest: Optional[np.ndarray] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.model not in ('gravity', 'matrix'):
+            raise ValueError("Unknown traffic matrix model=%s" % self.model)
+        if self.weight not in ('degree', 'uniform'):
+            raise ValueError("Unknown traffic matrix weight=%s" % self.weight)
+        if self.model == 'matrix' and (self.matrix is None) == (self.matrix_path is None):
+            raise ValueError("The traffic matrix model needs either a matrix or a matrix_path")
+        if self.max_destinations is not None and self.max_destinations < 1:
+            raise ValueError("max_destinations=%d must keep at least one destination" % self.max_destinations)
+
+    def use_topology(self, switches, switch_links):
+        self.switches = switches
+        self.switch_links = switch_links
+        self.traffic, self.heaviest = None, None
+        if self.model == 'gravity':
+            self.calculate_traffic(len(switches))
+
+    def calculate_traffic(self, hosts_count) -> np.ndarray:
+        """The traffic from each host to each other host, with a leading axis of periods (or a single period),
+        calculated once per topology"""
+        if self.traffic is None or self.traffic.shape[-1] != hosts_count:
+            self.traffic = self.build_traffic(hosts_count)
+            traffic = self.traffic.copy()
+            traffic[:, np.arange(hosts_count), np.arange(hosts_count)] = -np.inf
+            self.heaviest = traffic.argmax(axis=-1)
+        return self.traffic
+
+    def build_traffic(self, hosts_count) -> np.ndarray:
+        if self.model == 'matrix':
+            matrix = self.matrix if self.matrix is not None else np.load(self.matrix_path, mmap_mode='r')
+            return np.array(matrix, dtype=np.float64, ndmin=3)
+        weights = np.ones(hosts_count)
+        if self.weight == 'degree' or self.distance_exponent:
+            if len(self.switches) != hosts_count:
+                raise ValueError("The gravity model needs the topology of the %d hosts, got %d switches" %
+                                 (hosts_count, len(self.switches)))
+            switch_ids = sorted(self.switches)
+        if self.weight == 'degree':
+            positions = {switch_id: position for position, switch_id in enumerate(switch_ids)}
+            pairs = {tuple(sorted((link.first_id, link.second_id))) for link in self.switch_links
+                     if link.first_id != link.second_id}
+            weights = np.bincount([positions[switch_id] for pair in pairs for switch_id in pair],
+                                  minlength=hosts_count).astype(np.float64)
+        traffic = weights[:, None] * weights[None, :]
+        if self.distance_exponent:
+            located = [switch for switch in (self.switches[switch_id] for switch_id in switch_ids)
+                       if isinstance(switch, ITZSwitch)]
+            if len(located) != hosts_count:
+                raise ValueError("The gravity model's distance_exponent needs the locations of all switches, "
+                                 "which the topology has for only %d of %d" % (len(located), hosts_count))
+            distances = calculate_distances_km(np.array([switch.lat for switch in located]),
+                                               np.array([switch.long for switch in located]))
+            # switches in the same city are considered a kilometer apart
+            traffic /= np.maximum(distances, 1.0) ** self.distance_exponent
+        # the hosts of switches without links weigh nothing, so they send uniformly rather than not at all
+        silent = traffic.sum(axis=1) - traffic.diagonal() <= 0
+        if silent.any() and hosts_count > 1:
+            logger.warning("The hosts of %d switches without links send to all other hosts uniformly",
+                           int(silent.sum()))
+            traffic[silent] = 1.0
+        return traffic[None]
+
+    def calculate_shares(self, periods_count, hosts_count):
+        return traffic_to_shares(self.calculate_traffic(hosts_count), periods_count, self.max_destinations)
+
+    def calculate_destinations(self, periods, host_indices, hosts_count):
+        # the destination each host sends the most
+        self.calculate_traffic(hosts_count)
+        return self.heaviest[np.asarray(periods) % len(self.heaviest), host_indices]
+
+
+def ensure_bounded_destinations(destination_calculator: DestinationCalculator, load_generator_type: str):
+    """Load generators running a sender process per bucket and destination can't split every host's rate
+    between all other hosts, which would run thousands of senders every period on large topologies"""
+    if isinstance(destination_calculator, TrafficMatrixDestinationCalculator) and \
+            destination_calculator.max_destinations is None:
+        raise ValueError("The %s load generator needs the traffic matrix's max_destinations, only NATIVE-UDP-IMIX "
+                         "splits the rates between all destinations" % load_generator_type)
 
 
 class DestinationCalculatorFactory:
@@ -71,12 +219,16 @@ class DestinationCalculatorFactory:
             return RoundRobinDestinationCalculator()
         elif strategy == 'static_delta':
             return StaticDeltaDestinationCalculator(int(destination_calculator_conf.get('delta', 0)))
+        elif strategy == 'traffic_matrix':
+            conf = {key: value for key, value in destination_calculator_conf.items() if key != 'strategy'}
+            return dacite.from_dict(data_class=TrafficMatrixDestinationCalculator, data=conf)
         else:
             raise ValueError("Unknown destination calculator strategy=%s" % strategy)
 
 
 class PeriodShifter(ABC):
-    # A period shifting interface to achieve constructive and destructive interference
+    # A period shifting interface to achieve constructive and destructive interference,
+    # the period and host index may also be arrays (of all periods and hosts) that broadcast together
     @abstractmethod
     def shift_period(self, period, host_index):
         pass
@@ -127,6 +279,17 @@ class LoadGeneratorFactory:
                                               PeriodShifter: lambda ps: PeriodShifterFactory.create(ps)
                                           }))
             return NpingUDPImixLoadGenerator(config)
+        elif load_generator_conf["type"] == "NATIVE-UDP-IMIX":
+            config = dacite.from_dict(data_class=NativeUDPImixConfig, data=load_generator_conf,
+                                      config=dacite.Config(
+                                          type_hooks={
+                                              DestinationCalculator: lambda dc: DestinationCalculatorFactory.create(dc),
+                                              PeriodShifter: lambda ps: PeriodShifterFactory.create(ps)
+                                          }))
+            return NativeUDPImixLoadGenerator(config)
+        elif load_generator_conf["type"] == "TRACE-REPLAY":
+            config = dacite.from_dict(data_class=TraceReplayConfig, data=load_generator_conf)
+            return TraceReplayLoadGenerator(config)
         else:
             raise ValueError("Unknown topology type=%s" % load_generator_conf["type"])
 
@@ -134,7 +297,10 @@ class LoadGeneratorFactory:
 @dataclass
 class Receiver:
     process: subprocess.Popen
-    logfile: IO
+    logfile: LogStream
+    address: Optional[str] = None
+    # the CSV of what the receiver counted receiving, for receivers that count
+    counts_path: Optional[str] = None
 
 
 @dataclass
@@ -142,13 +308,31 @@ class Sender:
     host: Host
     process: subprocess.Popen
     start_time: float
-    logfile: IO
+    logfile: LogStream
+    # the statistics of D-ITG senders, whose achieved rates are decoded from their logs rather than their output
+    stats: Optional[ITGSendStats] = None
+    # the times the sender was run again in its period, after crashing
+    reruns: int = 0
+
+
+@dataclass
+class SendersResults:
+    success: int = 0
+    timeout_terminated: int = 0
+    failure: int = 0
+
+    def add(self, other: 'SendersResults'):
+        self.success += other.success
+        self.timeout_terminated += other.timeout_terminated
+        self.failure += other.failure
 
 
 @dataclass
 class LoadGenerator(ABC):
     receivers: List[Receiver]
     senders: List[Sender]
+    # the rates the senders achieved, against their target rates
+    rate_recorder: RateRecorder = field(default_factory=RateRecorder)
 
     @abstractmethod
     def start_receivers(self, hosts: List[Host], logs_path):
@@ -162,6 +346,56 @@ class LoadGenerator(ABC):
     def stop_receivers(self):
         pass
 
+    def use_topology(self, switches: Dict[int, Switch], switch_links: List[Link]):
+        """Called with the topology of the network before the senders are run"""
+        pass
+
+    def read_received_counts(self) -> Optional[pd.DataFrame]:
+        """The packets and bytes every receiver (dst) received from every source (src) every second, when the
+        receivers count them"""
+        counts = []
+        for receiver in self.receivers:
+            if receiver.counts_path is None:
+                continue
+            try:
+                receiver_counts = pd.read_csv(receiver.counts_path, dtype={'src': str})
+            except FileNotFoundError:
+                logger.error("The receiver at %s counted nothing", receiver.address)
+                continue
+            receiver_counts.insert(1, 'dst', receiver.address)
+            counts.append(receiver_counts)
+        if not counts:
+            return None
+        received_df = pd.concat(counts, ignore_index=True).sort_values(['time', 'dst', 'src'], kind='mergesort')
+        received_df.index = pd.to_datetime(received_df.pop('time').to_numpy(), unit='s')
+        return received_df.rename_axis('time')
+
+    def read_sender_rates(self) -> Optional[pd.DataFrame]:
+        """The target and achieved packets per second (and bytes sent) of every host, period and bucket,
+        for load generators that account for them"""
+        if not len(self.rate_recorder):
+            return None
+        return self.rate_recorder.to_dataframe()
+
+    def create_schedule(self, hosts_count: int) -> Optional[LoadSchedule]:
+        """The rates and destinations of all periods and hosts, for load generators that send by a schedule"""
+        return None
+
+    def prepare_schedule(self, hosts_count: int, logs_path, schedule_path: Optional[str] = None) -> LoadSchedule:
+        """Loads the given schedule (e.g. one saved by a dry run) or computes it, keeping a copy with the logs"""
+        if schedule_path is None:
+            schedule = self.create_schedule(hosts_count)
+            if schedule is None:
+                raise ValueError("%s has no load schedule" % type(self).__name__)
+        else:
+            schedule = LoadSchedule.load(schedule_path)
+            if schedule.hosts != hosts_count:
+                raise ValueError("The schedule at %s is for %d hosts, not %d" %
+                                 (schedule_path, schedule.hosts, hosts_count))
+        schedule.save(pj(logs_path, SCHEDULE_FILENAME))
+        logger.info("Scheduled %d periods of %d hosts", schedule.periods, schedule.hosts)
+        return schedule
+
 
 @dataclass
 class DITGConfig:
@@ -175,16 +409,44 @@ class DITGConfig:
     disable_cmd_ensure: bool = False
     destination_calculator: DestinationCalculator = StaticDeltaDestinationCalculator()
     warmup_seconds: int = 0
+    # a crashed sender is run again after rerun_backoff_seconds, doubled for each of its reruns in the period,
+    # at most max_reruns times
+    rerun_backoff_seconds: float = 0.5
+    max_reruns: int = 5
+    # a saved schedule to run instead of computing it
+    schedule_path: Optional[str] = None
+    log_sink: LogSinkConfig = field(default_factory=LogSinkConfig)
 
 
 class DitgImixLoadGenerator(LoadGenerator):
+    # All values based roughly on http://www.caida.org/research/traffic-analysis/AIX/plen_hist/
+    # The IMIX split shown was ~30% 40B, ~55% normal around 576B, ~15% 1500B
+    # The 190 standard deviation makes 3-sigma between 50-1400 packet sizes be 99,7%
+    # Each bucket's share of the packets and packet size options, by protocol
+    imix_buckets = {
+        # To get a similar distribution with UDP:
+        # Constant packet size - 40B 30%, Normal Distribution for packet sizes - 55%,
+        # Constant packet size - 1500B - 15% (actual UDP packet payload is 1472 after removing layer2-4 headers)
+        Protocol.UDP: {'send_40bytes': (0.3, '-c 40'),
+                       'send_normal': (0.55, '-n 576, 190'),
+                       'send_1500B': (0.15, '-c 1472')},
+        # To get a similar distribution with TCP (which has builtin 40B ACKs):
+        # Normal distribution with [100 - (100 * 15 / (15 + 55))] = 78%, Constant packet size - 1500B - 22%
+        Protocol.TCP: {'send_normal': (0.78, '-n 576, 190'),
+                       'send_1500B': (0.22, '-c 1500')}}
+
     def __init__(self, config: DITGConfig):
         super().__init__([], [])
         failure_msg = "Can't setup D-ITG load generation!"
         if not config.disable_cmd_ensure:
             ensure_cmd_exists("ITGRecv", failure_msg)
             ensure_cmd_exists("ITGSend", failure_msg)
+            ensure_cmd_exists("ITGDec", failure_msg)
+        ensure_bounded_destinations(config.destination_calculator, "DITG-IMIX")
         self.config = config
+        self.log_sink = LogSink(config.log_sink)
+        # decodes the logs of every period's senders while the next period runs
+        self.decoder = None  # type: Optional[ThreadPoolExecutor]
 
     def start_receivers(self, hosts, logs_path):
         logger.info("Adding ITGRecv to all network hosts")
@@ -195,69 +457,148 @@ class DitgImixLoadGenerator(LoadGenerator):
                        'done'
         self.receivers = []
         for host in hosts:
-            log_path = pj(logs_path, "receiver-" + host.IP() + ".log")
-            logfile = open(log_path, 'w')
+            logfile = self.log_sink.open(pj(logs_path, "receiver-" + host.IP() + ".log"), 'receiver')
             itg_recv = host.popen(itg_recv_cmd, shell=True, stderr=STDOUT, stdout=logfile)
+            logfile.close()
             self.receivers.append(Receiver(itg_recv, logfile))
+        RECEIVER_PROCESSES.set(len(self.receivers))
 
     def run_senders(self, hosts, logs_path):
         logger.info("Running ITGSenders")
         host_addresses = [host.IP() for host in hosts]
+        schedule = self.prepare_schedule(len(hosts), logs_path, self.config.schedule_path)
+        PERIODS.set(schedule.periods)
+        with ChildExitWatcher() as watcher:
+            for period in range(schedule.periods):
+                PERIOD.set(period)
+                self.run_period(period, hosts, host_addresses, logs_path, schedule, watcher)
+
+    def create_schedule(self, hosts_count):
+        if self.config.protocol not in self.imix_buckets:
+            raise RuntimeError("Unknown protocol defined for senders!")
+        buckets = self.imix_buckets[self.config.protocol]
         rate_factor = 1.0
         if self.config.rate_factor_by_hosts:
-            rate_factor /= len(hosts)
-        for period in range(self.config.periods):
-            for host_index, host in enumerate(hosts):
-                dest = self.config.destination_calculator.calculate_destination(period, host_index, host_addresses)
-                host_senders = self.run_host_senders(host, dest, logs_path, period, rate_factor)
-                self.senders.extend(host_senders)
-            success, timeout_terminated, failure, reruns = 0, 0, 0, 0
-            period_start = monotonic()
-            while monotonic() - period_start < self.config.period_duration_seconds:
-                for sender in self.senders:
-                    return_code = sender.process.poll()
-                    if return_code not in [0, None]:
-                        logger.debug("Found crashed sender at %s, after %d seconds with cmd %s",
-                                     sender.host.IP(),
-                                     int(monotonic() - sender.start_time),
-                                     str(sender.process.args))
-                        # make sure the log was already flushed before rerun
-                        sender.logfile.flush()
-                        # rerun sender
-                        self.run_sender(sender.host, sender.process.args, sender.logfile)
-                        reruns += 1
-                # avoid busy waiting
-                sleep(0.1)
-            for sender in self.senders:
-                return_code = sender.process.poll()
-                if return_code is None:
-                    logger.debug("Sender timed out and will be killed: %s", sender.process.args)
-                    # forcibly stop senders that took too long
-                    sender.process.kill()
-                    timeout_terminated += 1
-                elif return_code != 0:
-                    failure += 1
-                else:
-                    success += 1
-                sender.logfile.close()
-            self.senders = []
-            logger.info(
-                "For period=%d we had "
-                "%d successfully completed senders, "
-                "%d sender reruns due to failure (probably a D-ITG issue), "
-                "%d senders we terminated due to timeout "
-                "and %d senders who finished the period in a failed state",
-                period, success, reruns, timeout_terminated, failure)
-
-    def run_host_senders(self, host, dest, logs_path, period, rate_factor):
+            rate_factor /= hosts_count
+        periods = np.arange(self.config.periods)[:, None]
+        periods_pps = calculate_periods_pps(periods, self.config.pps_base_level, self.config.pps_amplitude,
+                                            self.config.pps_wavelength) * rate_factor
+        periods_pps = np.broadcast_to(periods_pps, (self.config.periods, hosts_count))
+        rates = np.stack([np.trunc(share * periods_pps) for share, _ in buckets.values()], axis=-1)
+        shares = self.config.destination_calculator.calculate_shares(self.config.periods, hosts_count)
+        return LoadSchedule(list(buckets), rates, shares, self.config.period_duration_seconds)
+
+    def use_topology(self, switches, switch_links):
+        self.config.destination_calculator.use_topology(switches, switch_links)
+
+    def run_period(self, period, hosts, host_addresses, logs_path, schedule: LoadSchedule,
+                   watcher: ChildExitWatcher):
+        for host_index, host in enumerate(hosts):
+            # ITGSend's rates are whole packets per second, the rates of flows below one are given to the others
+            flows = schedule.host_flows(period, host_index, host_addresses, min_rate=1)
+            host_senders = self.run_host_senders(host, period, flows, logs_path)
+            self.senders.extend(host_senders)
+        SENDERS_STARTED.inc(len(self.senders))
+        SENDER_PROCESSES.set(len(self.senders))
+        success, timeout_terminated, failure = 0, 0, 0
+        reruns = self.supervise_senders(watcher, monotonic() + self.config.period_duration_seconds)
+        for sender in self.senders:
+            watcher.unwatch(sender.process)
+            return_code = sender.process.poll()
+            if return_code is None:
+                logger.debug("Sender timed out and will be killed: %s", sender.process.args)
+                # forcibly stop senders that took too long
+                sender.process.kill()
+                sender.process.wait()
+                timeout_terminated += 1
+            elif return_code != 0:
+                failure += 1
+            else:
+                success += 1
+            sender.logfile.close()
+            if sender.stats is not None:
+                if self.decoder is None:
+                    self.decoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='itg-dec')
+                self.decoder.submit(sender.stats.decode)
+        self.senders = []
+        SENDERS_SUCCEEDED.inc(success)
+        SENDERS_FAILED.inc(failure)
+        SENDERS_TIMED_OUT.inc(timeout_terminated)
+        SENDER_PROCESSES.set(0)
+        logger.info(
+            "For period=%d we had "
+            "%d successfully completed senders, "
+            "%d sender reruns due to failure (probably a D-ITG issue), "
+            "%d senders we terminated due to timeout "
+            "and %d senders who finished the period in a failed state",
+            period, success, reruns, timeout_terminated, failure)
+
+    def supervise_senders(self, watcher: ChildExitWatcher, deadline: float) -> int:
+        """Reruns senders that crash, backing off between the reruns of each sender, until the deadline,
+        returning the number of reruns"""
+        senders_by_pid = {}  # type: Dict[int, Sender]
+        for sender in self.senders:
+            senders_by_pid[sender.process.pid] = sender
+            watcher.watch(sender.process)
+        # the crashed senders by the time they are run again
+        backing_off = []  # type: List[Tuple[float, int, Sender]]
+        reruns = 0
+        while True:
+            now = monotonic()
+            while backing_off and backing_off[0][0] <= now:
+                sender = heapq.heappop(backing_off)[2]
+                self.rerun_sender(sender)
+                senders_by_pid[sender.process.pid] = sender
+                watcher.watch(sender.process)
+                reruns += 1
+                SENDERS_RERUN.inc()
+            time_left = deadline - now
+            if time_left <= 0:
+                return reruns
+            if backing_off:
+                time_left = min(time_left, backing_off[0][0] - now)
+            for process in watcher.wait(time_left):
+                if process.pid not in senders_by_pid:
+                    continue
+                sender = senders_by_pid.pop(process.pid)
+                if process.returncode == 0:
+                    continue
+                logger.debug("Found crashed sender at %s, after %d seconds with cmd %s, its last output:\n%s",
+                             sender.host.IP(),
+                             int(monotonic() - sender.start_time),
+                             str(process.args),
+                             '\n'.join(sender.logfile.tail()))
+                if sender.reruns >= self.config.max_reruns:
+                    logger.warning("Sender at %s crashed %d times, not running it again in this period: %s",
+                                   sender.host.IP(), sender.reruns + 1, process.args)
+                    continue
+                rerun_time = monotonic() + self.config.rerun_backoff_seconds * 2 ** sender.reruns
+                heapq.heappush(backing_off, (rerun_time, id(sender), sender))
+
+    def rerun_sender(self, sender: Sender):
+        """Runs the crashed sender again, with a stream and statistics of its own"""
+        sender.logfile.close()
+        sender.logfile = self.log_sink.open(sender.logfile.path, sender.logfile.name)
+        if sender.stats is not None:
+            sender.stats.reset()
+        sender.process = self.run_sender(sender.host, sender.process.args, sender.logfile)
+        sender.start_time = monotonic()
+        sender.reruns += 1
+
+    def run_host_senders(self, host, period, flows: List[Tuple[str, Dict[str, float]]], logs_path):
         host_senders = []
-        itg_send_opts = self.calculate_send_opts(period, dest, rate_factor)
-        for opts in itg_send_opts.items():
-            itg_send_cmd = 'ITGSend ' + opts[1]
-            log_path = pj(logs_path, "sender-" + host.IP() + "-" + opts[0] + ".log")
-            logfile = open(log_path, 'a')
-            itg_send = self.run_sender(host, itg_send_cmd, logfile)
-            host_senders.append(Sender(host, itg_send, monotonic(), logfile))
+        duration_seconds = self.config.period_duration_seconds - self.config.warmup_seconds
+        for dest, rates in flows:
+            itg_send_opts = self.calculate_send_opts(dest, rates)
+            for opts in itg_send_opts.items():
+                # the achieved rate is decoded from the log ITGSend writes its flow's packets to
+                itg_log_path = pj(logs_path, "itgsend-%s-%d-%s-%s.log" % (host.IP(), period, dest, opts[0]))
+                itg_send_cmd = 'ITGSend ' + opts[1] + ' -l ' + itg_log_path
+                stats = ITGSendStats(self.rate_recorder, host.IP(), period, opts[0], int(rates[opts[0]]),
+                                     duration_seconds, itg_log_path)
+                logfile = self.log_sink.open(pj(logs_path, "sender-" + host.IP() + ".log"), opts[0])
+                itg_send = self.run_sender(host, itg_send_cmd, logfile)
+                host_senders.append(Sender(host, itg_send, monotonic(), logfile, stats))
         return host_senders
 
     @staticmethod
@@ -265,6 +606,7 @@ class DitgImixLoadGenerator(LoadGenerator):
         logfile.write(str(datetime.now()) + ": Starting ITGSend with cmd='" + str(itg_send_cmd) + "'\n")
         logfile.flush()
         itg_send = host.popen(itg_send_cmd, stderr=STDOUT, stdout=logfile)
+        logfile.close()
         return itg_send
 
     def stop_receivers(self):
@@ -272,46 +614,19 @@ class DitgImixLoadGenerator(LoadGenerator):
         for receiver in self.receivers:
             receiver.process.terminate()
             receiver.logfile.close()
+        RECEIVER_PROCESSES.set(0)
+        self.log_sink.close()
+        if self.decoder is not None:
+            # the senders' logs of the last period are decoded before their rates are read
+            self.decoder.shutdown(wait=True)
+            self.decoder = None
 
-    def calculate_send_opts(self, period, dest, rate_factor):
-        send_opts = {}
+    def calculate_send_opts(self, dest, rates: Dict[str, float]):
         # allow sender warmup period
         duration_ms = (self.config.period_duration_seconds - self.config.warmup_seconds) * 1000
-        # 2pi is the regular wavelength of sine, so we divide it by the required wavelength to get the amplitude change
-        period_pps = self.config.pps_base_level + int(
-            self.config.pps_amplitude * sin(2 * pi * period / self.config.pps_wavelength))
-        period_pps *= rate_factor
-        # All values based roughly on http://www.caida.org/research/traffic-analysis/AIX/plen_hist/
-        # The IMIX split shown was ~30% 40B, ~55% normal around 576B, ~15% 1500B
-        # The 190 standard deviation makes 3-sigma between 50-1400 packet sizes be 99,7%
-        if self.config.protocol == Protocol.UDP:
-            # To get a similar distribution with UDP:
-            # Constant packet size - 40B 30%
-            send_opts['send_40bytes'] = '-a %s -T UDP -t %d -c 40 -C %d' % (dest,
-                                                                            duration_ms,
-                                                                            int(0.3 * period_pps))
-            # Normal Distribution for packet sizes - 55%
-            send_opts['send_normal'] = '-a %s -T UDP -t %d -n 576, 190 -C %d' % (dest,
-                                                                                 duration_ms,
-                                                                                 int(0.55 * period_pps))
-            # Constant packet size - 1500B - 15%
-            # Actual UDP packet payload is 1472 after removing layer2-4 headers
-            send_opts['send_1500B'] = '-a %s -T UDP -t %d -c 1472 -C %d' % (dest,
-                                                                            duration_ms,
-                                                                            int(0.15 * period_pps))
-        elif self.config.protocol == Protocol.TCP:
-            # To get a similar distribution with TCP (which has builtin 40B ACKs):
-            # Normal distribution with [100 - (100 * 15 / (15 + 55))] = 78%
-            send_opts['send_normal'] = '-a %s -T UDP -t %d -n 576, 190 -C %d' % (dest,
-                                                                                 duration_ms,
-                                                                                 int(0.78 * period_pps))
-            # Constant packet size - 1500B - 22%
-            send_opts['send_1500B'] = '-a %s -T UDP -t %d -c 1500 -C %d' % (dest,
-                                                                            duration_ms,
-                                                                            int(0.22 * period_pps))
-        else:
-            raise RuntimeError("Unknown protocol defined for senders!")
-        return send_opts
+        buckets = self.imix_buckets[self.config.protocol]
+        return {name: '-a %s -T UDP -t %d %s -C %d' % (dest, duration_ms, buckets[name][1], rate)
+                for name, rate in rates.items()}
 
 
 @dataclass
@@ -328,93 +643,129 @@ class NpingConfig:
     period_shifter: PeriodShifter = IdentityPeriodShifter()
     listen_port: int = 10000
     verbosity_level: int = -1
+    # the interpreter running sdnsandbox.udp_engine on the hosts
+    python_cmd: str = sys.executable
+    # a saved schedule to run instead of computing it
+    schedule_path: Optional[str] = None
+    log_sink: LogSinkConfig = field(default_factory=LogSinkConfig)
 
 
 class NpingUDPImixLoadGenerator(LoadGenerator):
+    # The data length of each bucket's packets, of the split in calculate_rates
+    bucket_data_lengths = {'send_40bytes': 40, 'send_normal_low': 448, 'send_normal_mid': 576,
+                           'send_normal_high': 704, 'send_1500B': 1472}
+    # whether every bucket of every flow is sent by an nping process of its own
+    sender_per_flow = True
+
     def __init__(self, config: NpingConfig):
         super().__init__([], [])
-        failure_msg = "Can't setup Nping load generation!"
-        if not config.disable_cmd_ensure:
-            ensure_cmd_exists("ncat", failure_msg)
-            ensure_cmd_exists("nping", failure_msg)
+        # the senders' results of every host, by its address
+        self.host_results = {}  # type: Dict[str, SendersResults]
+        if self.sender_per_flow:
+            failure_msg = "Can't setup Nping load generation!"
+            if not config.disable_cmd_ensure:
+                ensure_cmd_exists("nping", failure_msg)
+            ensure_bounded_destinations(config.destination_calculator, "NPING-UDP-IMIX")
         self.config = config
+        self.log_sink = LogSink(config.log_sink)
+
+    def engine_cmd(self, mode, *args):
+        return [self.config.python_cmd, '-m', 'sdnsandbox.udp_engine', mode] + list(args)
 
     def start_receivers(self, hosts, logs_path):
-        logger.info("Adding ncat listener to all network hosts")
-        itg_recv_cmd = 'while [ 1 ]; do ' \
-                       'echo [$(date)] Starting ncat;' \
-                       'ncat -4 -l %d --keep-open --udp --sh-exec "cat > /dev/null";' \
-                       'echo [$(date)] ncat Stopped;' \
-                       'done' % self.config.listen_port
+        logger.info("Adding counting UDP engine receivers to all network hosts")
         self.receivers = []
         for host in hosts:
-            log_path = pj(logs_path, "receiver-" + host.IP() + ".log")
-            logfile = open(log_path, 'w')
-            itg_recv = host.popen(itg_recv_cmd, shell=True, stderr=STDOUT, stdout=logfile)
-            self.receivers.append(Receiver(itg_recv, logfile))
+            logfile = self.log_sink.open(pj(logs_path, "receiver-" + host.IP() + ".log"), 'receiver')
+            counts_path = pj(logs_path, "receiver-" + host.IP() + ".counts.csv")
+            receiver = host.popen(self.engine_cmd('receive', '--port', str(self.config.listen_port),
+                                                  '--counts-path', counts_path),
+                                  stderr=STDOUT, stdout=logfile)
+            logfile.close()
+            self.receivers.append(Receiver(receiver, logfile, host.IP(), counts_path))
+        RECEIVER_PROCESSES.set(len(self.receivers))
 
     def run_senders(self, hosts, logs_path):
+        """Runs every host's periods in lockstep from this single loop, in place of a process or coroutine per host.
+        Starting the senders never blocks, and the only wait is the sleep until the period's end, so an event loop
+        would have no other work to interleave. Every period's end is measured from the same start, so a late
+        period (e.g. a slow start or kill) is made up for by the next one instead of adding to the drift."""
         logger.info("Running Npings")
         host_addresses = [host.IP() for host in hosts]
-        rate_factor = 1.0
-        if self.config.rate_factor_by_hosts:
-            hosts_count = len(hosts)
-            logger.info(f"Using amount of hosts ({hosts_count}) as lowering factor")
-            rate_factor /= hosts_count
-        logger.info(f"Using rate_factor of {rate_factor} to lower load on the system")
-        host_loaders = []
-        for host_index, host in enumerate(hosts):
-           p = Process(
-                    target=self.run_host_load,
-                    args=(host, host_addresses, host_index, logs_path, rate_factor)
-           )
-           p.start()
-           host_loaders.append(p)
-
-        for host_l in host_loaders:
-            host_l.join()
-
-    def run_host_load(self, host, host_addresses, host_index, logs_path, rate_factor):
-        for period in range(self.config.periods):
-            dest = self.config.destination_calculator.calculate_destination(period, host_index, host_addresses)
-            # Shifting the period in order to achieve a load difference between network hosts
-            shifted_period = self.config.period_shifter.shift_period(period, host_index)
-            host_senders = self.run_host_senders(host, dest, logs_path, shifted_period, rate_factor)
-            self.senders.extend(host_senders)
-            success, timeout_terminated, failure = 0, 0, 0
-            for sender in self.senders:
-                time_spent = monotonic() - sender.start_time
-                time_left = self.config.period_duration_seconds - time_spent
-                if time_left > 0:
-                    sleep(time_left)
-                return_code = sender.process.poll()
-                if return_code is None:
-                    logger.debug("Sender timed out and will be killed: %s", sender.process.args)
-                    # forcibly stop senders that took too long
-                    sender.process.kill()
-                    timeout_terminated += 1
+        schedule = self.prepare_schedule(len(hosts), logs_path, self.config.schedule_path)
+        PERIODS.set(schedule.periods)
+        # all hosts run their periods in lockstep from this single loop, so their senders' results are gathered here
+        self.host_results = {host.IP(): SendersResults() for host in hosts}
+        start = monotonic()
+        for period in range(schedule.periods):
+            PERIOD.set(period)
+            hosts_senders = []
+            for host_index, host in enumerate(hosts):
+                # nping sends nothing at all at a rate of zero, the rates of flows below one are given to the others
+                flows = schedule.host_flows(period, host_index, host_addresses, min_rate=1)
+                host_senders = self.run_host_senders(host, period, flows, logs_path)
+                self.senders.extend(host_senders)
+                hosts_senders.append(host_senders)
+                SENDERS_STARTED.inc(len(host_senders))
+            SENDER_PROCESSES.set(len(self.senders))
+            # sleep until the period's end on the schedule, measured from the start so the periods do not drift
+            sleep(max(0.0, start + (period + 1) * self.config.period_duration_seconds - monotonic()))
+            self.finish_period(period, hosts, hosts_senders)
+        total = SendersResults()
+        for results in self.host_results.values():
+            total.add(results)
+        logger.info(f"All hosts had {total.success} successfully completed senders, "
+                    f"{total.timeout_terminated} senders we terminated due to timeout "
+                    f"and {total.failure} senders who finished their period in a failed state")
+
+    def finish_period(self, period, hosts, hosts_senders: List[List[Sender]]):
+        """Kills the senders still running at the period's end, and accounts for the senders of every host"""
+        timed_out = [sender for sender in self.senders if sender.process.poll() is None]
+        # all are killed before waiting for any of them, so a slow one does not hold back killing the others
+        for sender in timed_out:
+            logger.debug("Sender timed out and will be killed: %s", sender.process.args)
+            sender.process.kill()
+        for sender in timed_out:
+            sender.process.wait()
+        timed_out_pids = {sender.process.pid for sender in timed_out}
+        for host, host_senders in zip(hosts, hosts_senders):
+            results = SendersResults()
+            for sender in host_senders:
+                return_code = sender.process.returncode
+                if sender.process.pid in timed_out_pids:
+                    results.timeout_terminated += 1
                 elif return_code != 0:
-                    failure += 1
+                    logger.debug(f"Sender failed with {return_code}: {sender.process.args!r}, its last output:\n" +
+                                 '\n'.join(sender.logfile.tail()))
+                    results.failure += 1
                 else:
-                    success += 1
+                    results.success += 1
                 sender.logfile.close()
-            self.senders = []
+            self.host_results[host.IP()].add(results)
+            SENDERS_SUCCEEDED.inc(results.success)
+            SENDERS_FAILED.inc(results.failure)
+            SENDERS_TIMED_OUT.inc(results.timeout_terminated)
             logger.info(
                 f"For host={host} period={period} we had "
-                f"{success} successfully completed senders, "
-                f"{timeout_terminated} senders we terminated due to timeout "
-                f"and {failure} senders who finished the period in a failed state")
+                f"{results.success} successfully completed senders, "
+                f"{results.timeout_terminated} senders we terminated due to timeout "
+                f"and {results.failure} senders who finished the period in a failed state")
+        self.senders = []
+        SENDER_PROCESSES.set(0)
 
-    def run_host_senders(self, host, dest, logs_path, period, rate_factor):
+    def run_host_senders(self, host, period, flows: List[Tuple[str, Dict[str, float]]], logs_path):
         host_senders = []
-        send_opts = self.calculate_send_opts(period, dest, rate_factor)
-        for opts in send_opts.items():
-            nping_send_cmd = 'nping --udp -p %d -v%d ' % (self.config.listen_port, self.config.verbosity_level)
-            nping_send_cmd += opts[1]
-            log_path = pj(logs_path, "sender-" + host.IP() + "-" + opts[0] + ".log")
-            logfile = open(log_path, 'a')
-            nping_send = self.run_sender(host, nping_send_cmd, logfile)
-            host_senders.append(Sender(host, nping_send, monotonic(), logfile))
+        for dest, rates in flows:
+            send_opts = self.calculate_send_opts(dest, rates)
+            for opts in send_opts.items():
+                nping_send_cmd = 'nping --udp -p %d -v%d ' % (self.config.listen_port, self.config.verbosity_level)
+                nping_send_cmd += opts[1]
+                # the achieved rate is parsed from the sender's summary as its output streams in
+                stats = NpingStats(self.rate_recorder, host.IP(), period, opts[0], int(rates[opts[0]]),
+                                   self.config.period_duration_seconds)
+                logfile = self.log_sink.open(pj(logs_path, "sender-" + host.IP() + ".log"), opts[0], stats)
+                nping_send = self.run_sender(host, nping_send_cmd, logfile)
+                host_senders.append(Sender(host, nping_send, monotonic(), logfile))
         return host_senders
 
     @staticmethod
@@ -422,58 +773,362 @@ class NpingUDPImixLoadGenerator(LoadGenerator):
         logfile.write(str(datetime.now()) + ": Starting Nping with cmd='" + str(nping_send_cmd) + "'\n")
         logfile.flush()
         nping_send = host.popen(nping_send_cmd, stderr=STDOUT, stdout=logfile)
+        logfile.close()
         return nping_send
 
-    def calculate_send_opts(self, period, dest, rate_factor):
-        send_opts = {}
-        # 2pi is the regular wavelength of sine, so we divide it by the required wavelength to get the amplitude change
-        period_pps = self.config.pps_base_level + int(
-            self.config.pps_amplitude * sin(2 * pi * period / self.config.pps_wavelength))
+    def create_schedule(self, hosts_count):
+        periods = np.arange(self.config.periods)[:, None]
+        host_indices = np.arange(hosts_count)[None, :]
+        # Shifting the periods in order to achieve a load difference between network hosts
+        shifted_periods = np.broadcast_to(self.config.period_shifter.shift_period(periods, host_indices),
+                                          (self.config.periods, hosts_count))
+        periods_pps = calculate_periods_pps(shifted_periods, self.config.pps_base_level, self.config.pps_amplitude,
+                                            self.config.pps_wavelength) * self.calculate_rate_factor(hosts_count)
+        rates = self.calculate_rates(periods_pps)
+        shares = self.config.destination_calculator.calculate_shares(self.config.periods, hosts_count)
+        return LoadSchedule(list(rates), np.stack(list(rates.values()), axis=-1), shares,
+                            self.config.period_duration_seconds)
+
+    def use_topology(self, switches, switch_links):
+        self.config.destination_calculator.use_topology(switches, switch_links)
+
+    def calculate_rate_factor(self, hosts_count):
+        rate_factor = 1.0
+        if self.config.rate_factor_by_hosts:
+            logger.info(f"Using amount of hosts ({hosts_count}) as lowering factor")
+            rate_factor /= hosts_count
         min_split = 0.55 * 0.25  # normal quarter
         min_pps = self.config.pps_base_level - self.config.pps_amplitude
         min_rate_factor = self.config.min_allowed_rate / (min_split * min_pps)
-        if rate_factor >= min_rate_factor:
-            period_pps *= rate_factor
-        else:
-            logger.debug(f"Using minimal rate factor {min_rate_factor} instead of requested rate factor {rate_factor}" +
-                         f" to allow the minimal rate to be {self.config.min_allowed_rate}")
-            period_pps *= min_rate_factor
+        if rate_factor < min_rate_factor:
+            logger.info(f"Using minimal rate factor {min_rate_factor} instead of requested rate factor {rate_factor}" +
+                        f" to allow the minimal rate to be {self.config.min_allowed_rate}")
+            rate_factor = min_rate_factor
+        logger.info(f"Using rate_factor of {rate_factor} to lower load on the system")
+        return rate_factor
+
+    def calculate_rates(self, periods_pps) -> Dict[str, np.ndarray]:
         # All values based roughly on http://www.caida.org/research/traffic-analysis/AIX/plen_hist/
         # The IMIX split shown was ~30% 40B, ~55% normal around 576B, ~15% 1500B
         # The 190 standard deviation makes 3-sigma between 50-1400 packet sizes be 99,7%
         # To get a similar distribution with UDP:
         # Constant packet size - 40B 30%
-        rate = int(0.3 * period_pps)
-        send_opts['send_40bytes'] = '--dest-ip %s --data-length 40 --rate %d --count %d' % \
-                                    (dest,
-                                     rate,
-                                     rate * self.config.period_duration_seconds)
+        rate = np.trunc(0.3 * periods_pps)
         # Approx. of the Normal Distribution for packet sizes - 55%
-        half_normal_pps = int(0.55 * 0.5 * period_pps)
+        half_normal_pps = np.trunc(0.55 * 0.5 * periods_pps)
         quarter_normal_pps = half_normal_pps / 2
-        send_opts['send_normal_low'] = '--dest-ip %s --data-length 448 --rate %d --count %d' % \
-                                       (dest,
-                                        quarter_normal_pps,
-                                        quarter_normal_pps * self.config.period_duration_seconds)
-        send_opts['send_normal_mid'] = '--dest-ip %s --data-length 576 --rate %d --count %d' % \
-                                       (dest,
-                                        half_normal_pps,
-                                        half_normal_pps * self.config.period_duration_seconds)
-        send_opts['send_normal_high'] = '--dest-ip %s --data-length 704 --rate %d --count %d' % \
-                                        (dest,
-                                         quarter_normal_pps,
-                                         quarter_normal_pps * self.config.period_duration_seconds)
-        # Constant packet size - 1500B - 15%
-        rate /= 2
-        # Actual UDP packet payload is 1472 after removing layer2-4 headers/footers
-        send_opts['send_1500B'] = '--dest-ip %s --data-length 1472 --rate %d --count %d' % \
-                                  (dest,
-                                   rate,
-                                   rate * self.config.period_duration_seconds)
-        return send_opts
+        return {'send_40bytes': rate,
+                'send_normal_low': quarter_normal_pps,
+                'send_normal_mid': half_normal_pps,
+                'send_normal_high': quarter_normal_pps,
+                # Constant packet size - 1500B - 15%
+                # Actual UDP packet payload is 1472 after removing layer2-4 headers/footers
+                'send_1500B': rate / 2}
+
+    def calculate_send_opts(self, dest, rates: Dict[str, float]):
+        return {name: '--dest-ip %s --data-length %d --rate %d --count %d' %
+                      (dest, self.bucket_data_lengths[name], rate, rate * self.config.period_duration_seconds)
+                for name, rate in rates.items()}
+
+    def stop_receivers(self):
+        logger.info("Killing the UDP engine receivers...")
+        for receiver in self.receivers:
+            receiver.process.terminate()
+        for receiver in self.receivers:
+            # the receivers write the counts of their last second when terminated
+            receiver.process.wait()
+            receiver.logfile.close()
+        RECEIVER_PROCESSES.set(0)
+        self.log_sink.close()
+
+
+@dataclass
+class NativeUDPImixConfig(NpingConfig):
+    tick_seconds: float = 0.001
+
+
+class NativeUDPImixLoadGenerator(NpingUDPImixLoadGenerator):
+    """Nping's IMIX, sent by a single long-lived sdnsandbox.udp_engine per host instead of 5 nping processes per
+    host per period. Each period's rates are sent to the engines over their stdin, and the engines report back the
+    packets per second they achieved."""
+    # payload size to share of the packets, as in NpingUDPImixLoadGenerator.calculate_rates
+    imix_split = {40: 0.3, 448: 0.55 * 0.25, 576: 0.55 * 0.5, 704: 0.55 * 0.25, 1472: 0.15}
+    sender_per_flow = False
+
+    def __init__(self, config: NativeUDPImixConfig):
+        super().__init__(config)
+        self.config: NativeUDPImixConfig = config
+        # the reports of all periods, with each one's host and target rate
+        self.reports = []  # type: List[Dict]
+        # the line readers of the engines' reports, by the engines' pids
+        self.report_readers = {}  # type: Dict[int, LineReader]
+
+    def start_engine(self, host, logs_path) -> Sender:
+        logfile = self.log_sink.open(pj(logs_path, "sender-" + host.IP() + ".log"), 'engine')
+        logfile.write(str(datetime.now()) + ": Starting the UDP engine\n")
+        logfile.flush()
+        engine = host.popen(self.engine_cmd('send', '--tick-seconds', str(self.config.tick_seconds)),
+                            stdin=PIPE, stdout=PIPE, stderr=logfile, universal_newlines=True)
+        logfile.close()
+        SENDERS_STARTED.inc()
+        return Sender(host, engine, monotonic(), logfile)
+
+    def calculate_rates(self, periods_pps) -> Dict[str, np.ndarray]:
+        return {str(size): share * periods_pps for size, share in self.imix_split.items()}
+
+    def run_senders(self, hosts, logs_path):
+        logger.info("Running UDP engines")
+        host_addresses = [host.IP() for host in hosts]
+        schedule = self.prepare_schedule(len(hosts), logs_path, self.config.schedule_path)
+        PERIODS.set(schedule.periods)
+        self.senders = [self.start_engine(host, logs_path) for host in hosts]
+        SENDER_PROCESSES.set(len(self.senders))
+        commands = []  # type: List[Dict]
+        start = monotonic()
+        for period in range(schedule.periods):
+            PERIOD.set(period)
+            previous_commands, commands = commands, []
+            # restarted engines have no report of the previous period
+            restarted = set()
+            for host_index in range(len(self.senders)):
+                flows = schedule.host_flows(period, host_index, host_addresses)
+                commands.append({'period': period, 'port': self.config.listen_port,
+                                 'flows': [{'dest': dest, 'rates': rates} for dest, rates in flows]})
+                if self.send_command(host_index, commands[-1], logs_path):
+                    restarted.add(host_index)
+            period_end = start + (period + 1) * self.config.period_duration_seconds
+            if previous_commands:
+                # the engines report the previous period as soon as they get the next one's command
+                self.collect_reports(previous_commands, restarted, period_end)
+            # keep to the periods' schedule (measured from the start, so it does not drift), however long the
+            # commands and reports took
+            sleep(max(0.0, period_end - monotonic()))
+        for host_index in range(len(self.senders)):
+            self.send_command(host_index, {'stop': True}, logs_path, restart=False)
+        self.collect_reports(commands, set(), monotonic() + self.config.period_duration_seconds)
+        # the engines exit once they get the stop command, or are killed after a period
+        stop_deadline = monotonic() + self.config.period_duration_seconds
+        for sender in self.senders:
+            try:
+                sender.process.wait(max(0.0, stop_deadline - monotonic()))
+            except subprocess.TimeoutExpired:
+                logger.error("The UDP engine at %s did not exit when stopped, killing it", sender.host.IP())
+                sender.process.kill()
+                sender.process.wait()
+            sender.logfile.close()
+        SENDER_PROCESSES.set(0)
+        self.senders = []
+        self.report_readers = {}
+
+    def send_command(self, host_index, command, logs_path, restart=True) -> bool:
+        """Sends the command to the host's engine, returning whether the engine had to be restarted for that"""
+        sender = self.senders[host_index]
+        try:
+            sender.process.stdin.write(json.dumps(command) + '\n')
+            sender.process.stdin.flush()
+            return False
+        except (BrokenPipeError, ValueError):
+            logger.error("The UDP engine at %s exited with %s, its last output:\n%s", sender.host.IP(),
+                         sender.process.poll(), '\n'.join(sender.logfile.tail()))
+            SENDERS_FAILED.inc()
+            if not restart:
+                return False
+            sender.logfile.close()
+            self.senders[host_index] = self.start_engine(sender.host, logs_path)
+            SENDERS_RERUN.inc()
+            self.send_command(host_index, command, logs_path, restart=False)
+            return True
+
+    def record_rates(self, host: str, report: Optional[Dict], command: Dict):
+        """Records the rates the engine achieved by its report, unknown when it did not report"""
+        for size in map(str, self.imix_split):
+            target_pps = sum(flow['rates'].get(size, 0.0) for flow in command['flows'])
+            if report is None:
+                self.rate_recorder.record(host, command['period'], size, target_pps, math.nan, math.nan)
+                continue
+            sent = report['sent'].get(size, 0)
+            self.rate_recorder.record(host, report['period'], size, target_pps,
+                                      sent / report['seconds'] if report['seconds'] > 0 else 0.0, sent * int(size))
+
+    def collect_reports(self, commands: List[Dict], skipped_hosts, deadline: float):
+        """Reads the engines' reports of the commands' period as they are written, until the deadline, taking the
+        engines that did not report by then as failed"""
+        reports = {}  # type: Dict[int, Dict]
+        with selectors.DefaultSelector() as selector:
+            for host_index, sender in enumerate(self.senders):
+                # the engines are always started with their stdout piped
+                stdout = sender.process.stdout
+                assert stdout is not None
+                if host_index in skipped_hosts or stdout.closed:
+                    continue
+                if sender.process.pid not in self.report_readers:
+                    self.report_readers[sender.process.pid] = LineReader(stdout.fileno())
+                reader = self.report_readers[sender.process.pid]
+                if not reader.closed:
+                    selector.register(reader.fd, selectors.EVENT_READ, (host_index, reader))
+            while selector.get_map():
+                time_left = deadline - monotonic()
+                if time_left <= 0:
+                    break
+                for key, _ in selector.select(time_left):
+                    host_index, reader = key.data
+                    for line in reader.read_lines():
+                        report = json.loads(line)
+                        if report['period'] != commands[host_index]['period']:
+                            logger.warning("Dropping the late report of period=%d from the UDP engine at %s",
+                                           report['period'], self.senders[host_index].host.IP())
+                            continue
+                        reports[host_index] = report
+                    if host_index in reports or reader.closed:
+                        selector.unregister(reader.fd)
+        target_pps, achieved_pps = 0.0, 0.0
+        for host_index, (sender, command) in enumerate(zip(self.senders, commands)):
+            if host_index in skipped_hosts:
+                continue
+            report = reports.get(host_index)
+            self.record_rates(sender.host.IP(), report, command)
+            if report is None:
+                logger.error("No report from the UDP engine at %s for period=%d", sender.host.IP(), command['period'])
+                SENDERS_FAILED.inc()
+                continue
+            report['host'] = sender.host.IP()
+            report['target_pps'] = sum(sum(flow['rates'].values()) for flow in command['flows'])
+            self.reports.append(report)
+            target_pps += report['target_pps']
+            achieved_pps += report['pps']
+            SENDERS_SUCCEEDED.inc()
+        logger.info("For period=%d the UDP engines sent %.1f pps out of the targeted %.1f pps",
+                    commands[0]['period'], achieved_pps, target_pps)
+
+
+@dataclass
+class TraceReplayConfig:
+    # a trace of packed sdnsandbox.trace_replay.TRACE_DTYPE records
+    trace_path: str
+    # how much faster than the trace to replay it
+    speed: float = 1.0
+    listen_port: int = 10000
+    chunk_records: int = 65536
+    # time for all replayers to start up before the replay starts together
+    startup_seconds: float = 1.0
+    # time the replayers get past the end of the trace before those still replaying are killed
+    overrun_seconds: float = 10.0
+    # the interpreter running sdnsandbox.trace_replay and sdnsandbox.udp_engine on the hosts
+    python_cmd: str = sys.executable
+    log_sink: LogSinkConfig = field(default_factory=LogSinkConfig)
+
+
+class TraceReplayLoadGenerator(LoadGenerator):
+    """Replays a packet trace with a sdnsandbox.trace_replay process per host, which memory-maps the trace and sends
+    its host's packets at their times. The replayers report every second how late they were sending."""
+
+    def __init__(self, config: TraceReplayConfig):
+        super().__init__([], [])
+        self.config = config
+        self.log_sink = LogSink(config.log_sink)
+        # the replayers' reports of every second, with each one's host
+        self.reports = []  # type: List[Dict]
+
+    def start_receivers(self, hosts, logs_path):
+        logger.info("Adding counting UDP engine receivers to all network hosts")
+        self.receivers = []
+        for host in hosts:
+            logfile = self.log_sink.open(pj(logs_path, "receiver-" + host.IP() + ".log"), 'receiver')
+            counts_path = pj(logs_path, "receiver-" + host.IP() + ".counts.csv")
+            receiver = host.popen([self.config.python_cmd, '-m', 'sdnsandbox.udp_engine', 'receive',
+                                   '--port', str(self.config.listen_port), '--counts-path', counts_path],
+                                  stderr=STDOUT, stdout=logfile)
+            logfile.close()
+            self.receivers.append(Receiver(receiver, logfile, host.IP(), counts_path))
+        RECEIVER_PROCESSES.set(len(self.receivers))
+
+    def replay_cmd(self, host_index, host_addresses, start_at, trace_path):
+        return [self.config.python_cmd, '-m', 'sdnsandbox.trace_replay', 'replay',
+                '--trace', trace_path,
+                '--host-index', str(host_index),
+                '--port', str(self.config.listen_port),
+                '--speed', str(self.config.speed),
+                '--chunk-records', str(self.config.chunk_records),
+                '--start-at', repr(start_at)] + host_addresses
+
+    def run_senders(self, hosts, logs_path):
+        trace = open_trace(self.config.trace_path)
+        if not len(trace):
+            raise ValueError("The trace %s to replay has no records" % self.config.trace_path)
+        replay_seconds = float(trace['time_ns'][-1]) / 1e9 / self.config.speed
+        logger.info("Replaying %d trace records over %.1f seconds on %d hosts", len(trace), replay_seconds, len(hosts))
+        del trace
+        host_addresses = [host.IP() for host in hosts]
+        # each replayer reads just its own host's records, rather than all of them scanning the whole trace
+        host_trace_paths = prepare_host_traces(self.config.trace_path, len(hosts))
+        # the monotonic clock is shared by all the hosts' processes
+        start_at = monotonic() + self.config.startup_seconds
+        self.senders = []
+        for host_index, host in enumerate(hosts):
+            logfile = self.log_sink.open(pj(logs_path, "sender-" + host.IP() + ".log"), 'replayer')
+            replayer = host.popen(self.replay_cmd(host_index, host_addresses, start_at, host_trace_paths[host_index]),
+                                  stdout=PIPE, stderr=logfile)
+            logfile.close()
+            self.senders.append(Sender(host, replayer, monotonic(), logfile))
+        SENDERS_STARTED.inc(len(self.senders))
+        SENDER_PROCESSES.set(len(self.senders))
+        self.collect_reports(start_at + replay_seconds + self.config.overrun_seconds)
+        for sender in self.senders:
+            if sender.process.wait() == 0:
+                SENDERS_SUCCEEDED.inc()
+            else:
+                logger.error("The replayer at %s exited with %d, its last output:\n%s", sender.host.IP(),
+                             sender.process.returncode, '\n'.join(sender.logfile.tail()))
+                SENDERS_FAILED.inc()
+            sender.logfile.close()
+        SENDER_PROCESSES.set(0)
+        self.senders = []
+
+    def collect_reports(self, deadline: float):
+        """Reads the replayers' reports as they are written, until all of them are done or the deadline passed,
+        killing those still replaying then"""
+        with selectors.DefaultSelector() as selector:
+            for sender in self.senders:
+                # the replayers are always started with their stdout piped
+                stdout = sender.process.stdout
+                assert stdout is not None
+                reader = LineReader(stdout.fileno())
+                selector.register(reader.fd, selectors.EVENT_READ, (sender, stdout, reader))
+            while selector.get_map():
+                time_left = deadline - monotonic()
+                if time_left <= 0:
+                    for key in list(selector.get_map().values()):
+                        sender, pipe, reader = key.data
+                        logger.error("The replayer at %s is still replaying past the end of the trace, killing it",
+                                     sender.host.IP())
+                        sender.process.kill()
+                        selector.unregister(reader.fd)
+                        pipe.close()
+                    break
+                for key, _ in selector.select(time_left):
+                    sender, pipe, reader = key.data
+                    for line in reader.read_lines():
+                        report = json.loads(line)
+                        report['host'] = sender.host.IP()
+                        self.reports.append(report)
+                        REPLAY_LAG.set(report['host'], report['max_lag'])
+                        logger.debug("Replay second %d at %s: sent %d packets, lagging %.4f seconds at most",
+                                     report['second'], report['host'], report['sent'], report['max_lag'])
+                    if reader.closed:
+                        selector.unregister(reader.fd)
+                        pipe.close()
+        if self.reports:
+            logger.info("Replayed %d packets (%d send errors), lagging %.4f seconds at most",
+                        sum(report['sent'] for report in self.reports),
+                        sum(report['errors'] for report in self.reports),
+                        max(report['max_lag'] for report in self.reports))
 
     def stop_receivers(self):
-        logger.info("Killing ncat(s)...")
+        logger.info("Killing the UDP engine receivers...")
         for receiver in self.receivers:
             receiver.process.terminate()
+        for receiver in self.receivers:
+            receiver.process.wait()
             receiver.logfile.close()
+        RECEIVER_PROCESSES.set(0)
+        self.log_sink.close()
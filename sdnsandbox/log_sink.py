@@ -0,0 +1,265 @@
+"""Collects the output of the load generators' senders and receivers into compressed, rotated per-host log files.
+
+Every child process gets a pipe of its own (a LogStream), and a single background thread multiplexes all of them
+with a selector, writing each line prefixed by its stream's label (e.g. the IMIX bucket of a sender) to the stream's
+log file. The files are gzip compressed and rotated by their uncompressed size, like logging's RotatingFileHandler:
+sender-10.0.0.1.log.gz is the current file, sender-10.0.0.1.log.1.gz the previous one and so on. The last lines of
+every stream are kept in memory, to tell why a child crashed.
+"""
+import gzip
+import logging
+import os
+import resource
+import selectors
+from collections import deque
+from dataclasses import dataclass
+from threading import Thread, Lock
+from time import monotonic
+from typing import Dict, List, Optional, Deque, Any
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LogSinkConfig:
+    # the uncompressed bytes written to a log file before it is rotated
+    max_bytes: int = 64 * 1024 * 1024
+    # the rotated files kept of every log, older ones are deleted
+    backup_count: int = 10
+    compress_level: int = 6
+    # the last lines of every stream kept in memory
+    tail_lines: int = 20
+    # how often the log files are flushed, so they can be read during the run
+    flush_seconds: float = 10.0
+
+
+class RotatingGzipFile(object):
+    """A gzip compressed log file, rotated when the uncompressed bytes written to it reach max_bytes"""
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int, compress_level: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress_level = compress_level
+        self.file: Optional[gzip.GzipFile] = None
+        self.size = 0
+
+    def rotated_path(self, index: int) -> str:
+        return '%s.%d.gz' % (self.path, index) if index else self.path + '.gz'
+
+    def write(self, data: bytes):
+        if self.file is not None and self.size and self.size + len(data) > self.max_bytes:
+            self.rotate()
+        if self.file is None:
+            # appending adds a gzip member, which is read as the continuation of the file
+            self.file = gzip.open(self.rotated_path(0), 'ab', compresslevel=self.compress_level)
+        self.file.write(data)
+        self.size += len(data)
+
+    def rotate(self):
+        self.close()
+        for index in range(self.backup_count, 0, -1):
+            if os.path.exists(self.rotated_path(index - 1)):
+                os.replace(self.rotated_path(index - 1), self.rotated_path(index))
+        if self.backup_count == 0:
+            os.remove(self.rotated_path(0))
+        self.size = 0
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class LogStream(object):
+    """The pipe of a single child's output, passed as its stdout or stderr. Like a log file, it can be written to
+    (e.g. a header before starting a child), and it is closed as soon as the children using it were started:
+    the write end then stays open in the children alone, so it does not pile up in this process and the stream
+    ends when they exit."""
+
+    def __init__(self, path: str, name: str, tail_lines: int, listener: Any = None):
+        self.path = path
+        self.name = name
+        # fed every line as it is read, with feed_line(line), and told when the stream ended, with finish()
+        self.listener = listener
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+        self.prefix = ('[%s] ' % name).encode('utf-8')
+        self.buffer = b''
+        self.finished = False
+        self.lines: Deque[str] = deque(maxlen=tail_lines)
+        self.lock = Lock()
+
+    def fileno(self) -> int:
+        return self.write_fd
+
+    def write(self, text: str):
+        os.write(self.write_fd, text.encode('utf-8'))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+            self.write_fd = None
+
+    @property
+    def closed(self) -> bool:
+        return self.write_fd is None
+
+    def tail(self) -> List[str]:
+        """The last lines read from the stream"""
+        with self.lock:
+            return list(self.lines)
+
+    def take_lines(self, data: bytes, eof: bool = False) -> bytes:
+        """The prefixed lines of data read from the stream, holding on to an unfinished last line until EOF"""
+        lines = (self.buffer + data).split(b'\n')
+        self.buffer = b'' if eof else lines.pop()
+        lines = [line for line in lines if line]
+        decoded_lines = [line.decode('utf-8', 'replace') for line in lines]
+        with self.lock:
+            self.lines.extend(decoded_lines)
+        if self.listener is not None:
+            try:
+                for line in decoded_lines:
+                    self.listener.feed_line(line)
+            except Exception:
+                # a listener must not stop the output of every other stream from being written
+                logger.exception("Failed handling the output of %s", self.name)
+        return b''.join(self.prefix + line + b'\n' for line in lines)
+
+
+def raise_open_files_limit():
+    """Raises the soft limit of open files to the hard one, as the read end of every stream stays open until its
+    children exit, e.g. for all senders of a period"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    # an unlimited hard limit can't be set as the soft one, the kernel still caps it
+    if soft == hard or hard == resource.RLIM_INFINITY:
+        return
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        logger.warning("Failed raising the limit of open files from %d to %d, the log sink may run out of them",
+                       soft, hard)
+        return
+    logger.debug("Raised the limit of open files from %d to %d", soft, hard)
+
+
+class LogSink(object):
+    """Writes the output of many children to their log files, from a single background thread"""
+
+    def __init__(self, config: Optional[LogSinkConfig] = None):
+        self.config = config or LogSinkConfig()
+        self.lock = Lock()
+        self.thread: Optional[Thread] = None
+        self.pending: List[LogStream] = []
+        self.closing = False
+        self.wakeup_read, self.wakeup_write = None, None  # type: Optional[int], Optional[int]
+        self.files: Dict[str, RotatingGzipFile] = {}
+
+    def open(self, path: str, name: str, listener: Any = None) -> LogStream:
+        """A new stream of the log file at path (without the .gz), its lines labeled by name
+        (and given to the listener as they are read)"""
+        stream = LogStream(path, name, self.config.tail_lines, listener)
+        with self.lock:
+            if self.thread is None:
+                raise_open_files_limit()
+                self.wakeup_read, self.wakeup_write = os.pipe()
+                os.set_blocking(self.wakeup_read, False)
+                self.closing = False
+                self.thread = Thread(target=self.run, name="log-sink", daemon=True)
+                self.thread.start()
+            self.pending.append(stream)
+            self.wakeup()
+        return stream
+
+    def wakeup(self):
+        os.write(self.wakeup_write, b'\0')
+
+    def close(self):
+        """Writes what the streams have already output, and closes the log files"""
+        with self.lock:
+            thread = self.thread
+            if thread is None:
+                return
+            self.closing = True
+            self.wakeup()
+        thread.join()
+        with self.lock:
+            self.thread = None
+            os.close(self.wakeup_read)
+            os.close(self.wakeup_write)
+
+    def run(self):
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.wakeup_read, selectors.EVENT_READ)
+            next_flush = monotonic() + self.config.flush_seconds
+            while True:
+                for key, _ in selector.select(max(0.0, next_flush - monotonic())):
+                    if key.data is None:
+                        os.read(self.wakeup_read, 4096)
+                    else:
+                        self.read(selector, key.data)
+                with self.lock:
+                    pending, self.pending = self.pending, []
+                    closing = self.closing
+                for stream in pending:
+                    selector.register(stream.read_fd, selectors.EVENT_READ, stream)
+                if closing:
+                    break
+                if monotonic() >= next_flush:
+                    for log_file in self.files.values():
+                        log_file.flush()
+                    next_flush = monotonic() + self.config.flush_seconds
+            # whatever the children already output, without waiting for them to exit
+            for key in list(selector.get_map().values()):
+                if key.data is not None:
+                    while self.read(selector, key.data):
+                        pass
+                    if not key.data.finished:
+                        self.finish(selector, key.data)
+        for log_file in self.files.values():
+            log_file.close()
+        self.files = {}
+
+    def read(self, selector: selectors.BaseSelector, stream: LogStream) -> bool:
+        """Writes the lines read from the stream to its log file, returning whether there may be more to read"""
+        try:
+            data = os.read(stream.read_fd, 65536)
+        except BlockingIOError:
+            return False
+        if data:
+            self.write(stream, stream.take_lines(data))
+            return True
+        self.finish(selector, stream)
+        return False
+
+    def finish(self, selector: selectors.BaseSelector, stream: LogStream):
+        self.write(stream, stream.take_lines(b'', eof=True))
+        selector.unregister(stream.read_fd)
+        os.close(stream.read_fd)
+        stream.finished = True
+        if stream.listener is not None:
+            try:
+                stream.listener.finish()
+            except Exception:
+                logger.exception("Failed handling the end of the output of %s", stream.name)
+
+    def write(self, stream: LogStream, data: bytes):
+        if not data:
+            return
+        log_file = self.files.get(stream.path)
+        if log_file is None:
+            log_file = RotatingGzipFile(stream.path, self.config.max_bytes, self.config.backup_count,
+                                        self.config.compress_level)
+            self.files[stream.path] = log_file
+        try:
+            log_file.write(data)
+        except OSError:
+            logger.exception("Failed writing the log %s", stream.path)
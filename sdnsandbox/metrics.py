@@ -0,0 +1,171 @@
+import logging
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from multiprocessing import Value
+from multiprocessing.sharedctypes import Synchronized
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple, cast
+
+logger = logging.getLogger(__name__)
+
+
+class Counter(object):
+    """A monotonic counter. Its value lives in shared memory, so updates from forked processes are counted too."""
+    metric_type = 'counter'
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.value = cast('Synchronized[float]', Value('d', 0.0))
+
+    def inc(self, amount: float = 1):
+        with self.value.get_lock():
+            self.value.value += amount
+
+    def get(self) -> float:
+        return self.value.value
+
+    def samples(self) -> List[Tuple[str, float]]:
+        return [(self.name, self.get())]
+
+
+class Gauge(Counter):
+    """A value that can go up and down, shared with forked processes like a Counter"""
+    metric_type = 'gauge'
+
+    def set(self, value: float):
+        self.value.value = value
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+
+class LabeledGauge(object):
+    """Gauges by a single label (e.g. per interface), only for updates from the process that created them"""
+    metric_type = 'gauge'
+
+    def __init__(self, name: str, description: str, label: str):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.values: Dict[str, float] = {}
+        self.lock = Lock()
+
+    def set(self, label_value: str, value: float):
+        with self.lock:
+            self.values[label_value] = value
+
+    def set_many(self, values: Dict[str, float]):
+        with self.lock:
+            self.values.update(values)
+
+    def samples(self) -> List[Tuple[str, float]]:
+        with self.lock:
+            values = dict(self.values)
+        return [('%s{%s="%s"}' % (self.name, self.label, escape_label_value(str(label_value))), value)
+                for label_value, value in sorted(values.items())]
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value: float) -> str:
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self.metrics: List = []
+        self.lock = Lock()
+
+    def register(self, metric):
+        """Registers the metric, or returns the one already registered by its name (e.g. when its module is
+        imported again), as long as that one is of the same kind"""
+        with self.lock:
+            for registered in self.metrics:
+                if registered.name != metric.name:
+                    continue
+                if type(registered) is not type(metric) or \
+                        getattr(registered, 'label', None) != getattr(metric, 'label', None):
+                    raise ValueError("Metric %s is already registered as a different %s" %
+                                     (metric.name, registered.metric_type))
+                return registered
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self.register(Counter(name, description))
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        return self.register(Gauge(name, description))
+
+    def labeled_gauge(self, name: str, description: str, label: str) -> LabeledGauge:
+        return self.register(LabeledGauge(name, description, label))
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.description))
+            lines.append('# TYPE %s %s' % (metric.name, metric.metric_type))
+            for sample_name, value in metric.samples():
+                lines.append('%s %s' % (sample_name, format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+# the registry all of SDNSandbox's metrics are created in, at import time (before any process is forked)
+REGISTRY = MetricsRegistry()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer(object):
+    """Serves a registry's metrics over HTTP (at any path) from a background thread"""
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: str = '127.0.0.1', port: int = 9100):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.httpd: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[Thread] = None
+
+    def start(self):
+        registry = self.registry
+        content_type = self.content_type
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("Metrics request from %s: " + format, self.address_string(), *args)
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self.port = self.httpd.server_address[1]
+        self.thread = Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+        logger.info("Serving live metrics at http://%s:%d/metrics", self.host, self.port)
+
+    def stop(self):
+        if self.httpd is not None:
+            logger.info("Stopping the live metrics server")
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.thread.join()
+            self.httpd = None
+            self.thread = None
@@ -1,20 +1,44 @@
 from abc import ABC, abstractmethod
+import asyncio
 import logging
-from dataclasses import dataclass
-from typing import Dict, Optional
+import re
+import struct
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from io import StringIO
+from threading import Thread, Event
+from typing import Dict, Optional, List, IO, Iterable, Callable
 
 import dacite
+import numpy as np
 import pandas as pd
 from numpy import datetime64
 
+from sdnsandbox.archive import RawSamplesWriter, RawSamplesReader
+from sdnsandbox.metrics import REGISTRY
+from sdnsandbox.stats import OnlineStatistics, OnlineStatisticsRecorder
+from sdnsandbox.store import open_samples_store, append_samples, finish_samples, StoredSamples, Samples
 from sdnsandbox.util import run_script, ensure_cmd_exists
-from subprocess import Popen, STDOUT
-from os.path import join as pj
-from os import remove
+from subprocess import Popen, PIPE
+from os.path import join as pj, isfile
+from os import remove, listdir, open as os_open, close as os_close, pread, O_RDONLY
 
 
 logger = logging.getLogger(__name__)
 
+INTERFACE_SAMPLE = REGISTRY.labeled_gauge('sdnsandbox_interface_sample',
+                                          'The latest saved (normalized) sample of each monitored interface',
+                                          'interface')
+LAST_SAMPLE_TIME = REGISTRY.gauge('sdnsandbox_last_sample_timestamp_seconds',
+                                  'The unix time of the latest saved monitoring sample')
+
+
+def record_latest_samples(rows: pd.DataFrame):
+    latest = rows.iloc[-1].dropna()
+    INTERFACE_SAMPLE.set_many({str(port): float(value) for port, value in latest.items()})
+    LAST_SAMPLE_TIME.set(rows.index[-1].value / 1e9)
+
 
 class MonitorFactory(object):
     @staticmethod
@@ -22,29 +46,96 @@ class MonitorFactory(object):
         if monitor_conf["type"] == "sflow":
             config = dacite.from_dict(data_class=SFlowConfig, data=monitor_conf)
             return SFlowMonitor(config)
+        elif monitor_conf["type"] == "sflow-native":
+            config = dacite.from_dict(data_class=SFlowNativeConfig, data=monitor_conf)
+            return SFlowNativeMonitor(config)
+        elif monitor_conf["type"] == "sysfs":
+            config = dacite.from_dict(data_class=SysfsConfig, data=monitor_conf)
+            return SysfsMonitor(config)
         else:
             raise ValueError("Unknown monitor type=%s" % monitor_conf["type"])
 
 
 class Monitor(ABC):
     @abstractmethod
-    def start_monitoring(self, output_path: str):
+    def start_monitoring(self, output_path: str, interfaces_naming: Dict[int, str]):
         pass
 
     @abstractmethod
-    def process_monitoring_data(self, interfaces_naming: Dict[int, str]) -> Optional[pd.DataFrame]:
+    def process_monitoring_data(self, interfaces_naming: Dict[int, str]) -> Optional[Samples]:
+        """The samples, in memory or left in the store they were saved to during the run"""
         pass
 
 
+def log_stderr(process: Popen, name: str) -> Thread:
+    """Logs the lines the process writes to its stderr (opened as a text pipe), keeping them out of its output"""
+    def run():
+        for line in process.stderr:
+            if line.strip():
+                logger.warning("%s: %s", name, line.rstrip())
+    thread = Thread(target=run, name=name + "-stderr", daemon=True)
+    thread.start()
+    return thread
+
+
+# the generic interface counters of sFlow v5 and their struct formats (https://sflow.org/sflow_version_5.txt)
+GENERIC_INTERFACE_COUNTERS = [('ifIndex', 'I'), ('ifType', 'I'), ('ifSpeed', 'Q'), ('ifDirection', 'I'),
+                              ('ifStatus', 'I'), ('ifInOctets', 'Q'), ('ifInUcastPkts', 'I'),
+                              ('ifInMulticastPkts', 'I'), ('ifInBroadcastPkts', 'I'), ('ifInDiscards', 'I'),
+                              ('ifInErrors', 'I'), ('ifInUnknownProtos', 'I'), ('ifOutOctets', 'Q'),
+                              ('ifOutUcastPkts', 'I'), ('ifOutMulticastPkts', 'I'), ('ifOutBroadcastPkts', 'I'),
+                              ('ifOutDiscards', 'I'), ('ifOutErrors', 'I'), ('ifPromiscuousMode', 'I')]
+# needed for correcting counter wraps, counters not listed are assumed to never wrap
+SFLOW_COUNTER_BITS = {name: 32 if fmt == 'I' else 64 for name, fmt in GENERIC_INTERFACE_COUNTERS}
+
+
+def get_data_keys(data_key: str, data_keys: Optional[List[str]]) -> List[str]:
+    return [data_key] if data_keys is None else list(data_keys)
+
+
+def get_normalize_by(data_keys: List[str], normalize_by: Optional[float], normalize_by_key: Dict[str, float]):
+    """A single normalization factor for a single counter, or a factor per counter for multiple ones"""
+    if len(data_keys) == 1:
+        return normalize_by_key.get(data_keys[0], normalize_by)
+    return [normalize_by_key.get(key, normalize_by) or 1.0 for key in data_keys]
+
+
 @dataclass
 class SFlowConfig:
     data_key: str = 'ifInOctets'
+    # several counters monitored at once, overriding data_key (numpy engine without streaming only)
+    data_keys: Optional[List[str]] = None
     normalize_by: float = 125000.0
+    normalize_by_key: Dict[str, float] = field(default_factory=dict)
     is_cumulative_data: bool = True
     csv_filename: str = 'sflow.csv'
     pandas_processing: bool = True
+    # one of "python", "pandas" or "numpy", overriding pandas_processing when given
+    engine: Optional[str] = None
+    numpy_block_bytes: int = 1 << 24
     sflowtool_cmd: str = "sflowtool"
     delete_csv: bool = True
+    # streaming mode parses the collector output during the run instead of after it, appending the samples to a
+    # compressed table a chunk at a time (so a crash keeps what was already written) - on by default, unless several
+    # counters are monitored
+    streaming: Optional[bool] = None
+    stream_chunk_lines: int = 100000
+    stream_hold_back_seconds: int = 2
+    # the streamed samples are handed on to saving and post processing in this store, read a chunk at a time
+    # where possible, and the runner deletes it once it saved its own copy of them - deleting it here instead reads
+    # them all into memory first
+    stream_hd5_filename: str = 'sflow_stream.hd5'
+    stream_hd5_key: str = 'sflow_samples'
+    delete_stream_hd5: bool = False
+    stream_hd5_complevel: int = 5
+    stream_hd5_complib: str = 'blosc:zstd'
+    # when set, the raw samples are also kept in a time partitioned binary archive (streaming mode only)
+    raw_archive_dirname: Optional[str] = None
+    raw_archive_partition_seconds: int = 3600
+    # when set, running statistics of the samples are snapshotted to this file during the run (streaming mode only)
+    online_stats_filename: Optional[str] = None
+    online_stats_interval_seconds: float = 60
+    online_stats_relative_accuracy: float = 0.01
 
 
 class SFlowMonitor(Monitor):
@@ -54,38 +145,112 @@ class SFlowMonitor(Monitor):
 
     def __init__(self, config: SFlowConfig):
         ensure_cmd_exists(cmd=config.sflowtool_cmd, doesnt_exist_meaning="Can't setup sFlow monitoring!")
-        self.sflow_keys_to_monitor = [self.sflow_time_key, self.sflow_intf_index_key, config.data_key]
+        data_keys = get_data_keys(config.data_key, config.data_keys)
+        # whether the samples are streamed, by the config or else by default
+        self.streaming = len(data_keys) == 1 if config.streaming is None else config.streaming
+        if config.raw_archive_dirname is not None and not self.streaming:
+            raise ValueError("The sFlow raw samples archive requires streaming mode")
+        if config.online_stats_filename is not None and not self.streaming:
+            raise ValueError("Online sFlow statistics require streaming mode")
+        if len(data_keys) > 1 and (self.streaming or config.engine not in [None, "numpy"]):
+            raise ValueError("Monitoring multiple sFlow counters requires the numpy engine without streaming")
+        if len(data_keys) > 1 and config.engine is None:
+            config.engine = "numpy"
+        self.sflow_keys_to_monitor = [self.sflow_time_key, self.sflow_intf_index_key] + data_keys
+        self.normalize_by = get_normalize_by(data_keys, config.normalize_by, config.normalize_by_key)
         self.config = config
         self.sflowtool_proc = None
         self.output_file = None
-        self.samples_processor = self.get_samples_pandas if config.pandas_processing else self.get_samples
+        self.ingestor = None  # type: Optional[SFlowStreamIngestor]
+        self.stats_recorder = None  # type: Optional[OnlineStatisticsRecorder]
+        self.samples_processor = self.get_samples_processor(config)
 
-    def start_monitoring(self, output_path):
+    def get_samples_processor(self, config: SFlowConfig):
+        engine = config.engine
+        if engine is None:
+            engine = "pandas" if config.pandas_processing else "python"
+        if engine == "pandas":
+            return self.get_samples_pandas
+        elif engine == "python":
+            return self.get_samples
+        elif engine == "numpy":
+            return partial(self.get_samples_numpy, block_bytes=config.numpy_block_bytes)
+        else:
+            raise ValueError("Unknown sFlow processing engine=%s" % engine)
+
+    def start_monitoring(self, output_path, interfaces_naming):
         if self.sflowtool_proc is None:
             logger.info("Starting sFlow monitoring")
             logger.info("Creating sFlow monitoring instances in the ovs switches")
             run_script("set_ovs_sflow.sh", logger.info, logger.error)
-            self.output_file = open(pj(output_path, self.config.csv_filename), 'a+')
-            logger.info("Starting %s to record monitoring data to: %s" % (self.config.sflowtool_cmd,
-                                                                          self.output_file.name))
             keys = ','.join(self.sflow_keys_to_monitor)
-            self.sflowtool_proc = Popen([self.config.sflowtool_cmd, "-k", "-L", keys],
-                                        stderr=STDOUT, stdout=self.output_file)
+            sflowtool_args = [self.config.sflowtool_cmd, "-k", "-L", keys]
+            if self.streaming:
+                self.start_streaming(sflowtool_args, output_path, interfaces_naming)
+            else:
+                self.output_file = open(pj(output_path, self.config.csv_filename), 'a+')
+                logger.info("Starting %s to record monitoring data to: %s" % (self.config.sflowtool_cmd,
+                                                                              self.output_file.name))
+                self.sflowtool_proc = Popen(sflowtool_args, stderr=PIPE, stdout=self.output_file,
+                                            universal_newlines=True)
+                log_stderr(self.sflowtool_proc, self.config.sflowtool_cmd)
         else:
             logger.error("Monitoring is already running")
 
-    def process_monitoring_data(self, interfaces_naming: Dict[int, str]) -> Optional[pd.DataFrame]:
+    def start_streaming(self, sflowtool_args, output_path, interfaces_naming):
+        # the raw CSV is only worth writing if it is kept after processing
+        if not self.config.delete_csv:
+            self.output_file = open(pj(output_path, self.config.csv_filename), 'a+')
+        store_path = pj(output_path, self.config.stream_hd5_filename)
+        logger.info("Starting %s to stream monitoring data to: %s" % (self.config.sflowtool_cmd, store_path))
+        archive = None
+        if self.config.raw_archive_dirname is not None:
+            archive = RawSamplesWriter(pj(output_path, self.config.raw_archive_dirname),
+                                       self.config.raw_archive_partition_seconds)
+            logger.info("Keeping the raw sFlow samples in the archive at %s", archive.path)
+        # the collector's warnings are logged rather than parsed as samples
+        self.sflowtool_proc = Popen(sflowtool_args, stderr=PIPE, stdout=PIPE, universal_newlines=True)
+        log_stderr(self.sflowtool_proc, self.config.sflowtool_cmd)
+        pivoter = SFlowSamplesPivoter(self.sflow_keys_to_monitor,
+                                      interfaces_naming,
+                                      is_cumulative_data=self.config.is_cumulative_data,
+                                      normalize_by=self.normalize_by,
+                                      hold_back_seconds=self.config.stream_hold_back_seconds)
+        self.ingestor = SFlowStreamIngestor(self.sflowtool_proc.stdout,
+                                            pivoter,
+                                            store_path,
+                                            self.config.stream_hd5_key,
+                                            chunk_lines=self.config.stream_chunk_lines,
+                                            raw_file=self.output_file,
+                                            archive=archive,
+                                            complevel=self.config.stream_hd5_complevel,
+                                            complib=self.config.stream_hd5_complib)
+        if self.config.online_stats_filename is not None:
+            ports = [interfaces_naming[num] for num in sorted(interfaces_naming.keys())]
+            stats = OnlineStatistics(ports, self.config.online_stats_relative_accuracy)
+            self.stats_recorder = OnlineStatisticsRecorder(stats,
+                                                           pj(output_path, self.config.online_stats_filename),
+                                                           self.config.online_stats_interval_seconds)
+            logger.info("Snapshotting online statistics to %s", self.stats_recorder.snapshot_path)
+            self.ingestor.rows_listeners.append(self.stats_recorder)
+        # the live metrics are as fresh as the last chunk of streamed samples
+        self.ingestor.rows_listeners.append(record_latest_samples)
+        self.ingestor.start()
+
+    def process_monitoring_data(self, interfaces_naming: Dict[int, str]) -> Optional[Samples]:
         if self.sflowtool_proc is not None:
             logger.info("Stopping %s", self.config.sflowtool_cmd)
             self.sflowtool_proc.terminate()
             self.sflowtool_proc = None
+            if self.ingestor is not None:
+                return self.finish_streaming()
             logger.info("Processing sFlow samples...")
             self.output_file.seek(0)
             samples_df = self.samples_processor(self.output_file,
                                                 self.sflow_keys_to_monitor,
                                                 interfaces_naming,
                                                 is_cumulative_data=self.config.is_cumulative_data,
-                                                normalize_by=self.config.normalize_by)
+                                                normalize_by=self.normalize_by)
             self.output_file.close()
             if self.config.delete_csv:
                 logger.info("Deleting original sFlow CSV %s", self.output_file.name)
@@ -96,6 +261,30 @@ class SFlowMonitor(Monitor):
             logger.error("No monitoring currently running to stop and process")
             return None
 
+    def finish_streaming(self) -> Optional[Samples]:
+        ingestor = self.ingestor
+        assert ingestor is not None, "No sFlow stream is being ingested"
+        logger.info("Waiting for the sFlow stream ingestion to flush its last chunk...")
+        ingestor.join()
+        if ingestor.error is not None:
+            logger.error("The sFlow stream ingestion failed, keeping only the %d rows saved before: %s",
+                         ingestor.rows_written, ingestor.error)
+        if self.stats_recorder is not None:
+            self.stats_recorder.close()
+            self.stats_recorder = None
+        if self.output_file is not None:
+            self.output_file.close()
+            self.output_file = None
+        store_path = ingestor.store_path
+        samples = ingestor.stored_samples()
+        self.ingestor = None
+        if not self.config.delete_stream_hd5:
+            return samples
+        samples_df = None if samples is None else samples.read()
+        logger.info("Deleting sFlow stream store %s", store_path)
+        remove(store_path)
+        return samples_df
+
     @staticmethod
     def get_samples_pandas(file, keys, interfaces_naming: Dict[int, str], is_cumulative_data=True, normalize_by=None):
         samples_df = pd.read_csv(file, names=keys, index_col=[0, 1])
@@ -139,3 +328,588 @@ class SFlowMonitor(Monitor):
         samples_df.rename(lambda k: interfaces_naming[k], axis=1, inplace=True)
         samples_df.index = samples_df.index.map(lambda time: datetime64(time, 's'))
         return samples_df
+
+    @staticmethod
+    def get_samples_numpy(file, keys, interfaces_naming: Dict[int, str], is_cumulative_data=True, normalize_by=None,
+                          block_bytes=1 << 24):
+        blocks = []
+        leftover = ''
+        while True:
+            text = file.read(block_bytes)
+            if not text:
+                break
+            # only parse whole lines, the last partial line is carried on to the next block
+            last_newline = text.rfind('\n')
+            if last_newline == -1:
+                leftover += text
+                continue
+            blocks.append(SFlowMonitor.parse_samples_block(leftover + text[:last_newline + 1], len(keys)))
+            leftover = text[last_newline + 1:]
+        blocks.append(SFlowMonitor.parse_samples_block(leftover, len(keys)))
+        samples = np.concatenate(blocks)
+        values = samples[:, 2] if len(keys) == 3 else samples[:, 2:]
+        return pivot_samples(samples[:, 0], samples[:, 1], values, keys, interfaces_naming,
+                             is_cumulative_data=is_cumulative_data, normalize_by=normalize_by)
+
+    @staticmethod
+    def get_samples_archive(archive_path, keys, interfaces_naming: Dict[int, str], is_cumulative_data=True,
+                            normalize_by=None, start: Optional[int] = None, end: Optional[int] = None):
+        """Reprocesses the raw samples of a time window (in unix seconds) from a raw samples archive"""
+        records = RawSamplesReader(archive_path).read(start, end)
+        return pivot_samples(records['time'], records['ifIndex'], records['value'], keys, interfaces_naming,
+                             is_cumulative_data=is_cumulative_data, normalize_by=normalize_by)
+
+    @staticmethod
+    def parse_samples_block(text: str, columns: int = 3) -> np.ndarray:
+        """Parses whole lines of 'time,ifIndex,value[,value...]' into an N x columns integer array, raising a
+        ValueError on any line that is not such a sample"""
+        if not text.strip():
+            return np.empty((0, columns), dtype=np.int64)
+        try:
+            # missing values come out as NaNs, which fail the integer conversion, and extra ones fail the parsing
+            values = pd.read_csv(StringIO(text), header=None, dtype=np.int64).values
+        except ValueError as e:
+            raise ValueError("sFlow samples block has a line that is not a sample: %s" % e)
+        if values.shape[1] != columns:
+            raise ValueError("sFlow samples block has lines of %d values instead of %d" % (values.shape[1], columns))
+        return values
+
+
+class SFlowSamplesPivoter(object):
+    """Incrementally pivots chunks of (time, ifIndex, value) samples into time x port rows.
+    The samples of the latest seconds are held back, since more samples of those seconds may still arrive."""
+
+    def __init__(self, keys: List[str], interfaces_naming: Dict[int, str], is_cumulative_data=True,
+                 normalize_by=None, hold_back_seconds=2):
+        self.keys = keys
+        self.interfaces_naming = interfaces_naming
+        self.interfaces = sorted(interfaces_naming.keys())
+        self.is_cumulative_data = is_cumulative_data
+        self.normalize_by = normalize_by
+        self.hold_back_seconds = hold_back_seconds
+        self.pending = pd.DataFrame(columns=keys, dtype='int64')
+        self.last_row = None  # type: Optional[pd.DataFrame]
+        self.last_time = None
+        self.late_samples = 0
+
+    def feed(self, samples: pd.DataFrame, flush=False) -> Optional[pd.DataFrame]:
+        time_key, intf_key, _ = self.keys
+        # use data only from the relevant interfaces
+        samples = samples[samples[intf_key].isin(self.interfaces)]
+        if self.last_time is not None:
+            late = samples[time_key] <= self.last_time
+            if late.any():
+                self.late_samples += int(late.sum())
+                logger.debug("Dropping %d samples that arrived after their second was already saved", late.sum())
+                samples = samples[~late]
+        pending = pd.concat([self.pending, samples], ignore_index=True)
+        if flush:
+            ready = pending
+            self.pending = pending.iloc[0:0]
+        else:
+            cutoff = pending[time_key].max() - self.hold_back_seconds
+            is_ready = pending[time_key] <= cutoff
+            ready = pending[is_ready]
+            self.pending = pending[~is_ready]
+        return self.pivot(ready)
+
+    def flush(self) -> Optional[pd.DataFrame]:
+        return self.feed(self.pending.iloc[0:0], flush=True)
+
+    def pivot(self, ready: pd.DataFrame) -> Optional[pd.DataFrame]:
+        if ready.empty:
+            return None
+        time_key, intf_key, data_key = self.keys
+        rows = ready.drop_duplicates([time_key, intf_key], keep='last').set_index([time_key, intf_key])[data_key]
+        rows = rows.unstack().reindex(columns=self.interfaces).astype('float64').sort_index()
+        self.last_time = rows.index[-1]
+        if self.is_cumulative_data:
+            # subtract the previous row (the data is cumulative), including the last row of the previous chunk
+            previous_row = self.last_row
+            self.last_row = rows.iloc[-1:]
+            if previous_row is not None:
+                rows = pd.concat([previous_row, rows])
+            rows = rows.diff().iloc[1:]
+            if rows.empty:
+                return None
+        rows.rename(lambda k: self.interfaces_naming[k], axis=1, inplace=True)
+        rows.index = rows.index.map(lambda time: datetime64(time, 's'))
+        rows.rename_axis(time_key, inplace=True)
+        rows.rename_axis(intf_key, axis=1, inplace=True)
+        return rows if self.normalize_by is None else rows / self.normalize_by
+
+
+class SFlowStreamIngestor(Thread):
+    """Tails the sFlow collector output, appending pivoted chunks of it to a compressed HDF5 table as they arrive.
+    Only a single chunk of raw lines is held in memory at any time."""
+
+    def __init__(self, stream: Iterable[str], pivoter: SFlowSamplesPivoter, store_path: str, store_key: str,
+                 chunk_lines=100000, raw_file: Optional[IO] = None, archive: Optional[RawSamplesWriter] = None,
+                 complevel: int = 5, complib: str = 'blosc:zstd'):
+        super().__init__(name="sflow-stream-ingestor", daemon=True)
+        self.stream = stream
+        self.pivoter = pivoter
+        self.store_path = store_path
+        self.store_key = store_key
+        self.chunk_lines = chunk_lines
+        self.raw_file = raw_file
+        self.archive = archive
+        self.complevel = complevel
+        self.complib = complib
+        # called with every chunk of pivoted rows, after it was saved
+        self.rows_listeners = []  # type: List[Callable[[pd.DataFrame], None]]
+        self.rows_written = 0
+        # what stopped the ingestion, if it failed
+        self.error = None  # type: Optional[Exception]
+
+    def run(self):
+        try:
+            self.ingest_stream()
+        except Exception as error:
+            logger.exception("sFlow stream ingestion failed")
+            self.error = error
+            # keep reading the collector's output, so it does not block on a full pipe
+            for _ in self.stream:
+                pass
+
+    def ingest_stream(self):
+        with open_samples_store(self.store_path, self.complevel, self.complib) as store:
+            chunk = []  # type: List[str]
+            for line in self.stream:
+                chunk.append(line)
+                if len(chunk) >= self.chunk_lines:
+                    self.ingest(store, chunk)
+                    chunk = []
+            self.ingest(store, chunk, flush=True)
+            finish_samples(store, self.store_key)
+        if self.pivoter.late_samples:
+            logger.warning("Dropped %d sFlow samples that arrived too late to be saved", self.pivoter.late_samples)
+        logger.info("sFlow stream ingestion done, saved %d rows to %s", self.rows_written, self.store_path)
+
+    def ingest(self, store: pd.HDFStore, chunk: List[str], flush=False):
+        if self.raw_file is not None:
+            self.raw_file.writelines(chunk)
+        samples = self.parse_chunk(chunk, self.pivoter.keys)
+        if self.archive is not None and not samples.empty:
+            self.archive.append(*[samples[key].to_numpy() for key in self.pivoter.keys])
+            self.archive.flush()
+        rows = self.pivoter.feed(samples, flush=flush)
+        if rows is not None:
+            append_samples(store, self.store_key, rows)
+            store.flush()
+            self.rows_written += len(rows)
+            logger.debug("Appended %d sFlow rows to %s", len(rows), self.store_path)
+            for listener in self.rows_listeners:
+                listener(rows)
+
+    @staticmethod
+    def parse_chunk(chunk: List[str], keys: List[str]) -> pd.DataFrame:
+        if not chunk:
+            return pd.DataFrame(columns=keys, dtype='int64')
+        try:
+            return pd.read_csv(StringIO(''.join(chunk)), names=keys, dtype='int64')
+        except ValueError:
+            # parsing the chunk again, without the lines that are not samples
+            sample_pattern = re.compile(r'\d+(?:,\d+){%d}\s*$' % (len(keys) - 1))
+            samples = [line for line in chunk if sample_pattern.match(line)]
+            skipped = [line for line in chunk if line.strip() and not sample_pattern.match(line)]
+            if not skipped:
+                raise
+            logger.warning("Skipping %d sFlow lines that are not samples, the first: %r", len(skipped), skipped[0])
+            return SFlowStreamIngestor.parse_chunk(samples, keys)
+
+    def stored_samples(self) -> Optional[StoredSamples]:
+        if self.rows_written == 0:
+            logger.error("No sFlow samples were streamed to %s", self.store_path)
+            return None
+        return StoredSamples(self.store_path, self.store_key)
+
+    def read_samples(self) -> Optional[pd.DataFrame]:
+        samples = self.stored_samples()
+        if samples is None:
+            return None
+        samples_df = samples.read()
+        samples_df.rename_axis(self.pivoter.keys[0], inplace=True)
+        samples_df.rename_axis(self.pivoter.keys[1], axis=1, inplace=True)
+        return samples_df
+
+
+def pivot_samples(times: np.ndarray, intf_indexes: np.ndarray, values: np.ndarray, keys: List[str],
+                  interfaces_naming: Dict[int, str], is_cumulative_data=True, normalize_by=None) -> pd.DataFrame:
+    """Scatters (time, ifIndex, value) sample columns into a time x port frame in a single vectorized pass.
+    With several counters values is N x counters, keys hold all their names after the time and ifIndex keys,
+    and the frame's columns become (port, counter) pairs."""
+    data_keys = keys[2:]
+    values = values.reshape(len(times), len(data_keys))
+    ports = np.array(sorted(interfaces_naming.keys()), dtype=np.int64)
+    # dense column position of every ifIndex, -1 for the irrelevant interfaces
+    lookup_size = int(max(ports.max(initial=0), intf_indexes.max(initial=0))) + 1
+    lookup = np.full(lookup_size, -1, dtype=np.int64)
+    lookup[ports] = np.arange(len(ports))
+    columns = lookup[intf_indexes]
+    relevant = columns >= 0
+    columns = columns[relevant]
+    unique_times, rows = np.unique(times[relevant], return_inverse=True)
+    matrix = np.full((len(unique_times), len(ports), len(data_keys)), np.nan)
+    # on duplicate (time, ifIndex) samples the later one is kept
+    matrix[rows, columns] = values[relevant]
+    # only keep ports that were actually sampled
+    seen = np.zeros(len(ports), dtype=bool)
+    seen[columns] = True
+    matrix = matrix[:, seen]
+    if is_cumulative_data:
+        # subtract the previous row (the data is cumulative) and remove the first row which is now NaN
+        matrix = np.diff(matrix, axis=0)
+        unique_times = unique_times[1:]
+        # a negative difference of a 32 bit counter means it wrapped around
+        wrap = np.array([2.0 ** 32 if SFLOW_COUNTER_BITS.get(key) == 32 else 0.0 for key in data_keys])
+        matrix += np.where(matrix < 0, wrap, 0.0)
+    if normalize_by is not None:
+        matrix /= np.asarray(normalize_by, dtype=np.float64)
+    index = pd.Index(unique_times.astype('datetime64[s]'), name=keys[0])
+    port_names = [interfaces_naming[port] for port in ports[seen]]
+    if len(data_keys) == 1:
+        return pd.DataFrame(matrix[:, :, 0], index=index, columns=pd.Index(port_names, name=keys[1]))
+    columns_index = pd.MultiIndex.from_product([port_names, data_keys], names=[keys[1], 'counter'])
+    return pd.DataFrame(matrix.reshape(len(unique_times), -1), index=index, columns=columns_index)
+
+
+@dataclass
+class SFlowNativeConfig:
+    data_key: str = 'ifInOctets'
+    data_keys: Optional[List[str]] = None
+    normalize_by: float = 125000.0
+    normalize_by_key: Dict[str, float] = field(default_factory=dict)
+    is_cumulative_data: bool = True
+    listen_ip: str = '127.0.0.1'
+    listen_port: int = 6343
+    initial_capacity: int = 1 << 20
+
+
+class SampleColumns(object):
+    """Preallocated (time, ifIndex, values) columns, doubling their capacity when full"""
+
+    def __init__(self, capacity: int, width: int = 1):
+        self.size = 0
+        self.width = width
+        self.times = np.empty(capacity, dtype=np.int64)
+        self.intf_indexes = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty((capacity, width), dtype=np.float64)
+
+    def append(self, when: int, where: int, *what: int):
+        if self.size == len(self.times):
+            self.grow()
+        self.times[self.size] = when
+        self.intf_indexes[self.size] = where
+        self.values[self.size] = what
+        self.size += 1
+
+    def grow(self):
+        capacity = max(1, 2 * len(self.times))
+        logger.debug("Growing sample columns to %d rows", capacity)
+        for name in ['times', 'intf_indexes', 'values']:
+            column = getattr(self, name)
+            grown = np.empty((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def view(self):
+        values = self.values[:self.size]
+        return self.times[:self.size], self.intf_indexes[:self.size], values[:, 0] if self.width == 1 else values
+
+
+class SFlowV5Decoder(object):
+    """Decodes the generic interface counters out of sFlow v5 datagrams (https://sflow.org/sflow_version_5.txt)"""
+    counters_sample = 2
+    expanded_counters_sample = 4
+    generic_interface_counters = 1
+    generic_interface_counters_fields = [name for name, _ in GENERIC_INTERFACE_COUNTERS]
+    generic_interface_counters_struct = struct.Struct('>' + ''.join(fmt for _, fmt in GENERIC_INTERFACE_COUNTERS))
+
+    def __init__(self, data_keys: List[str]):
+        for data_key in data_keys:
+            if data_key not in self.generic_interface_counters_fields:
+                raise ValueError("Unknown sFlow generic interface counter=%s" % data_key)
+        # the ifIndex comes first, followed by the requested counters
+        self.fields = [0] + [self.generic_interface_counters_fields.index(data_key) for data_key in data_keys]
+
+    def decode(self, datagram: bytes) -> List[tuple]:
+        """Returns the (ifIndex, value[, value...]) tuples of all generic interface counter records in the datagram"""
+        version, address_type = struct.unpack_from('>II', datagram, 0)
+        if version != 5:
+            raise ValueError("Unsupported sFlow version=%d" % version)
+        offset = 8 + (4 if address_type == 1 else 16)
+        # skip sub agent id, sequence number and uptime
+        num_samples, = struct.unpack_from('>I', datagram, offset + 12)
+        offset += 16
+        counters = []
+        for _ in range(num_samples):
+            sample_type, sample_length = struct.unpack_from('>II', datagram, offset)
+            offset += 8
+            sample_format = sample_type & 0xfff
+            if sample_type >> 12 == 0 and sample_format in (self.counters_sample, self.expanded_counters_sample):
+                header_length = 12 if sample_format == self.counters_sample else 16
+                num_records, = struct.unpack_from('>I', datagram, offset + header_length - 4)
+                record_offset = offset + header_length
+                for _ in range(num_records):
+                    record_type, record_length = struct.unpack_from('>II', datagram, record_offset)
+                    record_offset += 8
+                    if record_type == self.generic_interface_counters:
+                        record = self.generic_interface_counters_struct.unpack_from(datagram, record_offset)
+                        counters.append(tuple(record[i] for i in self.fields))
+                    record_offset += record_length
+            offset += sample_length
+        return counters
+
+
+class SFlowCollectorProtocol(asyncio.DatagramProtocol):
+    def __init__(self, decoder: SFlowV5Decoder, columns: SampleColumns, clock: Callable[[], float] = time.time):
+        self.decoder = decoder
+        self.columns = columns
+        self.clock = clock
+        self.bad_datagrams = 0
+
+    def datagram_received(self, data, addr):
+        # like sflowtool, samples are timed by their arrival at the collector
+        now = int(self.clock())
+        try:
+            counters = self.decoder.decode(data)
+        except (struct.error, ValueError) as e:
+            self.bad_datagrams += 1
+            logger.debug("Dropping bad sFlow datagram from %s: %s", addr, e)
+            return
+        for counter in counters:
+            self.columns.append(now, *counter)
+
+
+class SFlowNativeMonitor(Monitor):
+    """A Monitor collecting OvS-embedded sFlow counters with an in-process asyncio sFlow v5 collector"""
+
+    def __init__(self, config: SFlowNativeConfig):
+        self.config = config
+        data_keys = get_data_keys(config.data_key, config.data_keys)
+        self.keys = [SFlowMonitor.sflow_time_key, SFlowMonitor.sflow_intf_index_key] + data_keys
+        self.normalize_by = get_normalize_by(data_keys, config.normalize_by, config.normalize_by_key)
+        self.protocol = SFlowCollectorProtocol(SFlowV5Decoder(data_keys),
+                                               SampleColumns(config.initial_capacity, len(data_keys)))
+        self.loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        self.transport = None  # type: Optional[asyncio.BaseTransport]
+        self.collector_thread = None  # type: Optional[Thread]
+
+    def start_monitoring(self, output_path, interfaces_naming):
+        if self.collector_thread is None:
+            logger.info("Starting native sFlow monitoring")
+            logger.info("Creating sFlow monitoring instances in the ovs switches")
+            run_script("set_ovs_sflow.sh", logger.info, logger.error)
+            self.start_collector()
+        else:
+            logger.error("Monitoring is already running")
+
+    def start_collector(self):
+        self.loop = asyncio.new_event_loop()
+        bound = Event()
+        self.collector_thread = Thread(target=self.run_collector, args=(self.loop, bound), name="sflow-collector",
+                                       daemon=True)
+        self.collector_thread.start()
+        bound.wait()
+        if self.transport is None:
+            raise RuntimeError("Failed binding the sFlow collector to %s:%d" % (self.config.listen_ip,
+                                                                                self.config.listen_port))
+        logger.info("sFlow collector listening on %s:%d", *self.transport.get_extra_info('sockname')[:2])
+
+    def run_collector(self, loop: asyncio.AbstractEventLoop, bound: Event):
+        asyncio.set_event_loop(loop)
+        try:
+            transport, _ = loop.run_until_complete(
+                loop.create_datagram_endpoint(lambda: self.protocol,
+                                              local_addr=(self.config.listen_ip, self.config.listen_port)))
+            self.transport = transport
+        except OSError:
+            logger.exception("Could not start the sFlow collector")
+            return
+        finally:
+            bound.set()
+        loop.run_forever()
+        transport.close()
+        # let the transport finish closing before the loop goes away
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+
+    def stop_collector(self):
+        assert self.loop is not None and self.collector_thread is not None, "The sFlow collector is not running"
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.collector_thread.join()
+        self.collector_thread = None
+        self.transport = None
+        self.loop = None
+
+    def process_monitoring_data(self, interfaces_naming: Dict[int, str]) -> Optional[pd.DataFrame]:
+        if self.collector_thread is None:
+            logger.error("No monitoring currently running to stop and process")
+            return None
+        logger.info("Stopping the sFlow collector")
+        self.stop_collector()
+        if self.protocol.bad_datagrams:
+            logger.warning("Dropped %d bad sFlow datagrams", self.protocol.bad_datagrams)
+        times, intf_indexes, values = self.protocol.columns.view()
+        if times.size == 0:
+            logger.error("No sFlow samples were collected")
+            return None
+        logger.info("Processing %d sFlow samples...", times.size)
+        return pivot_samples(times, intf_indexes, values, self.keys, interfaces_naming,
+                             is_cumulative_data=self.config.is_cumulative_data,
+                             normalize_by=self.normalize_by)
+
+
+@dataclass
+class SysfsConfig:
+    # any file under /sys/class/net/<interface>/statistics, rx_bytes being the sFlow ifInOctets equivalent
+    counter: str = 'rx_bytes'
+    interval_seconds: float = 0.1
+    normalize_by: float = 125000.0
+    # how much polling the preallocated buffer holds before it is spilled to disk
+    buffer_seconds: float = 600
+    spill_filename: str = 'sysfs_samples.bin'
+    delete_spill_file: bool = True
+    sysfs_path: str = '/sys/class/net'
+
+
+class SysfsCounterPoller(Thread):
+    """Polls a statistics counter of a set of interfaces straight from sysfs, at a fixed interval.
+    The counter files are opened once and re-read with pread, and every tick is stored in a preallocated
+    buffer which is appended to a spill file whenever it fills up."""
+
+    def __init__(self, counter_paths: List[str], spill_path: str, interval_seconds: float, buffer_rows: int,
+                 clock: Callable[[], float] = time.time):
+        super().__init__(name="sysfs-counter-poller", daemon=True)
+        self.counter_paths = counter_paths
+        self.spill_path = spill_path
+        self.interval_seconds = interval_seconds
+        self.clock = clock
+        # each row holds the tick's time followed by the counters
+        self.buffer = np.empty((max(1, buffer_rows), len(counter_paths) + 1), dtype=np.float64)
+        self.size = 0
+        self.spilled_rows = 0
+        self.fds = []  # type: List[int]
+        self.stopping = Event()
+
+    def open(self):
+        self.fds = [os_open(path, O_RDONLY) for path in self.counter_paths]
+        # start a fresh spill file
+        open(self.spill_path, 'wb').close()
+
+    def close(self):
+        for fd in self.fds:
+            os_close(fd)
+        self.fds = []
+
+    def run(self):
+        next_tick = time.monotonic()
+        while not self.stopping.is_set():
+            self.poll_once()
+            next_tick += self.interval_seconds
+            self.stopping.wait(max(0.0, next_tick - time.monotonic()))
+        self.spill()
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+        self.close()
+
+    def poll_once(self):
+        if self.size == len(self.buffer):
+            self.spill()
+        row = self.buffer[self.size]
+        row[0] = self.clock()
+        for i, fd in enumerate(self.fds, start=1):
+            try:
+                row[i] = int(pread(fd, 32, 0))
+            except (OSError, ValueError):
+                # the interface is gone or mid update
+                row[i] = np.nan
+        self.size += 1
+
+    def spill(self):
+        if self.size == 0:
+            return
+        with open(self.spill_path, 'ab') as f:
+            f.write(self.buffer[:self.size].tobytes())
+        self.spilled_rows += self.size
+        logger.debug("Spilled %d sysfs counter rows to %s", self.size, self.spill_path)
+        self.size = 0
+
+    def read_rows(self) -> np.ndarray:
+        """All polled rows, once the poller has stopped"""
+        if not isfile(self.spill_path):
+            return np.empty((0, self.buffer.shape[1]))
+        return np.fromfile(self.spill_path, dtype=np.float64).reshape(-1, self.buffer.shape[1])
+
+
+class SysfsMonitor(Monitor):
+    """A Monitor polling the inter-switch interfaces' counters from sysfs, bypassing sFlow altogether"""
+
+    def __init__(self, config: SysfsConfig):
+        if config.interval_seconds <= 0:
+            raise ValueError("The sysfs polling interval must be positive")
+        self.config = config
+        self.keys = [SFlowMonitor.sflow_time_key, SFlowMonitor.sflow_intf_index_key]
+        self.ports = []  # type: List[int]
+        self.poller = None  # type: Optional[SysfsCounterPoller]
+
+    @staticmethod
+    def get_interface_names(sysfs_path: str) -> Dict[int, str]:
+        """Maps the ifIndex of every interface to its kernel name"""
+        names = {}
+        for name in listdir(sysfs_path):
+            ifindex_path = pj(sysfs_path, name, 'ifindex')
+            if isfile(ifindex_path):
+                with open(ifindex_path) as f:
+                    names[int(f.read())] = name
+        return names
+
+    def start_monitoring(self, output_path, interfaces_naming):
+        if self.poller is not None:
+            logger.error("Monitoring is already running")
+            return
+        kernel_names = self.get_interface_names(self.config.sysfs_path)
+        missing = [num for num in interfaces_naming if num not in kernel_names]
+        if missing:
+            logger.warning("Interfaces %s are not in %s and will not be monitored", missing, self.config.sysfs_path)
+        self.ports = sorted(num for num in interfaces_naming if num in kernel_names)
+        counter_paths = [pj(self.config.sysfs_path, kernel_names[num], 'statistics', self.config.counter)
+                         for num in self.ports]
+        buffer_rows = int(np.ceil(self.config.buffer_seconds / self.config.interval_seconds))
+        self.poller = SysfsCounterPoller(counter_paths, pj(output_path, self.config.spill_filename),
+                                         self.config.interval_seconds, buffer_rows)
+        self.poller.open()
+        logger.info("Polling %s of %d interfaces every %.3f seconds", self.config.counter, len(self.ports),
+                    self.config.interval_seconds)
+        self.poller.start()
+
+    def process_monitoring_data(self, interfaces_naming: Dict[int, str]) -> Optional[pd.DataFrame]:
+        if self.poller is None:
+            logger.error("No monitoring currently running to stop and process")
+            return None
+        logger.info("Stopping the sysfs counters polling")
+        self.poller.stop()
+        rows = self.poller.read_rows()
+        if self.config.delete_spill_file:
+            remove(self.poller.spill_path)
+        self.poller = None
+        if len(rows) < 2:
+            logger.error("Not enough sysfs counter samples were polled")
+            return None
+        logger.info("Processing %d sysfs counter samples...", len(rows))
+        return self.get_rates(rows, self.ports, self.keys, interfaces_naming, self.config.normalize_by)
+
+    @staticmethod
+    def get_rates(rows: np.ndarray, ports: List[int], keys: List[str], interfaces_naming: Dict[int, str],
+                  normalize_by=None) -> pd.DataFrame:
+        """Turns polled (time, counters...) rows into per second rates between consecutive polls"""
+        times = rows[:, 0]
+        rates = np.diff(rows[:, 1:], axis=0) / np.diff(times)[:, np.newaxis]
+        if normalize_by:
+            rates /= normalize_by
+        index = pd.Index((times[1:] * 1e9).astype('datetime64[ns]'), name=keys[0])
+        columns = pd.Index([interfaces_naming[port] for port in ports], name=keys[1])
+        return pd.DataFrame(rates, index=index, columns=columns)
@@ -1,33 +1,83 @@
 import json
 import logging
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from multiprocessing import cpu_count, current_process, get_context
 from os import makedirs
-from typing import List, Any, Dict, Type, Optional
+from tempfile import TemporaryDirectory
+from threading import Lock, local
+from typing import List, Any, Dict, Type, Optional, Iterable, Iterator, Callable
+import numpy as np
 import pandas as pd
 from scipy.stats import iqr
 from dacite import from_dict
-from os.path import join as pj
+from os.path import join as pj, isdir, isfile
 import matplotlib
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure, SubplotParams
+
+from sdnsandbox.downsample import downsample
+from sdnsandbox.rates import flag_rate_shortfalls
+from sdnsandbox.stats import OnlineStatistics
+from sdnsandbox.store import Samples, StoredSamples, load_samples, iter_samples_chunks
 
 matplotlib.use('Agg')
 
 logger = logging.getLogger(__name__)
 
 
+class DerivedInputs(object):
+    """Inputs derived from the samples, each computed once (even when requested concurrently) and shared.
+    Samples left in their store are only read whole when some processor needs them so."""
+    derivations: Dict[str, Callable[['DerivedInputs'], Any]] = {
+        'samples': lambda inputs: load_samples(inputs.sampling_df),
+        'values': lambda inputs: inputs.get('samples').to_numpy(),
+        'second_means': lambda inputs: inputs.get('samples').mean(axis=1),
+        'port_means': lambda inputs: inputs.get('samples').mean(axis=0),
+    }
+
+    def __init__(self, sampling_df: Samples):
+        self.sampling_df: Samples = sampling_df
+        self.values: Dict[str, Any] = {}
+        self.locks = {name: Lock() for name in self.derivations}
+
+    def iter_chunks(self, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """The samples a chunk of rows at a time, from memory if they were already read whole"""
+        with self.locks['samples']:
+            samples = self.values.get('samples', self.sampling_df)
+        return iter_samples_chunks(samples, chunk_rows)
+
+    def get(self, name: str):
+        with self.locks[name]:
+            if name not in self.values:
+                logger.debug("Deriving %s from the samples", name)
+                self.values[name] = self.derivations[name](self)
+            return self.values[name]
+
+
 class Processor(ABC):
+    # the derived inputs the processor uses, see DerivedInputs.derivations
+    inputs = ['samples']  # type: List[str]
+
     @abstractmethod
     def process(self, sampling_df: pd.DataFrame, output_path: str):
         pass
 
+    def process_inputs(self, inputs: DerivedInputs, output_path: str):
+        self.process(inputs.get('samples'), output_path)
+
 
 @dataclass
 class IQRProcessor(Processor):
     iqr_filename: str = 'iqr.json'
+    inputs = ['values', 'second_means', 'port_means']
 
     def process(self, sampling_df: pd.DataFrame, output_path: str):
-        results = self.get_iqr_results(sampling_df)
+        self.process_inputs(DerivedInputs(sampling_df), output_path)
+
+    def process_inputs(self, inputs: DerivedInputs, output_path: str):
+        results = self.get_iqr_results_from_inputs(inputs)
         full_path = pj(output_path, self.iqr_filename)
         self.dump_results(full_path, results)
 
@@ -40,16 +90,20 @@ class IQRProcessor(Processor):
 
     @staticmethod
     def get_iqr_results(sampling_df):
+        return IQRProcessor.get_iqr_results_from_inputs(DerivedInputs(sampling_df))
+
+    @staticmethod
+    def get_iqr_results_from_inputs(inputs: DerivedInputs):
         logger.info("Creating IQR results")
         results = {
             'total_iqr':
-                IQRProcessor.get_iqr(sampling_df.to_numpy(),
+                IQRProcessor.get_iqr(inputs.get('values'),
                                      'IQR for all readings'),
             'second_means_iqr':
-                IQRProcessor.get_iqr(sampling_df.mean(axis=1).to_numpy(),
+                IQRProcessor.get_iqr(inputs.get('second_means').to_numpy(),
                                      'IQR for means of all seconds (mean of all readings per second)'),
             'port_means_iqr':
-                IQRProcessor.get_iqr(sampling_df.mean(axis=0).to_numpy(),
+                IQRProcessor.get_iqr(inputs.get('port_means').to_numpy(),
                                      'IQR for port means (mean of all the readings a port had)')
         }
         logger.debug("IQR results are: %s", str(results))
@@ -65,12 +119,92 @@ class IQRProcessor(Processor):
         return result
 
 
+@dataclass
+class SketchIQRProcessor(Processor):
+    """IQRProcessor's results, computed a chunk of rows at a time using memory proportional to the number of ports.
+    The total and second means IQRs come from quantile sketches: each of their quartiles q is within
+    relative_accuracy * |q| of the exact one, so each IQR is within relative_accuracy * (|q25| + |q75|).
+    The port means IQR is exact. Unlike IQRProcessor, missing (NaN) readings are skipped."""
+    iqr_filename: str = 'sketch_iqr.json'
+    relative_accuracy: float = 0.01
+    chunk_rows: int = 3600
+    # when set, the samples are streamed from this HDF5 file in the output path instead of the given DataFrame
+    hd5_filename: Optional[str] = None
+    hd5_key: str = 'sdnsandbox_data'
+
+    inputs = []
+
+    def process(self, sampling_df: Samples, output_path: str):
+        self.process_chunks(iter_samples_chunks(sampling_df, self.chunk_rows), output_path)
+
+    def process_inputs(self, inputs: DerivedInputs, output_path: str):
+        self.process_chunks(inputs.iter_chunks(self.chunk_rows), output_path)
+
+    def process_chunks(self, chunks: Iterable[pd.DataFrame], output_path: str):
+        if self.hd5_filename is not None:
+            chunks = StoredSamples(pj(output_path, self.hd5_filename), self.hd5_key).iter_chunks(self.chunk_rows)
+        results = self.get_iqr_results(chunks, self.relative_accuracy)
+        IQRProcessor.dump_results(pj(output_path, self.iqr_filename), results)
+
+    @staticmethod
+    def get_iqr_results(chunks: Iterable[pd.DataFrame], relative_accuracy: float = 0.01) -> Dict[str, Dict]:
+        """The results over all chunks (which may come from several runs), with the first chunk's columns"""
+        logger.info("Creating sketched IQR results")
+        stats = None
+        for chunk in chunks:
+            if stats is None:
+                stats = OnlineStatistics(list(chunk.columns), relative_accuracy)
+            stats.update(chunk)
+        if stats is None:
+            raise ValueError("No samples to create IQR results from")
+        results = stats.iqr_results()
+        for result in results.values():
+            logger.info(result['description'] + " is " + str(result['result']))
+        return results
+
+
+@dataclass
+class RateShortfallProcessor(Processor):
+    """Flags the periods whose senders achieved less than min_ratio of their target rate, so the link loads of
+    those periods are known not to match the load schedule"""
+    shortfalls_filename: str = 'rate_shortfalls.json'
+    min_ratio: float = 0.9
+    # the senders' rates saved by the runner in the output path
+    rates_hd5_filename: str = 'rates.hd5'
+    rates_hd5_key: str = 'rates'
+    inputs = []
+
+    def process_inputs(self, inputs: DerivedInputs, output_path: str):
+        # the samples are not needed
+        self.process(inputs.sampling_df, output_path)
+
+    def process(self, sampling_df: Samples, output_path: str):
+        rates_path = pj(output_path, self.rates_hd5_filename)
+        if not isfile(rates_path):
+            logger.warning("No sender rates at %s to check", rates_path)
+            return
+        results = flag_rate_shortfalls(pd.read_hdf(rates_path, key=self.rates_hd5_key), self.min_ratio)
+        if results['flagged_periods']:
+            logger.warning("%d of %d periods achieved less than %.0f%% of their target rate",
+                           len(results['flagged_periods']), results['periods'], self.min_ratio * 100)
+        shortfalls_path = pj(output_path, self.shortfalls_filename)
+        logger.info("Dumping rate shortfalls to %s", shortfalls_path)
+        with open(shortfalls_path, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
 @dataclass
 class PlottingProcessor(Processor):
     plots_dirname: str = 'plots'
     xlabel: str = 'Time'
     ylabel: str = 'MB/s'
     filename_format: str = "link_load_{}.png"
+    # number of processes rendering plots, None for one per CPU
+    workers: Optional[int] = None
+    # series longer than the points are downsampled before plotting (see sdnsandbox.downsample.METHODS),
+    # None points meaning the figure's width in pixels and a None method turning it off
+    downsample_method: Optional[str] = 'minmax'
+    downsample_points: Optional[int] = None
 
     def process(self, sampling_df: pd.DataFrame, output_path: str, max_x: int = -1):
         plots_dir = pj(output_path, self.plots_dirname)
@@ -78,30 +212,133 @@ class PlottingProcessor(Processor):
         makedirs(plots_dir, exist_ok=True)
         # this is needed for proper time-series plots
         pd.plotting.register_matplotlib_converters()
+        sampling_df = sampling_df[:max_x]
+        filenames = []
         for column in sampling_df.keys():
-            logger.info("Plotting samples for port " + str(column))
-            sampling_df[column][:max_x].plot()
-            plt.xlabel(self.xlabel)
-            plt.ylabel(self.ylabel)
-            plt.tight_layout()
-            filename = pj(plots_dir, self.filename_format.format(column))
-            logger.info("Saving plot to " + filename)
-            plt.savefig(filename)
-            plt.close()
+            # multiple counter samples have (port, counter) columns
+            column_name = '-'.join(column) if isinstance(column, tuple) else column
+            filenames.append(pj(plots_dir, self.filename_format.format(column_name)))
+        workers = min(self.workers or cpu_count(), len(filenames))
+        if current_process().daemon:
+            # pool workers (e.g. when reprocessing many directories) cannot have pools of their own
+            workers = 1
+        if workers <= 1:
+            for position, filename in enumerate(filenames):
+                self.plot_column(sampling_df.index, sampling_df.iloc[:, position].to_numpy(), filename)
+        else:
+            self.plot_in_pool(sampling_df, filenames, workers)
         logger.info("Done plotting @ " + plots_dir)
 
+    def plot_in_pool(self, sampling_df: pd.DataFrame, filenames: List[str], workers: int):
+        logger.info("Plotting %d columns using %d processes", len(filenames), workers)
+        # the workers map their column out of a file (in memory, where possible) instead of unpickling the samples
+        with TemporaryDirectory(dir=SHARED_MEMORY_DIR if isdir(SHARED_MEMORY_DIR) else None) as shared_dir:
+            values_path = pj(shared_dir, 'values.npy')
+            index_path = pj(shared_dir, 'index.npy')
+            # column major, so each worker's slice is contiguous
+            np.save(values_path, np.asfortranarray(sampling_df.to_numpy(dtype=np.float64)))
+            np.save(index_path, sampling_df.index.to_numpy())
+            tasks = [(values_path, index_path, sampling_df.index.name, position, filename)
+                     for position, filename in enumerate(filenames)]
+            # the processors run on the pipeline's threads (next to e.g. the log sink's), and forking a multithreaded
+            # process copies the locks other threads hold, so the workers are forked from a single threaded server
+            context = get_context('forkserver')
+            context.set_forkserver_preload([__name__])
+            with context.Pool(workers) as pool:
+                for _ in pool.imap_unordered(self.plot_shared_column, tasks):
+                    pass
+
+    def plot_shared_column(self, task):
+        values_path, index_path, index_name, position, filename = task
+        values = np.load(values_path, mmap_mode='r')[:, position]
+        index = pd.Index(np.load(index_path, allow_pickle=True), name=index_name)
+        self.plot_column(index, values, filename)
+
+    def plot_column(self, index: pd.Index, values: np.ndarray, filename: str):
+        logger.info("Plotting samples to " + filename)
+        figure = get_reusable_figure()
+        axes = figure.add_subplot(1, 1, 1)
+        series = pd.Series(values, index=index)
+        if self.downsample_method is not None:
+            points = self.downsample_points or int(figure.get_figwidth() * figure.get_dpi())
+            series = downsample(series, self.downsample_method, points)
+        series.plot(ax=axes)
+        axes.set_xlabel(self.xlabel)
+        axes.set_ylabel(self.ylabel)
+        figure.tight_layout()
+        figure.savefig(filename)
+
+
+SHARED_MEMORY_DIR = '/dev/shm'
+_reusable_figures = local()
+
+
+def get_reusable_figure() -> Figure:
+    """A cleared figure, created once per thread instead of once per plot"""
+    figure = getattr(_reusable_figures, 'figure', None)
+    if figure is None:
+        figure = _reusable_figures.figure = Figure()
+        FigureCanvasAgg(figure)
+    else:
+        figure.clf()
+        # clearing keeps the spacing tight_layout set for the previous plot
+        figure.subplotpars = SubplotParams()
+    return figure
+
+
+class ProcessorPipeline(object):
+    """Runs processors concurrently over the samples, sharing the inputs they derive from them"""
+
+    def __init__(self, processors: List[Processor], workers: Optional[int] = None):
+        for processor in processors:
+            unknown = set(processor.inputs) - set(DerivedInputs.derivations)
+            if unknown:
+                raise ValueError("%s uses unknown derived inputs %s" % (type(processor).__name__, sorted(unknown)))
+        self.processors = processors
+        # number of processors running at once, None for all of them
+        self.workers = workers
+
+    def __iter__(self) -> Iterator[Processor]:
+        return iter(self.processors)
+
+    def __len__(self) -> int:
+        return len(self.processors)
+
+    def __getitem__(self, index: int) -> Processor:
+        return self.processors[index]
+
+    def run(self, sampling_df: Samples, output_path: str):
+        if not self.processors:
+            return
+        inputs = DerivedInputs(sampling_df)
+        workers = self.workers or len(self.processors)
+        logger.info("Running %d processors, %d at a time", len(self.processors), workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(processor.process_inputs, inputs, output_path)
+                       for processor in self.processors]
+        errors = []
+        for processor, future in zip(self.processors, futures):
+            error = future.exception()
+            if error is not None:
+                logger.error("%s failed: %s", type(processor).__name__, error)
+                errors.append(error)
+        if errors:
+            raise errors[0]
+
 
 class ProcessorsFactory:
     types = {'IQR': IQRProcessor,
-             'Plotting': PlottingProcessor}  # type: Dict[str, Type[Processor]]
+             'SketchIQR': SketchIQRProcessor,
+             'Plotting': PlottingProcessor,
+             'RateShortfall': RateShortfallProcessor}  # type: Dict[str, Type[Processor]]
 
     @classmethod
-    def create(cls, processors_config: List[Dict[str, Any]], types: Optional[Dict[str, Type[Processor]]] = None)\
-            -> List[Processor]:
+    def create(cls, processors_config: List[Dict[str, Any]], types: Optional[Dict[str, Type[Processor]]] = None,
+               workers: Optional[int] = None) -> ProcessorPipeline:
         if types is None:
             types = cls.types
         processors = []
         for processor_config in processors_config:
             processor = from_dict(types[processor_config['type']], processor_config)
             processors.append(processor)
-        return processors
+        return ProcessorPipeline(processors, workers)
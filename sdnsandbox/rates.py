@@ -0,0 +1,182 @@
+"""Accounting of the rates the senders achieved against the rates they were asked to send at.
+
+The senders' final statistics are parsed from their output as it streams through the log sink (or, for D-ITG,
+from their decoded logs), and recorded per host, period and IMIX bucket once the sender's output ends. Senders that
+never reported (e.g. killed for running past their period) are recorded with unknown (NaN) achieved rates and bytes.
+"""
+import logging
+import math
+import os
+import re
+import subprocess
+from abc import ABC, abstractmethod
+from subprocess import STDOUT, PIPE
+from threading import Lock
+from typing import Optional, List, Dict, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RATES_COLUMNS = ['host', 'period', 'bucket', 'target_pps', 'achieved_pps', 'bytes']
+BYTE_UNITS = {'B': 1, 'KB': 1 << 10, 'MB': 1 << 20, 'GB': 1 << 30}
+
+
+def parse_byte_count(text: str) -> float:
+    """The bytes of a count such as nping's 12.600KB"""
+    match = re.fullmatch(r'([\d.]+)\s*([KMG]?B)', text.strip())
+    if match is None:
+        raise ValueError("Unknown byte count %s" % text)
+    return float(match.group(1)) * BYTE_UNITS[match.group(2)]
+
+
+class RateRecorder(object):
+    """The achieved and target rates of all senders, recorded from any thread"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.records: List[Tuple] = []
+
+    def record(self, host: str, period: int, bucket: str, target_pps: float, achieved_pps: float,
+               sent_bytes: float):
+        with self.lock:
+            self.records.append((host, period, bucket, target_pps, achieved_pps, sent_bytes))
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.records)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """The rates by host, period and bucket, summing those of several destinations"""
+        with self.lock:
+            rates_df = pd.DataFrame(self.records, columns=RATES_COLUMNS)
+        rates_df = rates_df.astype({'period': 'int64', 'target_pps': 'float64', 'achieved_pps': 'float64',
+                                    'bytes': 'float64'})
+        keys = [rates_df[key] for key in ['host', 'period', 'bucket']]
+        sums = rates_df[['target_pps', 'achieved_pps', 'bytes']].groupby(keys).sum()
+        # the sum is unknown when any of its senders' is unknown
+        unknown = rates_df[['achieved_pps', 'bytes']].isna().groupby(keys).any()
+        sums[['achieved_pps', 'bytes']] = sums[['achieved_pps', 'bytes']].mask(unknown)
+        return sums.reset_index()
+
+
+class SenderStats(ABC):
+    """Parses a sender's final statistics from its output lines, recording its achieved rate when the output ends"""
+
+    def __init__(self, recorder: RateRecorder, host: str, period: int, bucket: str, target_pps: float,
+                 duration_seconds: float):
+        self.recorder = recorder
+        self.host = host
+        self.period = period
+        self.bucket = bucket
+        self.target_pps = target_pps
+        self.duration_seconds = duration_seconds
+        self.packets: Optional[float] = None
+        self.bytes: Optional[float] = None
+        self.seconds: Optional[float] = None
+
+    @abstractmethod
+    def feed_line(self, line: str):
+        pass
+
+    def reset(self):
+        """Forgets what was parsed, for a sender that is run again"""
+        self.packets, self.bytes, self.seconds = None, None, None
+
+    def finish(self):
+        if self.packets is None:
+            achieved_pps = math.nan
+        else:
+            # without its own elapsed time, the sender is taken to have sent over its whole period
+            seconds = self.seconds if self.seconds else self.duration_seconds
+            achieved_pps = self.packets / seconds
+        self.recorder.record(self.host, self.period, self.bucket, self.target_pps, achieved_pps,
+                             math.nan if self.bytes is None else self.bytes)
+
+
+class NpingStats(SenderStats):
+    """nping's summary, e.g. "Raw packets sent: 300 (12.600KB) | Rcvd: 0 (0B) | Lost: 300 (100.00%)" (or "UDP
+    packets sent: 300 | ..." when unprivileged) and "Nping done: 1 IP address pinged in 30.01 seconds" """
+    sent_pattern = re.compile(r'(?:Raw|UDP) packets sent: (\d+)(?: \(([\d.]+ ?[KMG]?B)\))?')
+    done_pattern = re.compile(r'Nping done: .* in ([\d.]+) seconds')
+
+    def feed_line(self, line: str):
+        match = self.sent_pattern.search(line)
+        if match is not None:
+            self.packets = float(match.group(1))
+            self.bytes = parse_byte_count(match.group(2)) if match.group(2) else None
+            return
+        match = self.done_pattern.search(line)
+        if match is not None:
+            self.seconds = float(match.group(1))
+
+
+class ITGSendStats(SenderStats):
+    """D-ITG's flow report, which ITGSend only writes to its log (its output just tells it started and finished
+    sending), decoded by ITGDec into "Total time = 30.000123 s", "Total packets = 900" and "Bytes received = 36000"
+    lines (the bytes the sender sent, for a sender's log)"""
+    report_pattern = re.compile(r'^\s*(Total time|Total packets|Bytes sent|Bytes received)\s*=\s*([\d.]+)')
+    decode_cmd = ['ITGDec']
+
+    def __init__(self, recorder: RateRecorder, host: str, period: int, bucket: str, target_pps: float,
+                 duration_seconds: float, log_path: str):
+        super().__init__(recorder, host, period, bucket, target_pps, duration_seconds)
+        # the log ITGSend writes with -l
+        self.log_path = log_path
+
+    def feed_line(self, line: str):
+        match = self.report_pattern.match(line)
+        if match is None:
+            return
+        name, value = match.group(1), float(match.group(2))
+        if name == 'Total time':
+            self.seconds = value
+        elif name == 'Total packets':
+            self.packets = value
+        else:
+            self.bytes = value
+
+    def reset(self):
+        super().reset()
+        try:
+            os.remove(self.log_path)
+        except FileNotFoundError:
+            pass
+
+    def decode(self, timeout_seconds: float = 60.0):
+        """Decodes the log of the exited sender, recording its achieved rate, and deletes it"""
+        try:
+            decoded = subprocess.run(self.decode_cmd + [self.log_path], stdout=PIPE, stderr=STDOUT,
+                                     universal_newlines=True, timeout=timeout_seconds)
+        except (OSError, subprocess.SubprocessError):
+            logger.exception("Failed decoding the D-ITG log %s", self.log_path)
+        else:
+            # the per flow report comes first, followed by the same totals of the log's single flow
+            for line in decoded.stdout.split('TOTAL RESULTS')[0].splitlines():
+                self.feed_line(line)
+        self.finish()
+        try:
+            os.remove(self.log_path)
+        except FileNotFoundError:
+            pass
+
+
+def flag_rate_shortfalls(rates_df: pd.DataFrame, min_ratio: float) -> Dict:
+    """The periods (and the rates of hosts' buckets) that achieved less than min_ratio of their target rate,
+    of those whose achieved rate is known"""
+    known = rates_df.dropna(subset=['achieved_pps'])
+    known = known[known['target_pps'] > 0]
+    senders_ratio = known['achieved_pps'] / known['target_pps']
+    periods = known.groupby('period')[['target_pps', 'achieved_pps']].sum()
+    periods['ratio'] = periods['achieved_pps'] / periods['target_pps']
+    flagged_periods = periods[periods['ratio'] < min_ratio]
+    return {'min_ratio': min_ratio,
+            'rates': len(rates_df),
+            'unknown_rates': int(rates_df['achieved_pps'].isna().sum()),
+            'flagged_rates': int((senders_ratio < min_ratio).sum()),
+            'periods': len(periods),
+            'flagged_periods': [{'period': int(period),
+                                 'target_pps': float(row['target_pps']),
+                                 'achieved_pps': float(row['achieved_pps']),
+                                 'ratio': float(row['ratio'])}
+                                for period, row in flagged_periods.iterrows()]}
@@ -0,0 +1,129 @@
+"""Re-runs post processors over the output directories of past experiments, without emulating them again:
+
+    python -m sdnsandbox.reprocess -c config.json output_dir [output_dir ...]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import sys
+from multiprocessing import Pool, cpu_count
+from os import stat, replace
+from os.path import join as pj, isfile
+from typing import Dict, Any, List, Optional
+
+from sdnsandbox.processor import ProcessorsFactory
+from sdnsandbox.store import StoredSamples
+
+logger = logging.getLogger(__name__)
+
+# the runner's defaults, for configs that do not set them
+DEFAULT_HD5_FILENAME = 'sdnsandbox.hd5'
+DEFAULT_HD5_KEY = 'sdnsandbox_data'
+DEFAULT_NETWORK_DATA_FILENAME = 'network_data.json'
+STAMP_FILENAME = 'reprocess.json'
+
+PROCESSED = 'processed'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+def load_config(config_path: str) -> Dict[str, Any]:
+    """The post processing part of a runner config (or of a config holding just a post_processors list)"""
+    with open(config_path) as conf_file:
+        conf = json.load(conf_file)
+    conf = conf.get('runner', conf)
+    if conf.get('hd5_filename', DEFAULT_HD5_FILENAME) is None:
+        raise ValueError("The config at %s saves no HDF5 samples (its hd5_filename is null) to reprocess" %
+                         config_path)
+    return {'post_processors': conf['post_processors'],
+            'post_processing_workers': conf.get('post_processing_workers'),
+            'hd5_filename': conf.get('hd5_filename', DEFAULT_HD5_FILENAME),
+            'hd5_key': conf.get('hd5_key', DEFAULT_HD5_KEY),
+            'network_data_filename': conf.get('network_data_filename', DEFAULT_NETWORK_DATA_FILENAME)}
+
+
+def get_fingerprint(output_dir: str, config: Dict[str, Any]) -> str:
+    """Changes whenever the processors config or the inputs (by size and modification time) change"""
+    fingerprint = hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8'))
+    for filename in [config['hd5_filename'], config['network_data_filename']]:
+        file_stat = stat(pj(output_dir, filename))
+        fingerprint.update(('%s:%d:%d' % (filename, file_stat.st_size, file_stat.st_mtime_ns)).encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
+def read_stamp(output_dir: str) -> Optional[str]:
+    stamp_path = pj(output_dir, STAMP_FILENAME)
+    if not isfile(stamp_path):
+        return None
+    with open(stamp_path) as f:
+        return json.load(f).get('fingerprint')
+
+
+def write_stamp(output_dir: str, fingerprint: str):
+    stamp_path = pj(output_dir, STAMP_FILENAME)
+    with open(stamp_path + '.tmp', 'w') as f:
+        json.dump({'fingerprint': fingerprint}, f, indent=4)
+    replace(stamp_path + '.tmp', stamp_path)
+
+
+def reprocess_directory(output_dir: str, config: Dict[str, Any], force: bool = False) -> str:
+    try:
+        fingerprint = get_fingerprint(output_dir, config)
+        if not force and read_stamp(output_dir) == fingerprint:
+            logger.info("Skipping %s, it was already processed with the same inputs and config", output_dir)
+            return SKIPPED
+        with open(pj(output_dir, config['network_data_filename'])) as f:
+            network_data = json.load(f)
+        logger.info("Reprocessing %s (%d switches, %d links)", output_dir,
+                    len(network_data.get('switches', [])), len(network_data.get('switch_links', [])))
+        # left in the store, to be read in chunks by the processors that can, and whole only if some processor needs
+        samples = StoredSamples(pj(output_dir, config['hd5_filename']), config['hd5_key'])
+        pipeline = ProcessorsFactory.create(config['post_processors'], workers=config['post_processing_workers'])
+        pipeline.run(samples, output_dir)
+        write_stamp(output_dir, fingerprint)
+        return PROCESSED
+    except Exception:
+        logger.exception("Failed reprocessing %s", output_dir)
+        return FAILED
+
+
+def reprocess_directories(output_dirs: List[str], config: Dict[str, Any], workers: Optional[int] = None,
+                          force: bool = False) -> Dict[str, str]:
+    """Reprocesses the directories in a process pool, returning each one's outcome"""
+    workers = min(workers or cpu_count(), len(output_dirs))
+    logger.info("Reprocessing %d directories using %d processes", len(output_dirs), workers)
+    tasks = [(output_dir, config, force) for output_dir in output_dirs]
+    if workers <= 1:
+        outcomes = [reprocess_directory(*task) for task in tasks]
+    else:
+        with Pool(workers) as pool:
+            outcomes = pool.starmap(reprocess_directory, tasks, chunksize=1)
+    results = dict(zip(output_dirs, outcomes))
+    logger.info("Reprocessing done: %d processed, %d skipped, %d failed",
+                *[outcomes.count(outcome) for outcome in [PROCESSED, SKIPPED, FAILED]])
+    return results
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(prog="sdnsandbox.reprocess")
+    parser.add_argument("-c", "--config", required=True,
+                        help="JSON configuration file, of which the post_processors are run")
+    parser.add_argument("output_dirs", nargs='+', help="Experiment output directories to reprocess")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Number of directories processed at once (default: one per CPU)")
+    parser.add_argument("-f", "--force", action="store_true", help="Reprocess even unchanged directories")
+    parser.add_argument("-d", "--debug", action="store_true", help="Set SDNSandbox verbosity to debug level")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_arguments(argv)
+    logging.basicConfig(stream=sys.stdout, level=logging.DEBUG if args.debug else logging.INFO,
+                        format='%(asctime)s->%(name)s-%(levelname)s: %(message)s')
+    results = reprocess_directories(args.output_dirs, load_config(args.config), args.jobs, args.force)
+    return 1 if FAILED in results.values() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
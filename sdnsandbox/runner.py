@@ -2,15 +2,18 @@ import logging
 from dataclasses import dataclass, asdict
 from enum import Enum
 from json import dump, dumps, load
-from os import makedirs
-from typing import Dict, Callable, List
-from os.path import join as pj
+from os import makedirs, remove
+from typing import Dict, Callable, Optional
+from os.path import join as pj, abspath
 from dacite import from_dict
 
+from sdnsandbox.export import export_samples
 from sdnsandbox.load_generator import LoadGenerator, LoadGeneratorFactory
+from sdnsandbox.metrics import MetricsServer
 from sdnsandbox.monitor import Monitor, MonitorFactory
-from sdnsandbox.network import SDNSandboxNetwork, Interface, SDNSandboxNetworkFactory
-from sdnsandbox.processor import ProcessorsFactory, Processor
+from sdnsandbox.network import SDNSandboxNetwork, Interface, SDNSandboxNetworkFactory, SDNSandboxNetworkData
+from sdnsandbox.processor import ProcessorsFactory, ProcessorPipeline
+from sdnsandbox.store import save_samples, load_samples, Samples, StoredSamples
 
 logger = logging.getLogger(__name__)
 
@@ -20,18 +23,29 @@ class RunnerFactory:
     def create(config_path: str, output_dir: str, logs_dir: str):
         logger.info("Opening config JSON at %s", config_path)
         with open(config_path) as conf_file:
-            conf = load(conf_file)['runner']
+            config = load(conf_file)
+            conf = config['runner']
             logger.info("Loaded Runner Configuration:\n%s", dumps(conf, indent=4))
+            save_config(config, pj(output_dir, conf.get('config_filename', RunnerData.config_filename)))
             conf['load_generator'] = LoadGeneratorFactory.create(conf['load_generator'])
             conf['monitor'] = MonitorFactory.create(conf['monitor'])
             conf['network'] = SDNSandboxNetworkFactory.create(conf['network'])
-            conf['post_processors'] = ProcessorsFactory.create(conf['post_processors'])
+            conf['post_processors'] = ProcessorsFactory.create(conf['post_processors'],
+                                                               workers=conf.get('post_processing_workers'))
             conf['output_dir'] = output_dir
             conf['logs_dir'] = logs_dir
             data = from_dict(RunnerData, conf)
             return Runner(data)
 
 
+def save_config(config: Dict, path: str):
+    """Saves the configuration an experiment runs with to its output, where it identifies the experiment in catalogs
+    (see sdnsandbox.catalog)"""
+    logger.info("Saving the configuration as %s", path)
+    with open(path, 'w') as config_file:
+        dump(config, config_file, indent=4)
+
+
 class InterfaceTranslation(Enum):
     NUM_TO_STRING = 0
     TRANSLATE_TO_NAMES = 1
@@ -43,28 +57,62 @@ class RunnerData:
     network: SDNSandboxNetwork
     load_generator: LoadGenerator
     monitor: Monitor
-    post_processors: List[Processor]
+    post_processors: ProcessorPipeline
     output_dir: str
     logs_dir: str
     network_data_filename: str = 'network_data.json'
+    # the whole configuration file is saved to the output as this file
+    config_filename: str = 'config.json'
     hd5_key: str = 'sdnsandbox_data'
-    hd5_filename: str = 'sdnsandbox.hd5'
+    # None to not save the samples in HDF5 (e.g. when exported to Arrow instead)
+    hd5_filename: Optional[str] = 'sdnsandbox.hd5'
+    # "table" saves a compressed table, appended hd5_chunk_rows at a time, whose time windows and columns can be
+    # selected (see sdnsandbox.store.select_samples), "fixed" a single node that can only be read whole
+    hd5_format: str = 'table'
+    hd5_complevel: int = 5
+    hd5_complib: str = 'blosc:zstd'
+    hd5_chunk_rows: int = 3600
+    # the packets and bytes the receivers counted receiving from every source every second (for load generators
+    # whose receivers count them), saved as a ground truth of the delivered load, None to not save them
+    received_hd5_filename: Optional[str] = 'received.hd5'
+    received_hd5_key: str = 'received'
+    # the target and achieved rates of the senders (for load generators that account for them), saved before
+    # post processing, None to not save them
+    rates_hd5_filename: Optional[str] = 'rates.hd5'
+    rates_hd5_key: str = 'rates'
+    # when set, the samples are also exported (as float32, with the network data as metadata) to this file,
+    # in the "arrow" IPC format that can be memory-mapped or the "parquet" one (both need pyarrow)
+    export_filename: Optional[str] = None
+    export_format: str = 'arrow'
     interfaces_translation: InterfaceTranslation = InterfaceTranslation.TRANSLATE_TO_MEANINGS
+    # when set, live metrics are served in the Prometheus text format on this port during the run
+    metrics_port: Optional[int] = None
+    metrics_host: str = '127.0.0.1'
+    # number of post processors running at once, None for all of them
+    post_processing_workers: Optional[int] = None
 
 
 class Runner(object):
     def __init__(self, data: RunnerData):
         self.data = data
+        self.metrics_server = None  # type: Optional[MetricsServer]
 
     def run(self):
+        if self.data.metrics_port is not None:
+            self.metrics_server = MetricsServer(host=self.data.metrics_host, port=self.data.metrics_port)
+            self.metrics_server.start()
         self.data.network.start()
         hosts = self.data.network.get_hosts()
         receivers_logs_path = pj(self.data.logs_dir, "receivers")
         makedirs(receivers_logs_path, exist_ok=True)
         self.data.load_generator.start_receivers(hosts, logs_path=receivers_logs_path)
-        self.data.monitor.start_monitoring(self.data.output_dir)
+        interfaces_naming = self.get_interfaces_naming(self.data.interfaces_translation,
+                                                       self.data.network.get_interfaces())
+        self.data.monitor.start_monitoring(self.data.output_dir, interfaces_naming)
         senders_logs_path = pj(self.data.logs_dir, "senders")
         makedirs(senders_logs_path, exist_ok=True)
+        topology_creator = self.data.network.config.topology_creator
+        self.data.load_generator.use_topology(topology_creator.switches, topology_creator.switch_links)
         self.data.load_generator.run_senders(hosts, logs_path=senders_logs_path)
 
     def stop_and_save(self):
@@ -75,16 +123,66 @@ class Runner(object):
                 dump(asdict(network_data), json_file, sort_keys=True, indent=4)
             interfaces_naming = self.get_interfaces_naming(self.data.interfaces_translation, network_data.interfaces)
             monitoring_data_df = self.data.monitor.process_monitoring_data(interfaces_naming)
+            # stopping the receivers also finishes writing the senders' output, and with it their rates
+            self.data.load_generator.stop_receivers()
+            self.save_received_counts()
+            self.save_sender_rates()
             if monitoring_data_df is None:
                 logger.error("No monitoring data to process or save")
             else:
-                logger.info("Saving samples as %s", self.data.hd5_filename)
-                monitoring_data_df.to_hdf(pj(self.data.output_dir, self.data.hd5_filename), key=self.data.hd5_key)
+                self.save_samples(monitoring_data_df, network_data)
                 self.post_process(monitoring_data_df)
-            self.data.load_generator.stop_receivers()
+                self.remove_stored_samples(monitoring_data_df)
             self.data.network.stop()
         else:
             logger.error("No network to stop, process or save")
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+    def save_samples(self, monitoring_data_df, network_data: SDNSandboxNetworkData):
+        if self.data.hd5_filename is not None:
+            logger.info("Saving samples as %s", self.data.hd5_filename)
+            save_samples(monitoring_data_df, pj(self.data.output_dir, self.data.hd5_filename), self.data.hd5_key,
+                         hd5_format=self.data.hd5_format,
+                         complevel=self.data.hd5_complevel,
+                         complib=self.data.hd5_complib,
+                         chunk_rows=self.data.hd5_chunk_rows)
+        if self.data.export_filename is not None:
+            logger.info("Exporting samples as %s", self.data.export_filename)
+            export_samples(load_samples(monitoring_data_df), pj(self.data.output_dir, self.data.export_filename),
+                           self.data.export_format, asdict(network_data))
+
+    def remove_stored_samples(self, samples: Samples):
+        """Deletes the store the monitor left the samples in (e.g. the one they were streamed to) once they are
+        saved in the samples' own HDF5 file, rather than keeping the largest output twice"""
+        if not isinstance(samples, StoredSamples) or self.data.hd5_filename is None:
+            return
+        if abspath(samples.path) == abspath(pj(self.data.output_dir, self.data.hd5_filename)):
+            return
+        logger.info("Deleting %s, whose samples are saved as %s", samples.path, self.data.hd5_filename)
+        remove(samples.path)
+
+    def save_received_counts(self):
+        if self.data.received_hd5_filename is None:
+            return
+        received_df = self.data.load_generator.read_received_counts()
+        if received_df is None:
+            return
+        logger.info("Saving %d received counts as %s", len(received_df), self.data.received_hd5_filename)
+        save_samples(received_df, pj(self.data.output_dir, self.data.received_hd5_filename),
+                     self.data.received_hd5_key, hd5_format='fixed', complevel=self.data.hd5_complevel,
+                     complib=self.data.hd5_complib)
+
+    def save_sender_rates(self):
+        if self.data.rates_hd5_filename is None:
+            return
+        rates_df = self.data.load_generator.read_sender_rates()
+        if rates_df is None:
+            return
+        logger.info("Saving the rates of %d senders as %s", len(rates_df), self.data.rates_hd5_filename)
+        save_samples(rates_df, pj(self.data.output_dir, self.data.rates_hd5_filename), self.data.rates_hd5_key,
+                     hd5_format='fixed', complevel=self.data.hd5_complevel, complib=self.data.hd5_complib)
 
     @staticmethod
     def get_interfaces_naming(interfaces_translation, interfaces: Dict[int, Interface]) -> Dict[int, str]:
@@ -95,5 +193,4 @@ class Runner(object):
         return {num: getters[interfaces_translation](interfaces[num]) for num in interfaces.keys()}
 
     def post_process(self, monitoring_data_df):
-        for processor in self.data.post_processors:
-            processor.process(monitoring_data_df, self.data.output_dir)
+        self.data.post_processors.run(monitoring_data_df, self.data.output_dir)
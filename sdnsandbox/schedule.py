@@ -0,0 +1,161 @@
+"""The load of a whole experiment, computed up front: the rate of every period, host and IMIX bucket,
+and how every period's and host's rate is split between destinations. The load generators only index into it
+while running."""
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+SCHEDULE_FILENAME = 'schedule.npz'
+
+
+def calculate_periods_pps(periods, pps_base_level: int, pps_amplitude: int, pps_wavelength: int) -> np.ndarray:
+    # 2pi is the regular wavelength of sine, so we divide it by the required wavelength to get the amplitude change,
+    # which is truncated to whole packets
+    return pps_base_level + np.trunc(pps_amplitude * np.sin(2 * np.pi * np.asarray(periods) / pps_wavelength))
+
+
+def destinations_to_shares(destinations) -> sparse.csr_matrix:
+    """The shares of periods x hosts destinations (indices), each getting all of its host's rate"""
+    periods_count, hosts_count = destinations.shape
+    rows = periods_count * hosts_count
+    return sparse.csr_matrix((np.ones(rows), np.ravel(destinations), np.arange(rows + 1)),
+                             shape=(rows, hosts_count))
+
+
+def traffic_to_shares(traffic, periods_count: int, max_destinations: Optional[int] = None) -> sparse.csr_matrix:
+    """The shares of each host's rate by the traffic it sends its destinations, given as hosts x hosts (for all
+    periods) or periods x hosts x hosts, keeping only the heaviest max_destinations of every host"""
+    traffic = np.array(traffic, dtype=np.float64, ndmin=3)
+    hosts_count = traffic.shape[-1]
+    if traffic.shape[1:] != (hosts_count, hosts_count) or traffic.shape[0] not in (1, periods_count):
+        raise ValueError("Expected a traffic matrix of %d hosts (and %d periods), got %s" %
+                         (hosts_count, periods_count, traffic.shape))
+    # hosts do not send to themselves
+    traffic[:, np.arange(hosts_count), np.arange(hosts_count)] = 0
+    kept = hosts_count - 1 if max_destinations is None else min(max_destinations, hosts_count - 1)
+    destinations = np.argpartition(-traffic, kept - 1, axis=-1)[..., :kept]
+    kept_traffic = np.take_along_axis(traffic, destinations, axis=-1)
+    totals = kept_traffic.sum(axis=-1, keepdims=True)
+    shares = np.divide(kept_traffic, totals, out=np.zeros_like(kept_traffic), where=totals > 0)
+    destinations = np.broadcast_to(destinations, (periods_count, hosts_count, kept))
+    shares = np.broadcast_to(shares, (periods_count, hosts_count, kept))
+    rows = periods_count * hosts_count
+    shares_matrix = sparse.csr_matrix((shares.flatten(), destinations.flatten(), np.arange(0, rows * kept + 1, kept)),
+                                      shape=(rows, hosts_count))
+    shares_matrix.eliminate_zeros()
+    shares_matrix.sort_indices()
+    return shares_matrix
+
+
+def drop_low_rates(flow_rates, min_rate: float) -> np.ndarray:
+    """The flows x buckets rates without those below min_rate, each bucket's dropped rates given back to its
+    remaining flows by their rates (the smallest dropped first, a bucket whose total is below min_rate dropped)"""
+    flow_rates = np.array(flow_rates, dtype=np.float64, ndmin=2)
+    for bucket_rates in flow_rates.T:
+        total = bucket_rates.sum()
+        while True:
+            low = np.flatnonzero((bucket_rates > 0) & (bucket_rates < min_rate))
+            if not low.size:
+                break
+            bucket_rates[low[bucket_rates[low].argmin()]] = 0
+            kept = bucket_rates.sum()
+            if kept > 0:
+                bucket_rates *= total / kept
+    return flow_rates
+
+
+@dataclass
+class LoadSchedule:
+    # the names of the IMIX buckets, by the last axis of rates
+    buckets: List[str]
+    # packets per second of every period, host and bucket
+    rates: np.ndarray
+    # the share of every period's and host's (row period * hosts + host_index) rate sent to each destination
+    # (column, the index in the host addresses)
+    shares: sparse.csr_matrix
+    period_duration_seconds: int
+
+    @property
+    def periods(self) -> int:
+        return self.rates.shape[0]
+
+    @property
+    def hosts(self) -> int:
+        return self.rates.shape[1]
+
+    def host_rates(self, period: int, host_index: int) -> Dict[str, float]:
+        return dict(zip(self.buckets, self.rates[period, host_index].tolist()))
+
+    def host_destinations(self, period: int, host_index: int) -> List[Tuple[int, float]]:
+        """The indices of the host's destinations in the period, with the share of its rate each one gets"""
+        row = period * self.hosts + host_index
+        start, end = self.shares.indptr[row], self.shares.indptr[row + 1]
+        return list(zip(self.shares.indices[start:end].tolist(), self.shares.data[start:end].tolist()))
+
+    def host_flows(self, period: int, host_index: int, host_addresses: List[str], min_rate: float = 0.0) \
+            -> List[Tuple[str, Dict[str, float]]]:
+        """The host's destination addresses in the period, each with the rate of every bucket sent to it.
+        With a min_rate, the rates below it are dropped and given back to the bucket's other flows."""
+        destinations = self.host_destinations(period, host_index)
+        shares = np.array([share for _, share in destinations])
+        flow_rates = self.rates[period, host_index][None, :] * shares[:, None]
+        if not min_rate:
+            return [(host_addresses[dest_index], dict(zip(self.buckets, rates)))
+                    for (dest_index, _), rates in zip(destinations, flow_rates.tolist())]
+        flows = []
+        for (dest_index, _), rates in zip(destinations, drop_low_rates(flow_rates, min_rate).tolist()):
+            kept_rates = {bucket: rate for bucket, rate in zip(self.buckets, rates) if rate > 0}
+            if kept_rates:
+                flows.append((host_addresses[dest_index], kept_rates))
+        return flows
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            np.savez(f, buckets=np.array(self.buckets), rates=self.rates, shares_data=self.shares.data,
+                     shares_indices=self.shares.indices, shares_indptr=self.shares.indptr,
+                     period_duration_seconds=self.period_duration_seconds)
+
+    @staticmethod
+    def load(path: str) -> 'LoadSchedule':
+        with np.load(path, allow_pickle=False) as schedule:
+            rates = schedule['rates']
+            shares = sparse.csr_matrix((schedule['shares_data'], schedule['shares_indices'],
+                                        schedule['shares_indptr']),
+                                       shape=(rates.shape[0] * rates.shape[1], rates.shape[1]))
+            return LoadSchedule(buckets=schedule['buckets'].tolist(),
+                                rates=rates,
+                                shares=shares,
+                                period_duration_seconds=int(schedule['period_duration_seconds']))
+
+    def summary(self) -> Dict[str, Any]:
+        """What the schedule amounts to, and the entries a generator would have trouble sending"""
+        host_pps = self.rates.sum(axis=2)
+        network_pps = host_pps.sum(axis=1)
+        peak_period = int(network_pps.argmax()) if self.periods else None
+        return {'periods': self.periods,
+                'hosts': self.hosts,
+                'buckets': self.buckets,
+                'duration_hours': self.periods * self.period_duration_seconds / 3600,
+                'total_packets': int(network_pps.sum() * self.period_duration_seconds),
+                'host_pps': {'min': float(host_pps.min()) if host_pps.size else None,
+                             'mean': float(host_pps.mean()) if host_pps.size else None,
+                             'max': float(host_pps.max()) if host_pps.size else None},
+                'bucket_mean_pps': dict(zip(self.buckets, self.rates.mean(axis=(0, 1)).tolist()))
+                if self.rates.size else {},
+                'peak_period': peak_period,
+                'peak_network_pps': float(network_pps[peak_period]) if self.periods else None,
+                'mean_destinations': self.shares.nnz / self.shares.shape[0] if self.shares.shape[0] else 0.0,
+                # e.g. nping sends nothing at all at a rate of zero
+                'rates_below_one_pps': int((self.flow_rates() < 1).sum()),
+                'self_destinations': int((self.shares.indices == self.entry_hosts()).sum())}
+
+    def entry_hosts(self) -> np.ndarray:
+        """The host index of every entry of the shares"""
+        return np.repeat(np.arange(self.shares.shape[0]) % max(self.hosts, 1), np.diff(self.shares.indptr))
+
+    def flow_rates(self) -> np.ndarray:
+        """The rate of every bucket sent to every destination, by the entries of the shares"""
+        rows = np.repeat(np.arange(self.shares.shape[0]), np.diff(self.shares.indptr))
+        return self.rates.reshape(-1, len(self.buckets))[rows] * self.shares.data[:, None]
@@ -0,0 +1,264 @@
+import json
+import logging
+import math
+from os import replace
+from time import monotonic
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.stats import iqr
+
+logger = logging.getLogger(__name__)
+
+
+class RunningStats(object):
+    """Count, mean and variance of a vector of series (e.g. one per port), updated a block of rows at a time.
+    Each block is reduced on its own and then merged in, using the parallel form of Welford's method
+    (Chan et al., "Updating Formulae and a Pairwise Algorithm for Computing Sample Variances", 1979)."""
+
+    def __init__(self, width: int = 1):
+        self.count = np.zeros(width, dtype=np.int64)
+        self.mean = np.zeros(width, dtype=np.float64)
+        self.m2 = np.zeros(width, dtype=np.float64)
+
+    def update(self, rows: np.ndarray):
+        """Adds a (rows x width) block, ignoring NaN values"""
+        rows = rows.reshape(len(rows), -1)
+        valid = ~np.isnan(rows)
+        count = valid.sum(axis=0)
+        filled = np.where(valid, rows, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, filled.sum(axis=0) / count, 0.0)
+        m2 = (np.where(valid, rows - mean, 0.0) ** 2).sum(axis=0)
+        self.merge_moments(count, mean, m2)
+
+    def merge(self, other: 'RunningStats'):
+        self.merge_moments(other.count, other.mean, other.m2)
+
+    def merge_moments(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = np.where(total > 0, self.mean + delta * count / total, 0.0)
+            self.m2 = np.where(total > 0, self.m2 + m2 + delta ** 2 * self.count * count / total, 0.0)
+        self.count = total
+
+    @property
+    def variance(self) -> np.ndarray:
+        """The sample variance (like pandas' var), NaN where there are less than two values"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+
+class QuantileSketch(object):
+    """A mergeable quantile sketch with a relative accuracy guarantee, following DDSketch
+    (Masson et al., "DDSketch: A Fast and Fully-Mergeable Quantile Sketch with Relative-Error Guarantees", 2019).
+    Values are counted in logarithmically sized buckets, so any returned quantile q is within
+    relative_accuracy * |q| of the exact one, using memory proportional to the logarithm of the values' range."""
+
+    def __init__(self, relative_accuracy: float = 0.01, min_indexable_value: float = 1e-9):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("The sketch relative accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_indexable_value = min_indexable_value
+        self.zero_count = 0
+        # bucket counts for positive and (the magnitudes of) negative values, starting at the key in the offset
+        self.positive = np.zeros(0, dtype=np.int64)
+        self.positive_offset = 0
+        self.negative = np.zeros(0, dtype=np.int64)
+        self.negative_offset = 0
+
+    @property
+    def count(self) -> int:
+        return int(self.zero_count + self.positive.sum() + self.negative.sum())
+
+    def keys(self, magnitudes: np.ndarray) -> np.ndarray:
+        return np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64)
+
+    def value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        is_zero = np.abs(values) < self.min_indexable_value
+        self.zero_count += int(is_zero.sum())
+        positive = values[(values > 0) & ~is_zero]
+        negative = -values[(values < 0) & ~is_zero]
+        self.positive, self.positive_offset = self.add_keys(self.positive, self.positive_offset, self.keys(positive))
+        self.negative, self.negative_offset = self.add_keys(self.negative, self.negative_offset, self.keys(negative))
+
+    @staticmethod
+    def add_keys(bins: np.ndarray, offset: int, keys: np.ndarray, counts: Optional[np.ndarray] = None):
+        if keys.size == 0:
+            return bins, offset
+        bins, offset = QuantileSketch.extend(bins, offset, int(keys.min()), int(keys.max()))
+        np.add.at(bins, keys - offset, 1 if counts is None else counts)
+        return bins, offset
+
+    @staticmethod
+    def extend(bins: np.ndarray, offset: int, min_key: int, max_key: int):
+        if bins.size == 0:
+            return np.zeros(max_key - min_key + 1, dtype=np.int64), min_key
+        new_offset = min(offset, min_key)
+        new_size = max(offset + bins.size, max_key + 1) - new_offset
+        if new_offset == offset and new_size == bins.size:
+            return bins, offset
+        extended = np.zeros(new_size, dtype=np.int64)
+        extended[offset - new_offset:offset - new_offset + bins.size] = bins
+        return extended, new_offset
+
+    def merge(self, other: 'QuantileSketch'):
+        if other.gamma != self.gamma:
+            raise ValueError("Only sketches of the same relative accuracy can be merged")
+        self.zero_count += other.zero_count
+        for name in ['positive', 'negative']:
+            other_bins = getattr(other, name)
+            if other_bins.size:
+                other_offset = getattr(other, name + '_offset')
+                keys = np.arange(other_offset, other_offset + other_bins.size)
+                bins, offset = self.add_keys(getattr(self, name), getattr(self, name + '_offset'), keys, other_bins)
+                setattr(self, name, bins)
+                setattr(self, name + '_offset', offset)
+
+    def quantile(self, q: float) -> float:
+        count = self.count
+        if count == 0:
+            return float('nan')
+        rank = q * (count - 1)
+        # negative values come first, the largest magnitudes first
+        negative_cumsum = np.cumsum(self.negative[::-1])
+        if negative_cumsum.size and rank < negative_cumsum[-1]:
+            key = self.negative_offset + self.negative.size - 1 - int(np.searchsorted(negative_cumsum, rank,
+                                                                                      side='right'))
+            return -self.value(key)
+        rank -= negative_cumsum[-1] if negative_cumsum.size else 0
+        if rank < self.zero_count:
+            return 0.0
+        rank -= self.zero_count
+        positive_cumsum = np.cumsum(self.positive)
+        index = min(int(np.searchsorted(positive_cumsum, rank, side='right')), positive_cumsum.size - 1)
+        return self.value(self.positive_offset + index)
+
+    def iqr(self) -> float:
+        return self.quantile(0.75) - self.quantile(0.25)
+
+
+class OnlineStatistics(object):
+    """Per port and global running statistics of the samples, updated as rows of them arrive.
+    Memory is proportional to the number of ports and never to the number of samples."""
+    total_iqr_description = 'IQR for all readings'
+    second_means_iqr_description = 'IQR for means of all seconds (mean of all readings per second)'
+    port_means_iqr_description = 'IQR for port means (mean of all the readings a port had)'
+
+    def __init__(self, ports: List[str], relative_accuracy: float = 0.01):
+        self.ports = list(ports)
+        self.relative_accuracy = relative_accuracy
+        self.port_stats = RunningStats(len(self.ports))
+        self.total_stats = RunningStats()
+        self.port_sketches = [QuantileSketch(relative_accuracy) for _ in self.ports]
+        self.total_sketch = QuantileSketch(relative_accuracy)
+        self.second_means_sketch = QuantileSketch(relative_accuracy)
+        self.seconds = 0
+        self.last_time = None
+
+    def update(self, rows: pd.DataFrame):
+        if rows.empty:
+            return
+        matrix = rows.reindex(columns=self.ports).to_numpy(dtype=np.float64)
+        self.port_stats.update(matrix)
+        self.total_stats.update(matrix.reshape(-1, 1))
+        self.total_sketch.update(matrix)
+        for port_sketch, column in zip(self.port_sketches, matrix.T):
+            port_sketch.update(column)
+        # seconds without any readings have no mean
+        has_readings = ~np.isnan(matrix).all(axis=1)
+        second_means = np.nanmean(matrix[has_readings], axis=1)
+        self.second_means_sketch.update(second_means)
+        self.seconds += len(second_means)
+        self.last_time = rows.index[-1]
+
+    def merge(self, other: 'OnlineStatistics'):
+        if other.ports != self.ports:
+            raise ValueError("Only statistics of the same ports can be merged")
+        self.port_stats.merge(other.port_stats)
+        self.total_stats.merge(other.total_stats)
+        self.total_sketch.merge(other.total_sketch)
+        self.second_means_sketch.merge(other.second_means_sketch)
+        for port_sketch, other_sketch in zip(self.port_sketches, other.port_sketches):
+            port_sketch.merge(other_sketch)
+        self.seconds += other.seconds
+        if other.last_time is not None and (self.last_time is None or other.last_time > self.last_time):
+            self.last_time = other.last_time
+
+    def iqr_results(self) -> Dict[str, Dict]:
+        """The IQRProcessor results, where all but the port means IQR are approximated by the sketches"""
+        seen_ports = self.port_stats.count > 0
+        port_means = self.port_stats.mean[seen_ports]
+        return {
+            'total_iqr': {'result': self.total_sketch.iqr(),
+                          'instances_for_calc': self.total_sketch.count,
+                          'description': self.total_iqr_description},
+            'second_means_iqr': {'result': self.second_means_sketch.iqr(),
+                                 'instances_for_calc': self.second_means_sketch.count,
+                                 'description': self.second_means_iqr_description},
+            'port_means_iqr': {'result': float(iqr(port_means)) if port_means.size else float('nan'),
+                               'instances_for_calc': int(port_means.size),
+                               'description': self.port_means_iqr_description}
+        }
+
+    def snapshot(self) -> Dict:
+        variances = self.port_stats.variance
+        ports = {}
+        for i, port in enumerate(self.ports):
+            sketch = self.port_sketches[i]
+            ports[str(port)] = {'count': int(self.port_stats.count[i]),
+                                'mean': float(self.port_stats.mean[i]),
+                                'std': float(np.sqrt(variances[i])),
+                                'q25': sketch.quantile(0.25),
+                                'median': sketch.quantile(0.5),
+                                'q75': sketch.quantile(0.75)}
+        return {'last_time': None if self.last_time is None else str(self.last_time),
+                'seconds': self.seconds,
+                'relative_accuracy': self.relative_accuracy,
+                'total': {'count': int(self.total_stats.count[0]),
+                          'mean': float(self.total_stats.mean[0]),
+                          'std': float(np.sqrt(self.total_stats.variance[0])),
+                          'q25': self.total_sketch.quantile(0.25),
+                          'median': self.total_sketch.quantile(0.5),
+                          'q75': self.total_sketch.quantile(0.75)},
+                'iqr': self.iqr_results(),
+                'ports': ports}
+
+
+class OnlineStatisticsRecorder(object):
+    """Feeds arriving sample rows to OnlineStatistics, writing a snapshot of them at most once per interval"""
+
+    def __init__(self, stats: OnlineStatistics, snapshot_path: str, interval_seconds: float = 60,
+                 clock=monotonic):
+        self.stats = stats
+        self.snapshot_path = snapshot_path
+        self.interval_seconds = interval_seconds
+        self.clock = clock
+        self.last_snapshot = clock()
+
+    def __call__(self, rows: pd.DataFrame):
+        self.stats.update(rows)
+        if self.clock() - self.last_snapshot >= self.interval_seconds:
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        self.last_snapshot = self.clock()
+        snapshot = self.stats.snapshot()
+        # write aside and rename, so readers never see a half written snapshot
+        with open(self.snapshot_path + '.tmp', 'w') as f:
+            json.dump(snapshot, f, indent=4, default=float)
+        replace(self.snapshot_path + '.tmp', self.snapshot_path)
+        logger.debug("Wrote online statistics snapshot to %s", self.snapshot_path)
+
+    def close(self):
+        self.write_snapshot()
+        logger.info("Online statistics IQR results: %s", self.stats.iqr_results())
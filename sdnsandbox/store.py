@@ -0,0 +1,99 @@
+import logging
+from typing import Optional, List, Iterator, Union
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+HD5_FORMATS = ['fixed', 'table']
+
+
+def open_samples_store(path: str, complevel: int = 5, complib: str = 'blosc:zstd', mode: str = 'w') \
+        -> pd.HDFStore:
+    return pd.HDFStore(path, mode=mode, complevel=complevel, complib=complib if complevel else None)
+
+
+def append_samples(store: pd.HDFStore, key: str, rows: pd.DataFrame):
+    """Appends rows to a table, leaving the (costly to update) time index to finish_samples"""
+    store.append(key, rows, format='table', index=False)
+    # tables only keep the names of MultiIndex columns
+    store.get_storer(key).attrs.columns_names = list(rows.columns.names)
+
+
+def finish_samples(store: pd.HDFStore, key: str):
+    """Indexes the table's time column, so time windows can be selected without a full scan"""
+    if key in store:
+        store.create_table_index(key, columns=['index'], optlevel=9, kind='full')
+
+
+class StoredSamples(object):
+    """Samples left in an HDF5 file instead of memory (e.g. those streamed during the run), to be read a chunk of
+    rows at a time where possible (from either the table or the fixed format)"""
+
+    def __init__(self, path: str, key: str):
+        self.path = path
+        self.key = key
+
+    def iter_chunks(self, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        with pd.HDFStore(self.path, mode='r') as store:
+            storer = store.get_storer(self.key)
+            columns_names = getattr(storer.attrs, 'columns_names', None)
+            rows = storer.nrows if storer.is_table else storer.shape[0]
+            for start in range(0, rows, chunk_rows):
+                chunk = store.select(self.key, start=start, stop=start + chunk_rows)
+                if columns_names is not None:
+                    chunk.columns.names = columns_names
+                yield chunk
+
+    def read(self) -> pd.DataFrame:
+        return select_samples(self.path, self.key)
+
+
+# the samples, either in memory or left in their store
+Samples = Union[pd.DataFrame, StoredSamples]
+
+
+def iter_samples_chunks(samples: Samples, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    if isinstance(samples, StoredSamples):
+        yield from samples.iter_chunks(chunk_rows)
+        return
+    for start in range(0, len(samples), chunk_rows):
+        yield samples.iloc[start:start + chunk_rows]
+
+
+def load_samples(samples: Samples) -> pd.DataFrame:
+    """All the samples in memory, for uses that need them whole"""
+    return samples.read() if isinstance(samples, StoredSamples) else samples
+
+
+def save_samples(samples_df: Samples, path: str, key: str, hd5_format: str = 'table', complevel: int = 5,
+                 complib: str = 'blosc:zstd', chunk_rows: int = 3600):
+    """Saves the samples either as a single fixed format node, or as a compressed table appended a chunk at a time"""
+    if hd5_format not in HD5_FORMATS:
+        raise ValueError("Unknown HDF5 format %s, expected one of %s" % (hd5_format, HD5_FORMATS))
+    if hd5_format == 'fixed':
+        load_samples(samples_df).to_hdf(path, key=key, format='fixed', complevel=complevel,
+                                        complib=complib if complevel else None)
+        return
+    with open_samples_store(path, complevel, complib, mode='a') as store:
+        if key in store:
+            store.remove(key)
+        for chunk in iter_samples_chunks(samples_df, chunk_rows):
+            append_samples(store, key, chunk)
+        finish_samples(store, key)
+
+
+def select_samples(path: str, key: str, start=None, end=None, columns: Optional[List] = None) -> pd.DataFrame:
+    """The samples of a table with start <= time < end, of the given columns only (all when None).
+    Unlike pd.read_hdf this also restores the name of the columns."""
+    conditions = []
+    if start is not None:
+        conditions.append('index >= start')
+    if end is not None:
+        conditions.append('index < end')
+    with pd.HDFStore(path, mode='r') as store:
+        samples_df = store.select(key, where=' & '.join(conditions) or None, columns=columns)
+        columns_names = getattr(store.get_storer(key).attrs, 'columns_names', None)
+    if columns_names is not None:
+        samples_df.columns.names = columns_names
+    return samples_df
@@ -0,0 +1,59 @@
+import unittest
+from os import listdir
+from os.path import abspath, dirname, join as pj
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from sdnsandbox.archive import RawSamplesWriter, RawSamplesReader, RAW_SAMPLE_DTYPE
+from sdnsandbox.monitor import SFlowMonitor
+
+
+class ArchiveTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(pj(dirname(abspath(__file__)), "sflow.csv")) as f:
+            cls.samples = SFlowMonitor.parse_samples_block(f.read())
+
+    def test_from_csv_partitions_by_time(self):
+        with TemporaryDirectory() as temp_dir:
+            with open(pj(dirname(abspath(__file__)), "sflow.csv")) as f:
+                RawSamplesWriter.from_csv(f, temp_dir, partition_seconds=2, block_bytes=100)
+            # 1607902307-1607902311 spans three 2 second partitions
+            self.assertEqual(4, len(listdir(temp_dir)))
+            reader = RawSamplesReader(temp_dir)
+            self.assertEqual((1607902307, 1607902311), reader.time_span())
+            records = reader.read()
+            self.assertEqual(RAW_SAMPLE_DTYPE, records.dtype)
+            np.testing.assert_array_equal(self.samples[:, 0], records['time'])
+            np.testing.assert_array_equal(self.samples[:, 1], records['ifIndex'])
+            np.testing.assert_array_equal(self.samples[:, 2], records['value'])
+
+    def test_read_window_maps_only_needed_partitions(self):
+        with TemporaryDirectory() as temp_dir:
+            with RawSamplesWriter(temp_dir, partition_seconds=2) as writer:
+                writer.append(self.samples[:, 0], self.samples[:, 1], self.samples[:, 2])
+            reader = RawSamplesReader(temp_dir)
+            self.assertEqual(1, len(reader.partitions_for(1607902309, 1607902310)))
+            records = reader.read(1607902309, 1607902310)
+            self.assertIsInstance(records, np.memmap)
+            self.assertEqual({1607902309}, set(records['time']))
+            self.assertEqual(86, len(records))
+            self.assertEqual(0, len(reader.read(1607902400)))
+
+    def test_unsorted_appends_and_reopening(self):
+        with TemporaryDirectory() as temp_dir:
+            with RawSamplesWriter(temp_dir) as writer:
+                writer.append(self.samples[86:, 0], self.samples[86:, 1], self.samples[86:, 2])
+            with RawSamplesWriter(temp_dir) as writer:
+                writer.append(self.samples[:86, 0], self.samples[:86, 1], self.samples[:86, 2])
+            reader = RawSamplesReader(temp_dir)
+            self.assertFalse(reader.partitions[0]['sorted'])
+            self.assertEqual(len(self.samples), len(reader.read()))
+            self.assertEqual(86 * 2, len(reader.read(1607902307, 1607902309)))
+            with self.assertRaises(ValueError):
+                RawSamplesWriter(temp_dir, partition_seconds=60)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import json
+from os import makedirs
+from os.path import join as pj
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+
+from sdnsandbox.catalog import CatalogBuilder, Catalog
+
+
+class TestCatalog(TestCase):
+    def make_experiment_dir(self, root, network, switches, seconds):
+        path = pj(root, 'SDNSandbox-' + network)
+        makedirs(path)
+        samples_df = pd.DataFrame(np.arange(seconds * 2.0).reshape(seconds, 2), columns=['s1-s2', 's2-s1'],
+                                  index=pd.date_range('2020-12-13', periods=seconds, freq='s'))
+        samples_df.to_hdf(pj(path, 'sdnsandbox.hd5'), key='sdnsandbox_data')
+        with open(pj(path, 'network_data.json'), 'w') as f:
+            json.dump({'interfaces': {}, 'switches': {str(i): {} for i in range(switches)},
+                       'switch_links': [{}] * switches}, f)
+        with open(pj(path, 'config.json'), 'w') as f:
+            json.dump({'runner': {'network': {'topology_creator': {
+                'graphml': 'http://www.topology-zoo.org/files/%s.graphml' % network}}}}, f)
+        return samples_df
+
+    def test_build_query_and_read(self):
+        with TemporaryDirectory() as root:
+            aarnet_df = self.make_experiment_dir(root, 'Aarnet', 19, 1000)
+            self.make_experiment_dir(root, 'Abilene', 11, 500)
+            catalog_path = pj(root, 'catalog.json')
+            catalog = CatalogBuilder(row_offsets_stride=100).build([root], catalog_path)
+            self.assertEqual(['Aarnet', 'Abilene'], [entry.topology for entry in catalog.entries])
+            aarnet, = Catalog.load(catalog_path).query(min_switches=12)
+            self.assertEqual((19, 19, 1000, ['s1-s2', 's2-s1']),
+                             (aarnet.switches, aarnet.links, aarnet.rows, aarnet.columns))
+            self.assertEqual(aarnet_df.index[0].value, aarnet.start)
+            self.assertEqual(aarnet_df.index[-1].value, aarnet.end)
+            self.assertEqual(64, len(aarnet.config_hash))
+            self.assertEqual([], catalog.query(topology='Abilene', start=aarnet_df.index[600].value))
+            start, end = aarnet_df.index[250].value, aarnet_df.index[420].value
+            self.assertEqual((200, 500), aarnet.rows_for(start, end))
+            samples_df = Catalog.read(aarnet, start, end, columns=['s2-s1'])
+            pd.testing.assert_frame_equal(aarnet_df.iloc[250:421][['s2-s1']], samples_df)
+            entries = [entry for entry, _ in catalog.read_all(catalog.query(column='s1-s2'))]
+            self.assertEqual(catalog.entries, entries)
+            # unchanged experiments are not read again
+            with patch.object(CatalogBuilder, 'create_entry') as create_entry:
+                CatalogBuilder(row_offsets_stride=100).build([root], catalog_path)
+                create_entry.assert_not_called()
@@ -0,0 +1,51 @@
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+
+from sdnsandbox.downsample import downsample, lttb_indices, min_max_indices
+
+
+class TestDownsample(TestCase):
+    series: pd.Series
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        values = np.sin(np.linspace(0, 20, 36000))
+        values[12345] = 50.0
+        values[23456] = -50.0
+        cls.series = pd.Series(values, index=pd.date_range('2020-12-13', periods=len(values), freq='s'))
+
+    def test_short_series_is_unchanged(self):
+        series = self.series[:100]
+        for method in ['minmax', 'lttb']:
+            self.assertIs(series, downsample(series, method, 640))
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            downsample(self.series, 'every-other')
+
+    def test_min_max_keeps_peaks(self):
+        downsampled = downsample(self.series, 'minmax', 640)
+        self.assertLessEqual(len(downsampled), 640)
+        self.assertTrue(downsampled.index.is_monotonic_increasing)
+        self.assertEqual(self.series.max(), downsampled.max())
+        self.assertEqual(self.series.min(), downsampled.min())
+        self.assertEqual(self.series.index[12345], downsampled.idxmax())
+
+    def test_min_max_skips_nans(self):
+        values = np.array([np.nan, 1.0, 5.0, np.nan, np.nan, np.nan, 2.0, np.nan])
+        self.assertEqual([1, 2, 6], list(min_max_indices(np.arange(8), values, 4)))
+
+    def test_lttb_keeps_ends_and_peaks(self):
+        downsampled = downsample(self.series, 'lttb', 640)
+        self.assertEqual(640, len(downsampled))
+        self.assertTrue(downsampled.index.is_monotonic_increasing)
+        self.assertEqual(self.series.index[0], downsampled.index[0])
+        self.assertEqual(self.series.index[-1], downsampled.index[-1])
+        self.assertEqual(self.series.max(), downsampled.max())
+        self.assertEqual(self.series.min(), downsampled.min())
+
+    def test_lttb_of_a_line(self):
+        x = np.arange(10)
+        self.assertEqual([0, 9], list(lttb_indices(x, 2.0 * x, 2)[[0, -1]]))
+        self.assertEqual(3, len(lttb_indices(x, 2.0 * x, 3)))
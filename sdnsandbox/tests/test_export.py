@@ -0,0 +1,80 @@
+from os.path import join as pj, getsize
+from tempfile import TemporaryDirectory
+from timeit import repeat as timeit
+from unittest import TestCase, skipUnless
+import numpy as np
+import pandas as pd
+
+from sdnsandbox.export import export_samples, read_exported_samples, samples_to_table
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+@skipUnless(pyarrow, "pyarrow is not installed, see requirements-export.txt")
+class TestExport(TestCase):
+    network_data = {'interfaces': {'1': {'num': 1, 'name': 's1-eth1', 'net_meaning': 'A-B'}},
+                    'switches': {}, 'switch_links': []}
+
+    @staticmethod
+    def make_samples(seconds, ports):
+        random = np.random.RandomState(0)
+        samples_df = pd.DataFrame(random.randint(0, 1250000, (seconds, ports)) / 125000.0,
+                                  columns=['port%d' % port for port in range(ports)],
+                                  index=pd.date_range('2020-12-13', periods=seconds, freq='s',
+                                                      name='unixSecondsUTC'))
+        samples_df.columns.name = 'ifIndex'
+        return samples_df
+
+    def test_arrow_round_trip(self):
+        samples_df = self.make_samples(100, 3)
+        with TemporaryDirectory() as temp_dir:
+            path = pj(temp_dir, 'samples.arrow')
+            export_samples(samples_df, path, 'arrow', self.network_data)
+            times, arrays, network_data = read_exported_samples(path)
+            self.assertEqual(self.network_data, network_data)
+            np.testing.assert_array_equal(samples_df.index.to_numpy(), times)
+            self.assertEqual(['port0', 'port1', 'port2'], list(arrays))
+            for name, values in arrays.items():
+                self.assertEqual(np.float32, values.dtype)
+                # a view of the mapped file
+                self.assertFalse(values.flags.owndata)
+                np.testing.assert_array_equal(samples_df[name].to_numpy(dtype=np.float32), values)
+            del times, arrays
+
+    def test_multiple_counters_and_parquet(self):
+        samples_df = pd.concat({'ifInOctets': self.make_samples(10, 2), 'ifOutOctets': self.make_samples(10, 2)},
+                               axis=1).swaplevel(axis=1).sort_index(axis=1)
+        table = samples_to_table(samples_df)
+        self.assertEqual(['unixSecondsUTC', 'port0-ifInOctets', 'port0-ifOutOctets', 'port1-ifInOctets',
+                          'port1-ifOutOctets'], table.column_names)
+        with TemporaryDirectory() as temp_dir:
+            export_samples(samples_df, pj(temp_dir, 'samples.parquet'), 'parquet')
+            parquet_table = pyarrow.parquet.read_table(pj(temp_dir, 'samples.parquet'))
+            self.assertEqual(table.column_names, parquet_table.column_names)
+        with self.assertRaises(ValueError):
+            export_samples(samples_df, pj(temp_dir, 'samples.csv'), 'csv')
+
+    def test_compare_to_hdf(self, seconds=36000, ports=150, repetitions=3):
+        samples_df = self.make_samples(seconds, ports)
+        with TemporaryDirectory() as temp_dir:
+            paths = {'hd5': pj(temp_dir, 'samples.hd5'), 'arrow': pj(temp_dir, 'samples.arrow'),
+                     'parquet': pj(temp_dir, 'samples.parquet')}
+            samples_df.to_hdf(paths['hd5'], key='samples')
+            export_samples(samples_df, paths['arrow'], 'arrow')
+            export_samples(samples_df, paths['parquet'], 'parquet')
+
+            def load_arrow():
+                times, arrays, _ = read_exported_samples(paths['arrow'])
+                # touch every value, as a consumer would
+                return sum(float(values.sum()) for values in arrays.values())
+
+            loaders = {'hd5': lambda: pd.read_hdf(paths['hd5'], key='samples').to_numpy().sum(),
+                       'arrow': load_arrow,
+                       'parquet': lambda: pyarrow.parquet.read_table(paths['parquet']).num_rows}
+            for name, path in paths.items():
+                time_res = timeit(loaders[name], number=1, repeat=repetitions)
+                print("{} size= {} load took= {:.10f} [sec]".format(name, getsize(path), min(time_res)))
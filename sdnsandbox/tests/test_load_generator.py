@@ -1,9 +1,49 @@
+import gzip
 import json
+import os
+import socket
+import subprocess
+import sys
+from collections import Counter
+from tempfile import TemporaryDirectory
+from os.path import join as pj
+from time import sleep, monotonic
 from unittest import TestCase
 
+import numpy as np
+
 from sdnsandbox.load_generator import DitgImixLoadGenerator, LoadGeneratorFactory, Protocol, DITGConfig, NpingConfig, \
     NpingUDPImixLoadGenerator, StaticDeltaDestinationCalculator, RoundRobinDestinationCalculator, IdentityPeriodShifter, \
-    HostIndexPeriodShifter
+    HostIndexPeriodShifter, NativeUDPImixLoadGenerator, Sender, SendersResults, TraceReplayLoadGenerator, \
+    TrafficMatrixDestinationCalculator, DestinationCalculatorFactory
+from sdnsandbox.schedule import LoadSchedule, SCHEDULE_FILENAME
+from sdnsandbox.topology import Switch, Link, ITZSwitch
+from sdnsandbox.trace_replay import write_trace
+from sdnsandbox.util import ChildExitWatcher
+
+
+class LocalHost(object):
+    """Stands for a mininet host, running its processes locally"""
+
+    def __init__(self, ip='127.0.0.1'):
+        self.ip = ip
+
+    def IP(self):
+        return self.ip
+
+    @staticmethod
+    def popen(*args, **kwargs):
+        return subprocess.Popen(*args, **kwargs)
+
+
+def receive_sizes(sock):
+    sizes = Counter()
+    sock.setblocking(False)
+    while True:
+        try:
+            sizes[len(sock.recv(65536))] += 1
+        except BlockingIOError:
+            return sizes
 
 
 class TestLoadGenerator(TestCase):
@@ -176,6 +216,107 @@ class TestLoadGenerator(TestCase):
         for period in range(6):
             self.assertEqual('10.0.0.3', dest_calc.calculate_destination(period, host_index, host_addresses))
 
+    def test_destinations_matrix(self):
+        host_addresses = ['10.0.0.%d' % i for i in range(1, 6)]
+        periods, host_indices = np.arange(12)[:, None], np.arange(5)[None, :]
+        for dest_calc in [RoundRobinDestinationCalculator(), StaticDeltaDestinationCalculator(),
+                          StaticDeltaDestinationCalculator(-2)]:
+            destinations = dest_calc.calculate_destinations(periods, host_indices, len(host_addresses))
+            self.assertEqual((12, 5), destinations.shape)
+            self.assertFalse((destinations == host_indices).any())
+            for period in range(12):
+                for host_index in range(5):
+                    self.assertEqual(host_addresses[destinations[period, host_index]],
+                                     dest_calc.calculate_destination(period, host_index, host_addresses))
+
+    def test_gravity_traffic_matrix(self):
+        # a star around switch 7, with a duplicate (reversed) link that does not add to its degree
+        switches = {switch_id: Switch(switch_id, 'switch%d' % switch_id) for switch_id in [7, 3, 5, 9]}
+        links = [Link(7, 3, '1ms'), Link(3, 7, '1ms'), Link(7, 5, '1ms'), Link(7, 9, '1ms')]
+        dest_calc = DestinationCalculatorFactory.create({'strategy': 'traffic_matrix'})
+        self.assertIsInstance(dest_calc, TrafficMatrixDestinationCalculator)
+        dest_calc.use_topology(switches, links)
+        shares = dest_calc.calculate_shares(2, 4)
+        self.assertEqual((8, 4), shares.shape)
+        np.testing.assert_allclose(np.ones(8), np.asarray(shares.sum(axis=1)).ravel())
+        self.assertEqual(0, shares.diagonal().sum())
+        # by the sorted switch IDs, host 2 is switch 7, which the others send the most to
+        np.testing.assert_allclose([0.2, 0.6, 0.2], shares[1].data)
+        np.testing.assert_array_equal([0, 2, 3], shares[1].indices)
+        self.assertEqual([2, 2, 0, 2], dest_calc.calculate_destinations(np.arange(2)[:, None],
+                                                                        np.arange(4)[None, :], 4)[0].tolist())
+        with self.assertRaises(ValueError):
+            dest_calc.calculate_shares(2, 5)
+        # calculated once per topology
+        self.assertIs(dest_calc.calculate_traffic(4), dest_calc.calculate_traffic(4))
+        traffic = dest_calc.traffic
+        dest_calc.use_topology(switches, links[:2])
+        self.assertIsNot(traffic, dest_calc.traffic)
+        # switches 5 and 9 have no links left, so their hosts send to all the others uniformly
+        shares = dest_calc.calculate_shares(1, 4)
+        np.testing.assert_allclose(np.ones(4), np.asarray(shares.sum(axis=1)).ravel())
+        np.testing.assert_allclose([1 / 3] * 3, shares[1].data)
+
+    def test_gravity_traffic_matrix_distances(self):
+        switches = {0: ITZSwitch(0, 'a', 0.0, 0.0), 1: ITZSwitch(1, 'b', 0.0, 1.0), 2: ITZSwitch(2, 'c', 0.0, 10.0)}
+        dest_calc = TrafficMatrixDestinationCalculator(weight='uniform', distance_exponent=1.0, max_destinations=1)
+        dest_calc.use_topology(switches, [])
+        shares = dest_calc.calculate_shares(1, 3)
+        # the nearest switch only
+        self.assertEqual([1, 0, 1], shares.indices.tolist())
+        self.assertEqual([1.0, 1.0, 1.0], shares.data.tolist())
+        with self.assertRaises(ValueError):
+            dest_calc.use_topology({switch_id: Switch(switch_id, switch.name)
+                                    for switch_id, switch in switches.items()}, [])
+
+    def test_traffic_matrix_by_periods(self):
+        matrix = [[[0, 1, 3], [1, 0, 0], [0, 0, 0]],
+                  [[0, 0, 0], [2, 0, 2], [5, 0, 0]]]
+        dest_calc = DestinationCalculatorFactory.create({'strategy': 'traffic_matrix', 'model': 'matrix',
+                                                         'matrix': matrix})
+        with TemporaryDirectory() as matrix_dir:
+            np.save(pj(matrix_dir, 'matrix.npy'), np.array(matrix))
+            loaded_calc = TrafficMatrixDestinationCalculator(model='matrix', matrix_path=pj(matrix_dir, 'matrix.npy'))
+            self.assertEqual((dest_calc.calculate_shares(2, 3) != loaded_calc.calculate_shares(2, 3)).nnz, 0)
+        generator = LoadGeneratorFactory().create({"type": "NATIVE-UDP-IMIX", "periods": 2,
+                                                   "period_duration_seconds": 1, "pps_base_level": 120,
+                                                   "pps_amplitude": 0, "pps_wavelength": 4,
+                                                   "destination_calculator": {'strategy': 'traffic_matrix',
+                                                                              'model': 'matrix', 'matrix': matrix}})
+        schedule = generator.create_schedule(3)
+        addresses = ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+        flows = schedule.host_flows(0, 0, addresses)
+        self.assertEqual(['10.0.0.2', '10.0.0.3'], [dest for dest, _ in flows])
+        self.assertAlmostEqual(sum(schedule.host_rates(0, 0).values()) / 4, sum(flows[0][1].values()))
+        self.assertEqual([], schedule.host_flows(0, 2, addresses))
+        self.assertEqual(['10.0.0.1', '10.0.0.3'], [dest for dest, _ in schedule.host_flows(1, 1, addresses)])
+        # only the native UDP engine sends all the destinations of a full matrix
+        full_matrix = {'strategy': 'traffic_matrix', 'model': 'matrix', 'matrix': matrix, 'max_destinations': None}
+        with self.assertRaises(ValueError):
+            LoadGeneratorFactory().create({"type": "NPING-UDP-IMIX", "disable_cmd_ensure": True, "periods": 2,
+                                           "period_duration_seconds": 1, "pps_base_level": 120,
+                                           "pps_amplitude": 0, "pps_wavelength": 4,
+                                           "destination_calculator": full_matrix})
+        for model_conf in [{'model': 'unknown'}, {'weight': 'unknown'}, {'model': 'matrix'},
+                           {'max_destinations': 0}]:
+            with self.assertRaises(ValueError):
+                DestinationCalculatorFactory.create(dict(model_conf, strategy='traffic_matrix'))
+
+    def test_ditg_schedule(self):
+        generator = LoadGeneratorFactory().create({"type": "DITG-IMIX", "disable_cmd_ensure": True, "protocol": "UDP",
+                                                   "periods": 1200, "period_duration_seconds": 30,
+                                                   "pps_base_level": 150, "pps_amplitude": 100,
+                                                   "pps_wavelength": 25})
+        schedule = generator.create_schedule(4)
+        self.assertEqual(['send_40bytes', 'send_normal', 'send_1500B'], schedule.buckets)
+        self.assertEqual((1200, 4, 3), schedule.rates.shape)
+        # period 5 (of 25) is near the sine's peak, 150 + int(100 * 0.951) pps split between the 4 hosts
+        self.assertEqual({'send_40bytes': 18, 'send_normal': 33, 'send_1500B': 9}, schedule.host_rates(5, 2))
+        self.assertEqual({'send_40bytes': '-a 10.0.0.1 -T UDP -t 30000 -c 40 -C 18',
+                          'send_normal': '-a 10.0.0.1 -T UDP -t 30000 -n 576, 190 -C 33',
+                          'send_1500B': '-a 10.0.0.1 -T UDP -t 30000 -c 1472 -C 9'},
+                         generator.calculate_send_opts('10.0.0.1', schedule.host_rates(5, 2)))
+
     def test_identity_period_shifter(self):
         period_shifter = IdentityPeriodShifter()
         self.assertEqual(1000, period_shifter.shift_period(1000, 1))
@@ -189,6 +330,245 @@ class TestLoadGenerator(TestCase):
         period_shifter = HostIndexPeriodShifter(2)
         self.assertEqual(1002, period_shifter.shift_period(1000, 1))
         self.assertEqual(1200, period_shifter.shift_period(1000, 100))
+    def test_udp_engine_rates_and_reports(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as receiver:
+            receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 21)
+            receiver.bind(('127.0.0.1', 0))
+            port = receiver.getsockname()[1]
+            engine = subprocess.Popen([sys.executable, '-m', 'sdnsandbox.udp_engine', 'send'],
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+            engine.stdin.write(json.dumps({'period': 0, 'dest': '127.0.0.1', 'port': port,
+                                           'rates': {'40': 200, '1472': 100}}) + '\n')
+            engine.stdin.flush()
+            sleep(1)
+            engine.stdin.write(json.dumps({'period': 1, 'dest': '127.0.0.1', 'port': port,
+                                           'rates': {'576': 50}}) + '\n')
+            engine.stdin.flush()
+            first_report = json.loads(engine.stdout.readline())
+            sleep(0.5)
+            engine.stdin.write('{"stop": true}\n')
+            engine.stdin.flush()
+            second_report = json.loads(engine.stdout.readline())
+            self.assertEqual(0, engine.wait(5))
+            engine.stdin.close()
+            engine.stdout.close()
+            sizes = receive_sizes(receiver)
+        self.assertEqual(0, first_report['period'])
+        self.assertAlmostEqual(200, first_report['sent']['40'], delta=20)
+        self.assertAlmostEqual(100, first_report['sent']['1472'], delta=10)
+        self.assertAlmostEqual(300, first_report['pps'], delta=30)
+        self.assertEqual(1, second_report['period'])
+        self.assertAlmostEqual(25, second_report['sent']['576'], delta=5)
+        self.assertEqual({40: first_report['sent']['40'], 1472: first_report['sent']['1472'],
+                          576: second_report['sent']['576']}, dict(sizes))
+
+    def test_counting_receivers(self):
+        generator = LoadGeneratorFactory().create({"type": "NPING-UDP-IMIX", "disable_cmd_ensure": True, "periods": 1,
+                                                   "period_duration_seconds": 1, "pps_base_level": 150,
+                                                   "pps_amplitude": 100, "pps_wavelength": 25})
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as free_port:
+            free_port.bind(('127.0.0.1', 0))
+            generator.config.listen_port = free_port.getsockname()[1]
+        with TemporaryDirectory() as logs_path:
+            generator.start_receivers([LocalHost()], logs_path)
+            # let the receiver bind before sending
+            sleep(1)
+            for src, packets, size in [('127.0.0.2', 30, 100), ('127.0.0.3', 10, 1472)]:
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+                    sender.bind((src, 0))
+                    for _ in range(packets):
+                        sender.sendto(bytes(size), ('127.0.0.1', generator.config.listen_port))
+            sleep(0.2)
+            generator.stop_receivers()
+            received_df = generator.read_received_counts()
+        self.assertEqual(['dst', 'src', 'packets', 'bytes'], list(received_df.columns))
+        self.assertEqual('time', received_df.index.name)
+        self.assertTrue(received_df.index.is_monotonic_increasing)
+        totals = received_df.groupby(['dst', 'src'])[['packets', 'bytes']].sum()
+        self.assertEqual({('127.0.0.1', '127.0.0.2'): [30, 3000], ('127.0.0.1', '127.0.0.3'): [10, 14720]},
+                         {key: row.tolist() for key, row in totals.iterrows()})
+
+    def test_ditg_sender_supervision(self):
+        generator = LoadGeneratorFactory().create({"type": "DITG-IMIX", "disable_cmd_ensure": True, "protocol": "UDP",
+                                                   "periods": 1, "period_duration_seconds": 1, "pps_base_level": 150,
+                                                   "pps_amplitude": 100, "pps_wavelength": 25,
+                                                   "rerun_backoff_seconds": 0.1, "max_reruns": 2})
+        host = LocalHost()
+        with TemporaryDirectory() as temp_dir, ChildExitWatcher() as watcher:
+            crash_once = ['sh', '-c', 'if [ -e {0} ]; then sleep 0.2; else touch {0}; exit 3; fi'.format(
+                pj(temp_dir, 'crashed'))]
+            for cmd in [crash_once, ['true'], ['sleep', '5'], ['false']]:
+                logfile = generator.log_sink.open(pj(temp_dir, 'sender.log'), cmd[0])
+                generator.senders.append(Sender(host, generator.run_sender(host, cmd, logfile), monotonic(), logfile))
+            crashing = generator.senders[0].process
+            start = monotonic()
+            # the always crashing sender is run again twice, 0.1 and then 0.2 seconds after crashing
+            self.assertEqual(3, generator.supervise_senders(watcher, monotonic() + 1))
+            self.assertGreaterEqual(monotonic() - start, 1)
+            self.assertEqual([1, 0, 0, 2], [sender.reruns for sender in generator.senders])
+            self.assertGreaterEqual(generator.senders[3].start_time - start, 0.3)
+            rerun = generator.senders[0].process
+            self.assertIsNot(crashing, rerun)
+            self.assertEqual(0, rerun.wait())
+            self.assertIsNone(generator.senders[2].process.poll())
+            for sender in generator.senders:
+                sender.process.kill()
+                sender.process.wait()
+                sender.logfile.close()
+            generator.stop_receivers()
+            with gzip.open(pj(temp_dir, 'sender.log.gz'), 'rt') as log_file:
+                log_lines = log_file.read().splitlines()
+        # the crashed sender's header was written again for its rerun, on the same stream
+        self.assertEqual(2, len([line for line in log_lines
+                                 if line.startswith("[sh] ") and "Starting ITGSend" in line]))
+        self.assertEqual(1, len([line for line in log_lines if line.startswith("[true] ")]))
+
+    def test_nping_hosts_share_one_scheduler(self):
+        class LocalNpingLoadGenerator(NpingUDPImixLoadGenerator):
+            commands = {'send_40bytes': ['false'], 'send_1500B': ['sleep', '5']}
+
+            def run_host_senders(self, host, period, flows, logs_path):
+                self.started_rates.append((host.IP(), flows[0][1]['send_40bytes']))
+                return super().run_host_senders(host, period, flows, logs_path)
+
+            @staticmethod
+            def run_sender(host, nping_send_cmd, logfile):
+                name = next(name for name in ['send_40bytes', 'send_1500B', 'send_normal'] if name in logfile.name)
+                return host.popen(LocalNpingLoadGenerator.commands.get(name, ['true']))
+
+        generator = LocalNpingLoadGenerator(NpingConfig(periods=2, period_duration_seconds=1, pps_base_level=150,
+                                                        pps_amplitude=100, pps_wavelength=25, disable_cmd_ensure=True,
+                                                        period_shifter=HostIndexPeriodShifter()))
+        generator.started_rates = []
+        hosts = [LocalHost('10.0.0.%d' % i) for i in range(1, 4)]
+        with TemporaryDirectory() as logs_path:
+            start = monotonic()
+            generator.run_senders(hosts, logs_path)
+            self.assertLess(monotonic() - start, 2.5)
+            schedule = LoadSchedule.load(pj(logs_path, SCHEDULE_FILENAME))
+        # each host's rates from the saved schedule, all the hosts' first periods running before any second one
+        for period in range(2):
+            self.assertEqual({(host.IP(), schedule.host_rates(period, host_index)['send_40bytes'])
+                              for host_index, host in enumerate(hosts)},
+                             set(generator.started_rates[period * 3:(period + 1) * 3]))
+        # the hosts' periods are shifted by their index
+        self.assertEqual(schedule.rates[1, 0].tolist(), schedule.rates[0, 1].tolist())
+        self.assertEqual({host.IP(): SendersResults(success=6, timeout_terminated=2, failure=2) for host in hosts},
+                         generator.host_results)
+        self.assertEqual([], generator.senders)
+
+    def test_nping_sender_rates(self):
+        class ReportingNpingLoadGenerator(NpingUDPImixLoadGenerator):
+            @staticmethod
+            def run_sender(host, nping_send_cmd, logfile):
+                # nping's summary, of sending half of the packets over the period
+                count = int(nping_send_cmd.split('--count ')[1].split()[0])
+                summary = 'Raw packets sent: %d (%dB) | Rcvd: 0 (0B) | Lost: %d (100.00%%)\n' \
+                          'Nping done: 1 IP address pinged in 1.00 seconds' % (count // 2, count * 10, count // 2)
+                return host.popen(['echo', summary], stdout=logfile)
+
+        generator = ReportingNpingLoadGenerator(NpingConfig(periods=2, period_duration_seconds=1, pps_base_level=150,
+                                                            pps_amplitude=100, pps_wavelength=25,
+                                                            disable_cmd_ensure=True))
+        hosts = [LocalHost('10.0.0.%d' % i) for i in range(1, 3)]
+        with TemporaryDirectory() as logs_path:
+            generator.run_senders(hosts, logs_path)
+            generator.stop_receivers()
+            schedule = LoadSchedule.load(pj(logs_path, SCHEDULE_FILENAME))
+        rates_df = generator.read_sender_rates()
+        self.assertEqual(2 * 2 * 5, len(rates_df))
+        for _, row in rates_df.iterrows():
+            target_pps = int(schedule.host_rates(row['period'], int(row['host'][-1]) - 1)[row['bucket']])
+            self.assertEqual(target_pps, row['target_pps'])
+            self.assertEqual(target_pps // 2, row['achieved_pps'])
+            self.assertEqual(target_pps * 10, row['bytes'])
+
+    def test_native_load_generator(self):
+        generator_conf = {"type": "NATIVE-UDP-IMIX", "periods": 2, "period_duration_seconds": 1,
+                          "pps_base_level": 100, "pps_amplitude": 50, "pps_wavelength": 4, "min_allowed_rate": 1}
+        generator = LoadGeneratorFactory().create(generator_conf)
+        self.assertIsInstance(generator, NativeUDPImixLoadGenerator)
+        schedule = generator.create_schedule(2)
+        self.assertEqual(['40', '448', '576', '704', '1472'], schedule.buckets)
+        self.assertAlmostEqual(150, sum(schedule.host_rates(1, 0).values()))
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as receiver, TemporaryDirectory() as logs_path:
+            receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 21)
+            receiver.bind(('127.0.0.1', 0))
+            generator.config.listen_port = receiver.getsockname()[1]
+            generator.run_senders([LocalHost(), LocalHost()], logs_path)
+            sizes = receive_sizes(receiver)
+        self.assertEqual([(0, '127.0.0.1'), (0, '127.0.0.1'), (1, '127.0.0.1'), (1, '127.0.0.1')],
+                         [(report['period'], report['host']) for report in generator.reports])
+        self.assertEqual([100, 100, 150, 150], [report['target_pps'] for report in generator.reports])
+        self.assertEqual(sum(sum(report['sent'].values()) for report in generator.reports), sum(sizes.values()))
+        self.assertEqual([40, 448, 576, 704, 1472], sorted(sizes))
+        rates_df = generator.read_sender_rates()
+        # both hosts are 127.0.0.1, so their rates are summed
+        self.assertEqual(2 * 5, len(rates_df))
+        self.assertEqual(sum(sum(report['sent'].values()) for report in generator.reports),
+                         int((rates_df['bytes'] / rates_df['bucket'].astype(int)).sum()))
+        for report in generator.reports:
+            self.assertAlmostEqual(report['target_pps'], report['pps'], delta=report['target_pps'] * 0.1)
+
+    def test_native_load_generator_hung_engine(self):
+        generator = LoadGeneratorFactory().create({"type": "NATIVE-UDP-IMIX", "periods": 2,
+                                                   "period_duration_seconds": 1,
+                                                   "pps_base_level": 100, "pps_amplitude": 0, "pps_wavelength": 4})
+        # an engine that takes its commands but never reports nor exits
+        generator.engine_cmd = lambda mode, *args: ['sleep', '30']
+        with TemporaryDirectory() as logs_path:
+            start = monotonic()
+            generator.run_senders([LocalHost(), LocalHost()], logs_path)
+            elapsed = monotonic() - start
+        # the periods, and waiting a period for the last reports and another for the engines to exit when stopped
+        self.assertLess(elapsed, 2 + 1 + 1 + 0.5)
+        self.assertEqual([], generator.reports)
+        rates_df = generator.read_sender_rates()
+        self.assertEqual(2 * 5, len(rates_df))
+        self.assertTrue(rates_df['achieved_pps'].isna().all())
+        self.assertEqual([], generator.senders)
+
+    def test_trace_replay_load_generator(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as receiver, TemporaryDirectory() as logs_path:
+            receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 21)
+            receiver.bind(('127.0.0.1', 0))
+            trace_path = pj(logs_path, 'trace.bin')
+            # 200 packets a second over 1.5 seconds, between endpoints 0-9 mapped onto the 2 hosts
+            endpoints = np.arange(300)
+            write_trace(trace_path, times_ns=endpoints * 5000000, srcs=endpoints % 10, dsts=(endpoints + 1) % 10,
+                        sizes=np.where(endpoints % 3, 40, 1472))
+            generator = LoadGeneratorFactory().create({"type": "TRACE-REPLAY", "trace_path": trace_path,
+                                                       "listen_port": receiver.getsockname()[1]})
+            self.assertIsInstance(generator, TraceReplayLoadGenerator)
+            generator.run_senders([LocalHost(), LocalHost()], logs_path)
+            sizes = receive_sizes(receiver)
+            # the hosts' traces are kept next to the trace, for the next replay on as many hosts
+            self.assertEqual(['trace-0.bin', 'trace-1.bin'], sorted(os.listdir(trace_path + '.hosts-2')))
+        self.assertEqual({40: 200, 1472: 100}, dict(sizes))
+        self.assertEqual(300, sum(report['sent'] for report in generator.reports))
+        self.assertEqual({0, 1}, {report['second'] for report in generator.reports})
+        self.assertEqual(4, len(generator.reports))
+        for report in generator.reports:
+            self.assertLess(report['max_lag'], 0.1)
+        self.assertEqual([], generator.senders)
+
+    def test_trace_replay_killed_past_the_deadline(self):
+        with TemporaryDirectory() as logs_path:
+            trace_path = pj(logs_path, 'trace.bin')
+            # a packet every 10ms over 10 seconds, to a port nothing listens on
+            endpoints = np.arange(1000)
+            write_trace(trace_path, times_ns=endpoints * 10000000, srcs=endpoints % 2, dsts=(endpoints + 1) % 2,
+                        sizes=np.full(1000, 40))
+            generator = LoadGeneratorFactory().create({"type": "TRACE-REPLAY", "trace_path": trace_path,
+                                                       "listen_port": 9, "startup_seconds": 0.5,
+                                                       "overrun_seconds": -9.0})
+            start = monotonic()
+            generator.run_senders([LocalHost(), LocalHost()], logs_path)
+            # the replayers are killed a second into the replay, rather than waited for until its end
+            self.assertLess(monotonic() - start, 5)
+        self.assertLess(sum(report['sent'] for report in generator.reports), 1000)
+        self.assertEqual([], generator.senders)
+
     # TODO: complete tests
     # def test_start_receivers(self):
     #     self.fail()
@@ -0,0 +1,81 @@
+import gzip
+import os
+import resource
+import subprocess
+from os.path import join as pj
+from tempfile import TemporaryDirectory
+from time import sleep
+from unittest import TestCase
+
+from sdnsandbox.log_sink import LogSink, LogSinkConfig, RotatingGzipFile, raise_open_files_limit
+
+
+def read_log(path):
+    with gzip.open(path, 'rt') as log_file:
+        return log_file.read().splitlines()
+
+
+class TestLogSink(TestCase):
+    def test_children_share_a_log_file(self):
+        sink = LogSink(LogSinkConfig(tail_lines=2))
+        with TemporaryDirectory() as logs_path:
+            log_path = pj(logs_path, 'sender-10.0.0.1.log')
+            streams = [sink.open(log_path, name) for name in ['send_40bytes', 'send_1500B']]
+            streams[0].write("header\n")
+            children = [subprocess.Popen(['sh', '-c', 'echo one; echo two; printf three'], stdout=streams[0]),
+                        subprocess.Popen(['sh', '-c', 'echo error >&2'], stderr=streams[1])]
+            for child, stream in zip(children, streams):
+                self.assertEqual(0, child.wait())
+                stream.close()
+            other_stream = sink.open(pj(logs_path, 'sender-10.0.0.2.log'), 'send_40bytes')
+            other_stream.write("other host\n")
+            other_stream.close()
+            sink.close()
+            lines = read_log(log_path + '.gz')
+            self.assertEqual(["[send_40bytes] other host"], read_log(pj(logs_path, 'sender-10.0.0.2.log.gz')))
+        self.assertEqual(["[send_40bytes] header", "[send_40bytes] one", "[send_40bytes] two",
+                          "[send_40bytes] three"], [line for line in lines if line.startswith("[send_40bytes]")])
+        self.assertEqual(["[send_1500B] error"], [line for line in lines if line.startswith("[send_1500B]")])
+        # only the last lines are kept in memory
+        self.assertEqual(["two", "three"], streams[0].tail())
+
+    def test_close_without_waiting_for_children(self):
+        sink = LogSink()
+        with TemporaryDirectory() as logs_path:
+            stream = sink.open(pj(logs_path, 'receiver-10.0.0.1.log'), 'receiver')
+            child = subprocess.Popen(['sh', '-c', 'echo started; sleep 5'], stdout=stream)
+            sleep(0.2)
+            sink.close()
+            child.kill()
+            child.wait()
+            stream.close()
+            self.assertEqual(["[receiver] started"], read_log(pj(logs_path, 'receiver-10.0.0.1.log.gz')))
+            # the sink starts again when a stream is opened after closing it, appending to the same file
+            stream = sink.open(pj(logs_path, 'receiver-10.0.0.1.log'), 'receiver')
+            stream.write("restarted\n")
+            stream.close()
+            sink.close()
+            self.assertEqual(["[receiver] started", "[receiver] restarted"],
+                             read_log(pj(logs_path, 'receiver-10.0.0.1.log.gz')))
+
+    def test_raise_open_files_limit(self):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or hard < 2:
+            self.skipTest("The hard limit of open files can't be tested against")
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard // 2, hard))
+        try:
+            raise_open_files_limit()
+            self.assertEqual((hard, hard), resource.getrlimit(resource.RLIMIT_NOFILE))
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    def test_rotation(self):
+        with TemporaryDirectory() as logs_path:
+            log_file = RotatingGzipFile(pj(logs_path, 'sender.log'), max_bytes=10, backup_count=2, compress_level=6)
+            for index in range(5):
+                log_file.write(b'line %d...\n' % index)
+            log_file.close()
+            self.assertEqual(['sender.log.1.gz', 'sender.log.2.gz', 'sender.log.gz'], sorted(os.listdir(logs_path)))
+            self.assertEqual(['line 4...'], read_log(pj(logs_path, 'sender.log.gz')))
+            self.assertEqual(['line 3...'], read_log(pj(logs_path, 'sender.log.1.gz')))
+            self.assertEqual(['line 2...'], read_log(pj(logs_path, 'sender.log.2.gz')))
@@ -0,0 +1,68 @@
+import unittest
+from multiprocessing import Process
+from urllib.request import urlopen
+
+from sdnsandbox.metrics import MetricsRegistry, MetricsServer
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_render_prometheus_text_format(self):
+        registry = MetricsRegistry()
+        registry.counter('test_total', 'A test counter').inc(3)
+        registry.gauge('test_gauge', 'A test gauge').set(1.5)
+        labeled = registry.labeled_gauge('test_rate', 'A labeled test gauge', 'interface')
+        labeled.set_many({'b"2': 2, 'a-eth1@b-eth2': float('nan')})
+        self.assertEqual('# HELP test_total A test counter\n'
+                         '# TYPE test_total counter\n'
+                         'test_total 3.0\n'
+                         '# HELP test_gauge A test gauge\n'
+                         '# TYPE test_gauge gauge\n'
+                         'test_gauge 1.5\n'
+                         '# HELP test_rate A labeled test gauge\n'
+                         '# TYPE test_rate gauge\n'
+                         'test_rate{interface="a-eth1@b-eth2"} NaN\n'
+                         'test_rate{interface="b\\"2"} 2.0\n',
+                         registry.render())
+        # registering again (e.g. reloading the module that did) returns the registered metric
+        self.assertIs(labeled, registry.labeled_gauge('test_rate', 'Registered twice', 'interface'))
+        self.assertEqual(3, registry.counter('test_total', 'Registered twice').get())
+        with self.assertRaises(ValueError):
+            registry.counter('test_gauge', 'Registered as a gauge')
+        with self.assertRaises(ValueError):
+            registry.labeled_gauge('test_rate', 'Registered by another label', 'host')
+
+    def test_counters_count_forked_processes(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('test_total', 'A test counter')
+        gauge = registry.gauge('test_gauge', 'A test gauge')
+
+        def work():
+            for _ in range(100):
+                counter.inc()
+                gauge.inc()
+
+        workers = [Process(target=work) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(400, counter.get())
+        gauge.dec(100)
+        self.assertEqual(300, gauge.get())
+
+    def test_server_serves_metrics(self):
+        registry = MetricsRegistry()
+        registry.counter('test_total', 'A test counter').inc()
+        server = MetricsServer(registry, port=0)
+        server.start()
+        try:
+            with urlopen('http://127.0.0.1:%d/metrics' % server.port) as response:
+                self.assertEqual(MetricsServer.content_type, response.headers['Content-Type'])
+                self.assertEqual(registry.render(), response.read().decode('utf-8'))
+        finally:
+            server.stop()
+        self.assertIsNone(server.httpd)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,21 @@
 import json
+import socket
+import struct
 import unittest
+from os import listdir, makedirs
 from os.path import abspath, dirname, join as pj
+from io import StringIO
+from tempfile import TemporaryDirectory
+from time import monotonic, sleep
 from timeit import repeat as timeit
 import pandas as pd
 from numpy import datetime64
 
-from sdnsandbox.monitor import SFlowMonitor, MonitorFactory
+from sdnsandbox.monitor import SFlowMonitor, MonitorFactory, SFlowSamplesPivoter, SFlowStreamIngestor, \
+    SFlowNativeMonitor, SFlowNativeConfig, SFlowV5Decoder, SFlowCollectorProtocol, SampleColumns, pivot_samples, \
+    SysfsMonitor, SysfsCounterPoller
+from sdnsandbox.archive import RawSamplesWriter
+from sdnsandbox.stats import OnlineStatistics
 
 
 class MonitorTestCase(unittest.TestCase):
@@ -44,10 +54,12 @@ class MonitorTestCase(unittest.TestCase):
 
     def setUp(self):
         self.sflow_csv.seek(0)
+        self.big_sflow_csv.seek(0)
 
     @classmethod
     def tearDownClass(cls):
         cls.sflow_csv.close()
+        cls.big_sflow_csv.close()
 
     @staticmethod
     def are_dfs_equal(df1, df2):
@@ -77,6 +89,9 @@ class MonitorTestCase(unittest.TestCase):
         self.assertEqual(1048576, monitor.config.normalize_by)
         self.assertEqual("sflow.csv", monitor.config.csv_filename)
         self.assertEqual("git", monitor.config.sflowtool_cmd)
+        # the samples are written during the run by default
+        self.assertTrue(monitor.streaming)
+        self.assertIsNone(monitor.config.streaming)
 
     def test_get_samples_no_normalization_pandas(self):
         samples_df = SFlowMonitor.get_samples_pandas(self.sflow_csv,
@@ -106,6 +121,98 @@ class MonitorTestCase(unittest.TestCase):
                                               normalize_by=1000)
         self.assertTrue(self.are_dfs_equal(self.expected_normalized_samples, samples_df))
 
+    def test_get_samples_no_normalization_numpy(self):
+        samples_df = SFlowMonitor.get_samples_numpy(self.sflow_csv,
+                                                    self.keys,
+                                                    self.expected_interfaces,
+                                                    normalize_by=None)
+        self.assertTrue(self.are_dfs_equal(self.expected_samples, samples_df))
+
+    def test_get_samples_with_normalization_numpy(self):
+        # a tiny block size makes lines cross the block boundaries
+        samples_df = SFlowMonitor.get_samples_numpy(self.sflow_csv,
+                                                    self.keys,
+                                                    self.expected_interfaces,
+                                                    normalize_by=1000,
+                                                    block_bytes=7)
+        self.assertTrue(self.are_dfs_equal(self.expected_normalized_samples, samples_df))
+
+    def test_sflow_monitor_engines(self):
+        monitor = MonitorFactory().create({"type": "sflow", "sflowtool_cmd": "git", "engine": "python"})
+        self.assertEqual(SFlowMonitor.get_samples, monitor.samples_processor)
+        monitor = MonitorFactory().create({"type": "sflow", "sflowtool_cmd": "git", "pandas_processing": False})
+        self.assertEqual(SFlowMonitor.get_samples, monitor.samples_processor)
+        monitor = MonitorFactory().create({"type": "sflow", "sflowtool_cmd": "git", "engine": "numpy"})
+        samples_df = monitor.samples_processor(self.sflow_csv, self.keys, self.expected_interfaces, normalize_by=None)
+        self.assertTrue(self.are_dfs_equal(self.expected_samples, samples_df))
+        with self.assertRaises(ValueError):
+            MonitorFactory().create({"type": "sflow", "sflowtool_cmd": "git", "engine": "fortran"})
+
+    def test_get_samples_multiple_counters_numpy(self):
+        # a second, 32 bit, counter which starts right before wrapping around
+        lines = []
+        for line in self.sflow_csv:
+            when, where, what = line.strip().split(',')
+            lines.append('%s,%s,%s,%d\n' % (when, where, what, (2 ** 32 - 5000 + int(what)) % 2 ** 32))
+        keys = self.keys[:2] + ['ifInOctets', 'ifInUcastPkts']
+        samples_df = SFlowMonitor.get_samples_numpy(StringIO(''.join(lines)), keys, self.expected_interfaces,
+                                                    normalize_by=[1000, 1])
+        self.assertEqual([(port, counter) for port in ['mean41', 'mean43', 'mean45'] for counter in keys[2:]],
+                         list(samples_df.columns))
+        self.assertTrue(self.are_dfs_equal(self.expected_normalized_samples.rename_axis('ifIndex', axis=1),
+                                           samples_df.xs('ifInOctets', axis=1, level='counter')))
+        self.assertTrue(self.are_dfs_equal(self.expected_samples.rename_axis('ifIndex', axis=1),
+                                           samples_df.xs('ifInUcastPkts', axis=1, level='counter')))
+
+    def test_parse_samples_block_rejects_other_lines(self):
+        self.assertEqual([[1, 2, 3], [4, 5, 6]], SFlowMonitor.parse_samples_block('1,2,3\n4,5,6\n').tolist())
+        self.assertEqual((0, 3), SFlowMonitor.parse_samples_block('').shape)
+        for text in ['1,2,3\nsflowtool warning\n4,5,6\n', '1,2,3\n4,5\n', '1,2,3\n4,5,6,7\n', '1,2,3,4\n']:
+            with self.assertRaises(ValueError):
+                SFlowMonitor.parse_samples_block(text)
+
+    def test_create_sflow_monitor_with_multiple_counters(self):
+        monitor = MonitorFactory().create({"type": "sflow", "sflowtool_cmd": "git",
+                                           "data_keys": ["ifInOctets", "ifOutOctets", "ifInDiscards"],
+                                           "normalize_by_key": {"ifInDiscards": 1}})
+        self.assertEqual(["ifInOctets", "ifOutOctets", "ifInDiscards"], monitor.sflow_keys_to_monitor[2:])
+        self.assertEqual([125000.0, 125000.0, 1], monitor.normalize_by)
+        self.assertEqual("numpy", monitor.config.engine)
+        self.assertFalse(monitor.streaming)
+        with self.assertRaises(ValueError):
+            MonitorFactory().create({"type": "sflow", "sflowtool_cmd": "git", "streaming": True,
+                                     "data_keys": ["ifInOctets", "ifOutOctets"]})
+
+    def test_compare_numpy_version(self, repetitions=10):
+        time_res = timeit(lambda: SFlowMonitor.get_samples_pandas(self.big_sflow_csv,
+                                                                  self.keys,
+                                                                  self.full_interfaces,
+                                                                  normalize_by=1000),
+                          setup=lambda: self.big_sflow_csv.seek(0),
+                          number=1,
+                          repeat=repetitions)
+        self.big_sflow_csv.seek(0)
+        pandas_samples_df = SFlowMonitor.get_samples_pandas(self.big_sflow_csv,
+                                                            self.keys,
+                                                            self.full_interfaces,
+                                                            normalize_by=1000)
+        print("pandas took= {:.10f} [sec]".format(sum(time_res)))
+
+        time_res = timeit(lambda: SFlowMonitor.get_samples_numpy(self.big_sflow_csv,
+                                                                 self.keys,
+                                                                 self.full_interfaces,
+                                                                 normalize_by=1000),
+                          setup=lambda: self.big_sflow_csv.seek(0),
+                          number=1,
+                          repeat=repetitions)
+        self.big_sflow_csv.seek(0)
+        numpy_samples_df = SFlowMonitor.get_samples_numpy(self.big_sflow_csv,
+                                                          self.keys,
+                                                          self.full_interfaces,
+                                                          normalize_by=1000)
+        print("numpy took= {:.10f} [sec]".format(sum(time_res)))
+        self.assertTrue(self.are_dfs_equal(pandas_samples_df, numpy_samples_df))
+
     def test_compare_both_versions(self, repetitions=10):
         time_res = timeit(lambda: SFlowMonitor.get_samples(self.big_sflow_csv,
                                                            self.keys,
@@ -136,6 +243,218 @@ class MonitorTestCase(unittest.TestCase):
         print("pandas took= {:.10f} [sec]".format(sum(time_res)))
         self.assertTrue(self.are_dfs_equal(manual_samples_df, pandas_samples_df))
 
+    def test_pivoter_matches_batch_processing_for_any_chunking(self):
+        samples = SFlowStreamIngestor.parse_chunk(self.sflow_csv.readlines(), self.keys)
+        for chunk_size in [1, 50, 86, 100, 1000]:
+            pivoter = SFlowSamplesPivoter(self.keys, self.expected_interfaces, normalize_by=1000, hold_back_seconds=1)
+            chunks = [pivoter.feed(samples.iloc[i:i + chunk_size]) for i in range(0, len(samples), chunk_size)]
+            chunks.append(pivoter.flush())
+            samples_df = pd.concat([chunk for chunk in chunks if chunk is not None])
+            self.assertTrue(self.are_dfs_equal(self.expected_normalized_samples, samples_df))
+
+    def test_pivoter_drops_late_samples(self):
+        samples = SFlowStreamIngestor.parse_chunk(self.sflow_csv.readlines(), self.keys)
+        pivoter = SFlowSamplesPivoter(self.keys, self.expected_interfaces, hold_back_seconds=0)
+        pivoter.feed(samples)
+        self.assertIsNone(pivoter.feed(samples.iloc[:86]))
+        self.assertEqual(3, pivoter.late_samples)
+
+    def test_stream_ingestor_saves_pivoted_samples(self):
+        with TemporaryDirectory() as temp_dir:
+            pivoter = SFlowSamplesPivoter(self.keys, self.expected_interfaces)
+            ingestor = SFlowStreamIngestor(self.sflow_csv, pivoter, pj(temp_dir, 'stream.hd5'), 'samples',
+                                           chunk_lines=100)
+            ingestor.start()
+            ingestor.join()
+            self.assertEqual(4, ingestor.rows_written)
+            self.assertTrue(self.are_dfs_equal(self.expected_samples, ingestor.read_samples()))
+
+    def test_stream_ingestor_skips_collector_warnings(self):
+        lines = self.sflow_csv.readlines()
+        lines.insert(10, "sflowtool: warning, unexpected sample\n")
+        self.assertEqual(len(lines) - 1, len(SFlowStreamIngestor.parse_chunk(lines, self.keys)))
+        with TemporaryDirectory() as temp_dir:
+            pivoter = SFlowSamplesPivoter(self.keys, self.expected_interfaces)
+            ingestor = SFlowStreamIngestor(lines, pivoter, pj(temp_dir, 'stream.hd5'), 'samples', chunk_lines=100)
+            ingestor.start()
+            ingestor.join()
+            self.assertIsNone(ingestor.error)
+            # handed on in the store, a chunk at a time
+            chunks = list(ingestor.stored_samples().iter_chunks(3))
+            self.assertEqual([3, 1], [len(chunk) for chunk in chunks])
+            self.assertTrue(self.are_dfs_equal(self.expected_samples, pd.concat(chunks)))
+
+    def test_stream_ingestor_reports_failure(self):
+        def failing_listener(rows):
+            raise RuntimeError("failed")
+
+        stream = iter(self.sflow_csv.readlines())
+        with TemporaryDirectory() as temp_dir:
+            pivoter = SFlowSamplesPivoter(self.keys, self.expected_interfaces)
+            ingestor = SFlowStreamIngestor(stream, pivoter, pj(temp_dir, 'stream.hd5'), 'samples', chunk_lines=10)
+            ingestor.rows_listeners.append(failing_listener)
+            ingestor.start()
+            ingestor.join()
+        self.assertIsInstance(ingestor.error, RuntimeError)
+        # the rest of the collector's output was still read
+        self.assertEqual([], list(stream))
+
+    def test_stream_ingestor_feeds_online_statistics(self):
+        with TemporaryDirectory() as temp_dir:
+            pivoter = SFlowSamplesPivoter(self.keys, self.expected_interfaces)
+            ingestor = SFlowStreamIngestor(self.sflow_csv, pivoter, pj(temp_dir, 'stream.hd5'), 'samples',
+                                           chunk_lines=100)
+            stats = OnlineStatistics(list(self.expected_interfaces.values()))
+            ingestor.rows_listeners.append(stats.update)
+            ingestor.start()
+            ingestor.join()
+            self.assertEqual(4, stats.seconds)
+            self.assertEqual(self.expected_samples['mean43'].mean(), stats.port_stats.mean[1])
+
+    def test_stream_ingestor_keeps_raw_archive(self):
+        with TemporaryDirectory() as temp_dir:
+            pivoter = SFlowSamplesPivoter(self.keys, self.expected_interfaces)
+            archive_path = pj(temp_dir, 'raw')
+            ingestor = SFlowStreamIngestor(self.sflow_csv, pivoter, pj(temp_dir, 'stream.hd5'), 'samples',
+                                           chunk_lines=100, archive=RawSamplesWriter(archive_path))
+            ingestor.start()
+            ingestor.join()
+            samples_df = SFlowMonitor.get_samples_archive(archive_path, self.keys, self.expected_interfaces)
+            self.assertTrue(self.are_dfs_equal(self.expected_samples, samples_df))
+            # the first second of the window is used up by the cumulative diff
+            samples_df = SFlowMonitor.get_samples_archive(archive_path, self.keys, self.expected_interfaces,
+                                                          start=1607902308, end=1607902311)
+            self.assertTrue(self.are_dfs_equal(self.expected_samples.iloc[1:3], samples_df))
+
+    @staticmethod
+    def sflow_datagram(counters):
+        """Encodes (ifIndex, ifInOctets) pairs as an sFlow v5 datagram of compact counter samples"""
+        samples = b''
+        for sequence, (where, what) in enumerate(counters):
+            record = SFlowV5Decoder.generic_interface_counters_struct.pack(where, 6, 10 ** 9, 1, 3, what,
+                                                                           *([0] * 13))
+            # an ethernet counters record before the generic one, which should be skipped
+            records = struct.pack('>II', 2, 52) + bytes(52) + struct.pack('>II', 1, len(record)) + record
+            sample = struct.pack('>III', sequence, where, 2) + records
+            samples += struct.pack('>II', 2, len(sample)) + sample
+        header = struct.pack('>II4sIIII', 5, 1, bytes([127, 0, 0, 1]), 0, 1, 1000, len(counters))
+        return header + samples
+
+    def sflow_csv_datagrams(self):
+        samples = SFlowStreamIngestor.parse_chunk(self.sflow_csv.readlines(), self.keys)
+        for when, second_samples in samples.groupby(self.keys[0]):
+            yield when, self.sflow_datagram(list(zip(second_samples[self.keys[1]], second_samples[self.keys[2]])))
+
+    def test_create_sflow_native_monitor(self):
+        monitor = MonitorFactory().create({"type": "sflow-native", "data_key": "ifOutOctets", "listen_port": 16343})
+        self.assertIsInstance(monitor, SFlowNativeMonitor)
+        self.assertEqual("ifOutOctets", monitor.keys[2])
+        self.assertEqual(16343, monitor.config.listen_port)
+        with self.assertRaises(ValueError):
+            MonitorFactory().create({"type": "sflow-native", "data_key": "ifInBananas"})
+
+    def test_sflow_v5_decoder(self):
+        counters = [(41, 1234), (43, 2 ** 40)]
+        self.assertEqual([(41, 1234, 6), (43, 2 ** 40, 6)],
+                         SFlowV5Decoder(['ifInOctets', 'ifType']).decode(self.sflow_datagram(counters)))
+        self.assertEqual(counters, SFlowV5Decoder(['ifInOctets']).decode(self.sflow_datagram(counters)))
+        self.assertEqual([(41, 0), (43, 0)], SFlowV5Decoder(['ifOutOctets']).decode(self.sflow_datagram(counters)))
+        with self.assertRaises(ValueError):
+            SFlowV5Decoder(['ifInOctets']).decode(struct.pack('>II', 4, 1))
+
+    def test_pivot_samples_matches_get_samples(self):
+        samples = SFlowStreamIngestor.parse_chunk(self.big_sflow_csv.readlines(), self.keys)
+        self.big_sflow_csv.seek(0)
+        expected = SFlowMonitor.get_samples_pandas(self.big_sflow_csv, self.keys, self.full_interfaces,
+                                                   normalize_by=1000)
+        samples_df = pivot_samples(*[samples[key].to_numpy() for key in self.keys], self.keys, self.full_interfaces,
+                                   normalize_by=1000)
+        self.assertTrue(self.are_dfs_equal(expected, samples_df))
+
+    def test_native_collector_replay(self):
+        replay_time = [0]
+        protocol = SFlowCollectorProtocol(SFlowV5Decoder(['ifInOctets']), SampleColumns(1), clock=lambda: replay_time[0])
+        for when, datagram in self.sflow_csv_datagrams():
+            replay_time[0] = when
+            protocol.datagram_received(datagram, ('127.0.0.1', 6343))
+        protocol.datagram_received(b'bad', ('127.0.0.1', 6343))
+        self.assertEqual(1, protocol.bad_datagrams)
+        samples_df = pivot_samples(*protocol.columns.view(), self.keys, self.expected_interfaces)
+        self.assertTrue(self.are_dfs_equal(self.expected_samples, samples_df))
+
+    def test_native_monitor_collects_over_udp(self):
+        monitor = SFlowNativeMonitor(SFlowNativeConfig(normalize_by=1000, listen_port=0))
+        replay_time = [0]
+        monitor.protocol.clock = lambda: replay_time[0]
+        monitor.start_collector()
+        address = monitor.transport.get_extra_info('sockname')
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+            for when, datagram in self.sflow_csv_datagrams():
+                replay_time[0] = when
+                sender.sendto(datagram, address)
+                # wait for the collector to take the datagram before moving the clock
+                deadline = monotonic() + 5
+                while monitor.protocol.columns.size < 86 * (when - 1607902306) and monotonic() < deadline:
+                    sleep(0.001)
+        samples_df = monitor.process_monitoring_data(self.expected_interfaces)
+        self.assertTrue(self.are_dfs_equal(self.expected_normalized_samples, samples_df))
+
+    @staticmethod
+    def make_fake_sysfs(path, counters):
+        for ifindex, (name, value) in enumerate(counters.items(), start=1):
+            makedirs(pj(path, name, 'statistics'))
+            with open(pj(path, name, 'ifindex'), 'w') as f:
+                f.write('%d\n' % ifindex)
+            with open(pj(path, name, 'statistics', 'rx_bytes'), 'w') as f:
+                f.write('%d\n' % value)
+
+    @staticmethod
+    def set_fake_counter(path, name, value):
+        with open(pj(path, name, 'statistics', 'rx_bytes'), 'w') as f:
+            f.write('%d\n' % value)
+
+    def test_sysfs_poller_rates(self):
+        with TemporaryDirectory() as sysfs, TemporaryDirectory() as output:
+            self.make_fake_sysfs(sysfs, {'lo': 0, 's1-eth1': 0, 's2-eth1': 1000})
+            self.assertEqual({1: 'lo', 2: 's1-eth1', 3: 's2-eth1'}, SysfsMonitor.get_interface_names(sysfs))
+            poll_time = [1607902306.0]
+            counter_paths = [pj(sysfs, name, 'statistics', 'rx_bytes') for name in ['s1-eth1', 's2-eth1']]
+            poller = SysfsCounterPoller(counter_paths, pj(output, 'spill.bin'), 0.5, buffer_rows=2,
+                                        clock=lambda: poll_time[0])
+            poller.open()
+            # poll by hand, at known times, instead of running the poller thread
+            for second in range(5):
+                poll_time[0] = 1607902306.0 + second * 0.5
+                self.set_fake_counter(sysfs, 's1-eth1', second * 1000)
+                self.set_fake_counter(sysfs, 's2-eth1', 1000 + second * second * 1000)
+                poller.poll_once()
+            # the buffer holds 2 rows, so most were spilled on the way
+            self.assertEqual(4, poller.spilled_rows)
+            poller.spill()
+            poller.close()
+            rows = poller.read_rows()
+        samples_df = SysfsMonitor.get_rates(rows, [2, 3], self.keys, {2: 's1-eth1', 3: 's2-eth1'}, 1000)
+        self.assertEqual(['s1-eth1', 's2-eth1'], list(samples_df.columns))
+        self.assertEqual('ifIndex', samples_df.columns.name)
+        self.assertEqual('unixSecondsUTC', samples_df.index.name)
+        self.assertEqual(datetime64('2020-12-13T23:31:46.500'), samples_df.index[0])
+        self.assertEqual([2.0] * 4, list(samples_df['s1-eth1']))
+        self.assertEqual([2.0, 6.0, 10.0, 14.0], list(samples_df['s2-eth1']))
+
+    def test_sysfs_monitor_polls_in_background(self):
+        with TemporaryDirectory() as sysfs, TemporaryDirectory() as output:
+            self.make_fake_sysfs(sysfs, {'s1-eth1': 0})
+            monitor = MonitorFactory().create({'type': 'sysfs', 'sysfs_path': sysfs, 'interval_seconds': 0.01})
+            with self.assertLogs('sdnsandbox.monitor', level='WARNING'):
+                monitor.start_monitoring(output, {1: 's1-eth1', 7: 'gone'})
+            deadline = monotonic() + 5
+            while monitor.poller.size < 3 and monotonic() < deadline:
+                sleep(0.01)
+            samples_df = monitor.process_monitoring_data({1: 's1-eth1'})
+            self.assertGreaterEqual(len(samples_df), 2)
+            self.assertTrue((samples_df['s1-eth1'] == 0).all())
+            self.assertFalse(listdir(output))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,11 +1,16 @@
+import json
 from tempfile import TemporaryDirectory
-from unittest import TestCase
+from unittest import TestCase, skipUnless
 import pandas as pd
 from os.path import join as pj, isfile, isdir
 import os
+from time import monotonic
+import numpy as np
 from numpy import datetime64
 
-from sdnsandbox.processor import IQRProcessor, PlottingProcessor
+from sdnsandbox.processor import IQRProcessor, PlottingProcessor, SketchIQRProcessor, \
+    ProcessorsFactory, ProcessorPipeline, DerivedInputs, Processor, RateShortfallProcessor
+from sdnsandbox.store import save_samples, StoredSamples, iter_samples_chunks
 
 
 class TestProcessor(TestCase):
@@ -36,6 +41,37 @@ class TestProcessor(TestCase):
         self.assertEqual(self.expected_iqr_results,
                          IQRProcessor.get_iqr_results(sampling_df=self.sampling_df))
 
+    def assert_within_sketch_bound(self, exact_results, sketch_results, relative_accuracy):
+        for name, exact in exact_results.items():
+            self.assertEqual(exact['instances_for_calc'], sketch_results[name]['instances_for_calc'])
+            self.assertEqual(exact['description'], sketch_results[name]['description'])
+        # the bound documented by SketchIQRProcessor
+        for name, values in [('total_iqr', self.big_df.to_numpy()), ('second_means_iqr', self.big_df.mean(axis=1))]:
+            q25, q75 = np.percentile(values, [25, 75])
+            self.assertAlmostEqual(exact_results[name]['result'], sketch_results[name]['result'],
+                                   delta=relative_accuracy * (abs(q25) + abs(q75)))
+        self.assertAlmostEqual(exact_results['port_means_iqr']['result'],
+                               sketch_results['port_means_iqr']['result'])
+
+    def test_sketch_iqr_results(self):
+        self.big_df = pd.DataFrame(np.random.RandomState(0).lognormal(8, 2, (10000, 20)))
+        exact_results = IQRProcessor.get_iqr_results(self.big_df)
+        sketch_results = SketchIQRProcessor.get_iqr_results(iter_samples_chunks(self.big_df, 999), 0.01)
+        self.assert_within_sketch_bound(exact_results, sketch_results, 0.01)
+
+    def test_sketch_iqr_from_hdf(self):
+        self.big_df = pd.DataFrame(np.random.RandomState(0).normal(100, 30, (5000, 10)),
+                                   index=pd.date_range('2020-12-13', periods=5000, freq='s'))
+        with TemporaryDirectory() as temp_dir:
+            self.big_df.to_hdf(pj(temp_dir, 'samples.hd5'), key='samples')
+            processor, = ProcessorsFactory.create([{'type': 'SketchIQR', 'hd5_filename': 'samples.hd5',
+                                                    'hd5_key': 'samples', 'chunk_rows': 700}])
+            # the given DataFrame is ignored when streaming from the file
+            processor.process(sampling_df=self.sampling_df, output_path=temp_dir)
+            with open(pj(temp_dir, processor.iqr_filename)) as f:
+                sketch_results = json.load(f)
+        self.assert_within_sketch_bound(IQRProcessor.get_iqr_results(self.big_df), sketch_results, 0.01)
+
     def test_plotting_creates_files(self):
         plots_subdir = 'plots'
         with TemporaryDirectory() as temp_dir:
@@ -51,3 +87,110 @@ class TestProcessor(TestCase):
                 self.assertTrue(isfile(path))
                 filenames.append(filename)
             self.assertEqual(filenames, sorted(os.listdir(plots_full_path)))
+
+    def test_plotting_multiple_counters(self):
+        sampling_df = pd.concat({'ifInOctets': self.sampling_df, 'ifOutOctets': self.sampling_df}, axis=1)
+        sampling_df = sampling_df.swaplevel(axis=1).sort_index(axis=1)
+        with TemporaryDirectory() as temp_dir:
+            PlottingProcessor().process(sampling_df=sampling_df, output_path=temp_dir)
+            self.assertEqual([PlottingProcessor.filename_format.format(port + '-' + counter)
+                              for port in ['mean41', 'mean43', 'mean45']
+                              for counter in ['ifInOctets', 'ifOutOctets']],
+                             sorted(os.listdir(pj(temp_dir, PlottingProcessor.plots_dirname))))
+
+    def test_parallel_plotting_is_identical(self):
+        with TemporaryDirectory() as serial_dir, TemporaryDirectory() as parallel_dir:
+            PlottingProcessor(workers=1).process(sampling_df=self.sampling_df, output_path=serial_dir)
+            PlottingProcessor(workers=2).process(sampling_df=self.sampling_df, output_path=parallel_dir)
+            filenames = sorted(os.listdir(pj(serial_dir, PlottingProcessor.plots_dirname)))
+            self.assertEqual(filenames, sorted(os.listdir(pj(parallel_dir, PlottingProcessor.plots_dirname))))
+            for filename in filenames:
+                with open(pj(serial_dir, PlottingProcessor.plots_dirname, filename), 'rb') as serial_png, \
+                        open(pj(parallel_dir, PlottingProcessor.plots_dirname, filename), 'rb') as parallel_png:
+                    self.assertEqual(serial_png.read(), parallel_png.read())
+
+    @skipUnless(os.environ.get('SDNSANDBOX_BENCHMARKS'), "a benchmark, run with SDNSANDBOX_BENCHMARKS=1")
+    def test_compare_parallel_plotting(self, ports=8, seconds=3600, workers=4):
+        sampling_df = pd.DataFrame(np.random.RandomState(0).rand(seconds, ports),
+                                   index=pd.date_range('2020-12-13', periods=seconds, freq='s'),
+                                   columns=['port%d' % port for port in range(ports)])
+        for processor in [PlottingProcessor(workers=1), PlottingProcessor(workers=workers)]:
+            with TemporaryDirectory() as temp_dir:
+                start = monotonic()
+                processor.process(sampling_df=sampling_df, output_path=temp_dir)
+                print("plotting with {} workers took= {:.10f} [sec]".format(processor.workers, monotonic() - start))
+                self.assertEqual(ports, len(os.listdir(pj(temp_dir, PlottingProcessor.plots_dirname))))
+
+    def test_pipeline_shares_derived_inputs(self):
+        derived = []
+
+        def counted(name, derive):
+            def derive_and_count(inputs):
+                derived.append(name)
+                return derive(inputs)
+            return derive_and_count
+
+        class CountingInputs(DerivedInputs):
+            derivations = {name: counted(name, derive) for name, derive in DerivedInputs.derivations.items()}
+
+        pipeline = ProcessorsFactory.create([{'type': 'IQR'}, {'type': 'IQR', 'iqr_filename': 'iqr2.json'},
+                                             {'type': 'SketchIQR'}], workers=3)
+        self.assertEqual(3, len(pipeline))
+        inputs = CountingInputs(self.sampling_df)
+        with TemporaryDirectory() as temp_dir:
+            for processor in pipeline:
+                processor.process_inputs(inputs, temp_dir)
+            for filename in ['iqr.json', 'iqr2.json']:
+                with open(pj(temp_dir, filename)) as f:
+                    self.assertEqual(json.loads(json.dumps(self.expected_iqr_results)), json.load(f))
+        self.assertEqual(sorted(DerivedInputs.derivations), sorted(derived))
+
+    def test_pipeline_reads_stored_samples_in_chunks(self):
+        pipeline = ProcessorsFactory.create([{'type': 'SketchIQR', 'chunk_rows': 2}, {'type': 'RateShortfall'}])
+        with TemporaryDirectory() as temp_dir:
+            save_samples(self.sampling_df, pj(temp_dir, 'stream.hd5'), 'samples')
+            inputs = DerivedInputs(StoredSamples(pj(temp_dir, 'stream.hd5'), 'samples'))
+            for processor in pipeline:
+                processor.process_inputs(inputs, temp_dir)
+            with open(pj(temp_dir, 'sketch_iqr.json')) as f:
+                self.assertEqual(15, json.load(f)['total_iqr']['instances_for_calc'])
+        # neither processor needed the samples whole
+        self.assertEqual({}, inputs.values)
+
+    def test_pipeline_runs_all_and_raises(self):
+        class FailingProcessor(Processor):
+            def process(self, sampling_df, output_path):
+                raise RuntimeError("failed")
+
+        pipeline = ProcessorPipeline([FailingProcessor(), IQRProcessor()])
+        with TemporaryDirectory() as temp_dir:
+            with self.assertRaises(RuntimeError):
+                pipeline.run(self.sampling_df, temp_dir)
+            self.assertTrue(isfile(pj(temp_dir, 'iqr.json')))
+
+    def test_rate_shortfall_processor(self):
+        pipeline = ProcessorsFactory.create([{'type': 'RateShortfall', 'min_ratio': 0.8}])
+        self.assertIsInstance(pipeline[0], RateShortfallProcessor)
+        rates_df = pd.DataFrame({'host': ['10.0.0.1', '10.0.0.2', '10.0.0.1', '10.0.0.2'],
+                                 'period': [0, 0, 1, 1],
+                                 'bucket': ['send_40bytes'] * 4,
+                                 'target_pps': [10.0] * 4,
+                                 'achieved_pps': [10.0, 9.0, 7.0, 8.0],
+                                 'bytes': [400.0] * 4})
+        with TemporaryDirectory() as temp_dir:
+            # nothing to check without the rates
+            pipeline.run(self.sampling_df, temp_dir)
+            self.assertFalse(isfile(pj(temp_dir, 'rate_shortfalls.json')))
+            rates_df.to_hdf(pj(temp_dir, 'rates.hd5'), key='rates', format='fixed')
+            pipeline.run(self.sampling_df, temp_dir)
+            with open(pj(temp_dir, 'rate_shortfalls.json')) as f:
+                results = json.load(f)
+        self.assertEqual([1], [period['period'] for period in results['flagged_periods']])
+        self.assertEqual(0.75, results['flagged_periods'][0]['ratio'])
+
+    def test_pipeline_rejects_unknown_inputs(self):
+        class UnknownInputsProcessor(IQRProcessor):
+            inputs = ['tomorrows_samples']
+
+        with self.assertRaises(ValueError):
+            ProcessorPipeline([UnknownInputsProcessor()])
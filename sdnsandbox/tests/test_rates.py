@@ -0,0 +1,133 @@
+import math
+import os
+from os.path import join as pj
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import pandas as pd
+
+from sdnsandbox.rates import parse_byte_count, RateRecorder, NpingStats, ITGSendStats, flag_rate_shortfalls
+
+NPING_OUTPUT = """
+Starting Nping 0.7.80 ( https://nmap.org/nping ) at 2021-01-01 00:00 UTC
+
+Max rtt: N/A | Min rtt: N/A | Avg rtt: N/A
+Raw packets sent: 300 (20.508KB) | Rcvd: 0 (0B) | Lost: 300 (100.00%)
+Nping done: 1 IP address pinged in 30.02 seconds
+"""
+
+# all that ITGSend itself outputs
+ITGSEND_OUTPUT = """ITGSend version 2.8.1 (r1023)
+Compile-time options: sctp dccp bursty multiport
+Started sending packets of flow ID: 1
+Finished sending packets of flow ID: 1
+"""
+
+# ITGDec's decoding of ITGSend's log
+ITGDEC_OUTPUT = """ITGDec version 2.8.1 (r1023)
+Compile-time options: sctp dccp bursty multiport
+----------------------------------------------------------
+Flow number: 1
+From 10.0.0.1:34771
+To    10.0.0.2:8999
+----------------------------------------------------------
+Total time               =     29.000000 s
+Total packets            =           870
+Minimum delay            =      0.000000 s
+Maximum delay            =      0.000000 s
+Average delay            =      0.000000 s
+Average jitter           =      0.000000 s
+Delay standard deviation =      0.000000 s
+Bytes received           =         34800
+Average bitrate          =      9.600000 Kbit/s
+Average packet rate      =     30.000000 pkt/s
+Packets dropped          =             0 (0.00 %)
+Average loss-burst size  =      0.000000 pkt
+----------------------------------------------------------
+
+__________________________________________________________
+****************  TOTAL RESULTS   ******************
+__________________________________________________________
+Number of flows          =             1
+Total time               =     29.000000 s
+Total packets            =           870
+Minimum delay            =      0.000000 s
+Maximum delay            =      0.000000 s
+Average delay            =      0.000000 s
+Average jitter           =      0.000000 s
+Delay standard deviation =      0.000000 s
+Bytes received           =         34800
+Average bitrate          =      9.600000 Kbit/s
+Average packet rate      =     30.000000 pkt/s
+Packets dropped          =             0 (0.00 %)
+Average loss-burst size  =             0 pkt
+Error lines              =             0
+----------------------------------------------------------
+"""
+
+
+class TestRates(TestCase):
+    def test_parse_byte_count(self):
+        self.assertEqual(0, parse_byte_count('0B'))
+        self.assertEqual(20.5 * 1024, parse_byte_count('20.500KB'))
+        self.assertEqual(2 * 1024 * 1024, parse_byte_count('2.000 MB'))
+        with self.assertRaises(ValueError):
+            parse_byte_count('2 bits')
+
+    def test_sender_stats(self):
+        recorder = RateRecorder()
+        nping_stats = NpingStats(recorder, '10.0.0.1', 3, 'send_40bytes', 10, 30)
+        for line in NPING_OUTPUT.splitlines():
+            nping_stats.feed_line(line)
+        nping_stats.finish()
+        with TemporaryDirectory() as logs_path:
+            itg_log_path = pj(logs_path, 'itgsend.log')
+            with open(itg_log_path, 'w') as itg_log:
+                itg_log.write(ITGDEC_OUTPUT)
+            itg_stats = ITGSendStats(recorder, '10.0.0.1', 3, 'send_1500B', 30, 30, itg_log_path)
+            # the sender's own output has no report
+            for line in ITGSEND_OUTPUT.splitlines():
+                itg_stats.feed_line(line)
+            self.assertIsNone(itg_stats.packets)
+            # standing for ITGDec, outputting its decoding of the log
+            itg_stats.decode_cmd = ['cat']
+            itg_stats.decode()
+            self.assertFalse(os.path.exists(itg_log_path))
+            # a sender that crashed before writing its log
+            missing_stats = ITGSendStats(recorder, '10.0.0.2', 3, 'send_1500B', 30, 30, pj(logs_path, 'missing'))
+            missing_stats.decode_cmd = ['cat']
+            missing_stats.decode()
+        # a killed sender never reports
+        NpingStats(recorder, '10.0.0.2', 3, 'send_40bytes', 10, 30).finish()
+        self.assertEqual([('10.0.0.1', 3, 'send_40bytes', 10, 300 / 30.02, 20.508 * 1024),
+                          ('10.0.0.1', 3, 'send_1500B', 30, 870 / 29, 34800)], recorder.records[:2])
+        self.assertTrue(math.isnan(recorder.records[2][4]))
+        self.assertTrue(math.isnan(recorder.records[3][4]))
+
+    def test_recorder_sums_destinations(self):
+        recorder = RateRecorder()
+        recorder.record('10.0.0.1', 0, 'send_40bytes', 10, 9, 360)
+        recorder.record('10.0.0.1', 0, 'send_40bytes', 20, 20, 800)
+        recorder.record('10.0.0.2', 0, 'send_40bytes', 10, 10, 400)
+        recorder.record('10.0.0.2', 0, 'send_40bytes', 10, math.nan, math.nan)
+        rates_df = recorder.to_dataframe()
+        self.assertEqual(['host', 'period', 'bucket', 'target_pps', 'achieved_pps', 'bytes'], list(rates_df.columns))
+        self.assertEqual([30.0, 29.0, 1160.0], rates_df.iloc[0][['target_pps', 'achieved_pps', 'bytes']].tolist())
+        self.assertEqual(20.0, rates_df.iloc[1]['target_pps'])
+        self.assertTrue(rates_df.iloc[1][['achieved_pps', 'bytes']].isna().all())
+
+    def test_flag_rate_shortfalls(self):
+        rates_df = pd.DataFrame({'host': ['10.0.0.1', '10.0.0.2'] * 3,
+                                 'period': [0, 0, 1, 1, 2, 2],
+                                 'bucket': ['send_40bytes'] * 6,
+                                 'target_pps': [10.0, 10.0, 10.0, 10.0, 10.0, 0.0],
+                                 'achieved_pps': [10.0, 9.5, 10.0, 5.0, math.nan, 0.0],
+                                 'bytes': [400.0] * 6})
+        results = flag_rate_shortfalls(rates_df, 0.9)
+        self.assertEqual(6, results['rates'])
+        self.assertEqual(1, results['unknown_rates'])
+        self.assertEqual(1, results['flagged_rates'])
+        # period 2 has no known rate of a sender that had to send
+        self.assertEqual(2, results['periods'])
+        self.assertEqual([{'period': 1, 'target_pps': 20.0, 'achieved_pps': 15.0, 'ratio': 0.75}],
+                         results['flagged_periods'])
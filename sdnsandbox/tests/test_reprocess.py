@@ -0,0 +1,61 @@
+import json
+from os import utime, stat, listdir
+from os.path import join as pj, isfile
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+
+from sdnsandbox.reprocess import reprocess_directories, load_config, main, PROCESSED, SKIPPED, FAILED
+
+
+class TestReprocess(TestCase):
+    network_data = {'interfaces': {}, 'switches': {'1': {}, '2': {}}, 'switch_links': [{}]}
+
+    def make_experiment_dir(self, path, seed):
+        sampling_df = pd.DataFrame(np.random.RandomState(seed).rand(100, 3), columns=['a', 'b', 'c'],
+                                   index=pd.date_range('2020-12-13', periods=100, freq='s'))
+        sampling_df.to_hdf(pj(path, 'sdnsandbox.hd5'), key='sdnsandbox_data')
+        with open(pj(path, 'network_data.json'), 'w') as f:
+            json.dump(self.network_data, f)
+
+    @staticmethod
+    def write_config(path, post_processors):
+        config_path = pj(path, 'config.json')
+        with open(config_path, 'w') as f:
+            json.dump({'runner': {'post_processors': post_processors}}, f)
+        return config_path
+
+    def test_reprocess_skips_unchanged(self):
+        with TemporaryDirectory() as first, TemporaryDirectory() as second, TemporaryDirectory() as conf_dir:
+            self.make_experiment_dir(first, 0)
+            self.make_experiment_dir(second, 1)
+            config = load_config(self.write_config(conf_dir, [{'type': 'IQR'}]))
+            self.assertEqual({first: PROCESSED, second: PROCESSED}, reprocess_directories([first, second], config, 2))
+            self.assertTrue(isfile(pj(first, 'iqr.json')))
+            self.assertEqual({first: SKIPPED, second: SKIPPED}, reprocess_directories([first, second], config, 2))
+            # changed samples
+            hd5_stat = stat(pj(second, 'sdnsandbox.hd5'))
+            utime(pj(second, 'sdnsandbox.hd5'), ns=(hd5_stat.st_atime_ns, hd5_stat.st_mtime_ns + 10 ** 9))
+            self.assertEqual({first: SKIPPED, second: PROCESSED}, reprocess_directories([first, second], config, 2))
+            self.assertEqual({first: PROCESSED}, reprocess_directories([first], config, force=True))
+            # changed config
+            config = load_config(self.write_config(conf_dir, [{'type': 'IQR'}, {'type': 'Plotting'}]))
+            self.assertEqual({first: PROCESSED, second: PROCESSED}, reprocess_directories([first, second], config, 2))
+            self.assertEqual(['link_load_a.png', 'link_load_b.png', 'link_load_c.png'],
+                             sorted(listdir(pj(second, 'plots'))))
+
+    def test_config_without_samples(self):
+        with TemporaryDirectory() as conf_dir:
+            config_path = pj(conf_dir, 'config.json')
+            with open(config_path, 'w') as f:
+                json.dump({'runner': {'post_processors': [], 'hd5_filename': None}}, f)
+            with self.assertRaises(ValueError):
+                load_config(config_path)
+
+    def test_reprocess_cli_fails_on_missing_inputs(self):
+        with TemporaryDirectory() as empty, TemporaryDirectory() as conf_dir:
+            config_path = self.write_config(conf_dir, [{'type': 'IQR'}])
+            with self.assertLogs('sdnsandbox.reprocess', level='ERROR'):
+                self.assertEqual(1, main(['-c', config_path, '-j', '1', empty]))
+            self.assertEqual({empty: FAILED}, reprocess_directories([empty], load_config(config_path)))
@@ -1,8 +1,17 @@
+import json
 from dataclasses import asdict
+from os import listdir
+from os.path import join as pj
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
 from unittest import TestCase
 
+import pandas as pd
+
+from sdnsandbox.catalog import CatalogBuilder
 from sdnsandbox.network import Interface
-from sdnsandbox.runner import Runner, InterfaceTranslation
+from sdnsandbox.runner import Runner, InterfaceTranslation, save_config
+from sdnsandbox.store import StoredSamples, save_samples
 
 
 class TestRunner(TestCase):
@@ -22,3 +31,23 @@ class TestRunner(TestCase):
         expected = {3: str(self.interfaces[3].net_meaning)}
         res = Runner.get_interfaces_naming(InterfaceTranslation.TRANSLATE_TO_MEANINGS, self.interfaces)
         self.assertEqual(expected, res)
+
+    def test_remove_stored_samples_once_saved(self):
+        samples_df = pd.DataFrame({'s1-eth1': [1.0, 2.0]}, index=pd.to_datetime([0, 1], unit='s'))
+        with TemporaryDirectory() as output_dir:
+            save_samples(samples_df, pj(output_dir, 'sflow_stream.hd5'), 'sflow_samples')
+            stored = StoredSamples(pj(output_dir, 'sflow_stream.hd5'), 'sflow_samples')
+            # without a saved copy the streamed store is the samples' only file
+            Runner(SimpleNamespace(output_dir=output_dir, hd5_filename=None)).remove_stored_samples(stored)
+            self.assertEqual(['sflow_stream.hd5'], listdir(output_dir))
+            Runner(SimpleNamespace(output_dir=output_dir, hd5_filename='sdnsandbox.hd5')).remove_stored_samples(stored)
+            self.assertEqual([], listdir(output_dir))
+
+    def test_save_config_for_the_catalog(self):
+        config = {'runner': {'network': {'topology_creator': {'graphml': 'zoo/Aarnet.graphml'}}}}
+        with TemporaryDirectory() as output_dir:
+            save_config(config, pj(output_dir, 'config.json'))
+            with open(pj(output_dir, 'config.json')) as config_file:
+                saved = json.load(config_file)
+        self.assertEqual(config, saved)
+        self.assertEqual('Aarnet', CatalogBuilder.get_topology_name(saved))
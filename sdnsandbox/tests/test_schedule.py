@@ -0,0 +1,123 @@
+import json
+from os.path import join as pj, dirname, abspath
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from sdnsandbox.dry_run import dry_run
+from sdnsandbox.schedule import LoadSchedule, SCHEDULE_FILENAME, calculate_periods_pps, destinations_to_shares, \
+    traffic_to_shares, drop_low_rates
+
+
+class TestSchedule(TestCase):
+    def setUp(self):
+        self.schedule = LoadSchedule(buckets=['small', 'large'],
+                                     rates=np.array([[[10.0, 0.5], [20.0, 2.0]],
+                                                     [[30.0, 3.0], [40.0, 4.0]]]),
+                                     shares=destinations_to_shares(np.array([[1, 0], [1, 1]])),
+                                     period_duration_seconds=10)
+
+    def test_periods_pps(self):
+        pps = calculate_periods_pps(np.arange(4), 100, 50, 4)
+        self.assertEqual([100, 150, 100, 50], pps.tolist())
+
+    def test_index(self):
+        self.assertEqual(2, self.schedule.periods)
+        self.assertEqual(2, self.schedule.hosts)
+        self.assertEqual({'small': 20.0, 'large': 2.0}, self.schedule.host_rates(0, 1))
+        self.assertEqual([(0, 1.0)], self.schedule.host_destinations(0, 1))
+        self.assertEqual([('10.0.0.1', {'small': 20.0, 'large': 2.0})],
+                         self.schedule.host_flows(0, 1, ['10.0.0.1', '10.0.0.2']))
+
+    def test_traffic_to_shares(self):
+        traffic = [[5, 1, 3, 0],
+                   [2, 0, 2, 0],
+                   [1, 1, 1, 1],
+                   [0, 0, 0, 0]]
+        shares = traffic_to_shares(traffic, periods_count=3, max_destinations=2)
+        self.assertEqual((12, 4), shares.shape)
+        # the same shares in every period, without the hosts themselves, the heaviest 2 destinations kept
+        for period in range(3):
+            self.assertEqual([0.25, 0.75], shares[period * 4].toarray()[0, 1:3].tolist())
+            self.assertEqual([0, 2], shares[period * 4 + 1].indices.tolist())
+            self.assertEqual([0.5, 0.5], shares[period * 4 + 1].data.tolist())
+            self.assertAlmostEqual(1.0, shares[period * 4 + 2].sum())
+            self.assertEqual(2, shares[period * 4 + 2].nnz)
+            # a host sending nothing has no destinations
+            self.assertEqual(0, shares[period * 4 + 3].nnz)
+        with self.assertRaises(ValueError):
+            traffic_to_shares(np.ones((2, 4, 4)), periods_count=3)
+
+    def test_flows_of_shared_rates(self):
+        schedule = LoadSchedule(buckets=['small'], rates=np.array([[[100.0], [10.0], [1.0]]]),
+                                shares=traffic_to_shares(np.ones((3, 3)), periods_count=1),
+                                period_duration_seconds=1)
+        self.assertEqual([('10.0.0.2', {'small': 50.0}), ('10.0.0.3', {'small': 50.0})],
+                         schedule.host_flows(0, 0, ['10.0.0.1', '10.0.0.2', '10.0.0.3']))
+        summary = schedule.summary()
+        self.assertEqual(2, summary['mean_destinations'])
+        # the third host's 1 pps is split into two
+        self.assertEqual(2, summary['rates_below_one_pps'])
+        self.assertEqual(0, summary['self_destinations'])
+        # the split 1 pps is given to a single flow
+        self.assertEqual([('10.0.0.2', {'small': 1.0})],
+                         schedule.host_flows(0, 2, ['10.0.0.1', '10.0.0.2', '10.0.0.3'], min_rate=1))
+
+    def test_drop_low_rates(self):
+        rates = drop_low_rates([[6.0, 0.4, 0.0], [3.0, 0.3, 0.0], [0.6, 0.2, 0.0]], min_rate=1)
+        np.testing.assert_allclose([[6.4, 0.0, 0.0], [3.2, 0.0, 0.0], [0.0, 0.0, 0.0]], rates)
+        # the rate of a bucket is kept as a whole while it can be
+        rates = drop_low_rates([[0.9], [0.8], [0.7]], min_rate=1)
+        self.assertAlmostEqual(2.4, rates.sum())
+        self.assertEqual(2, np.count_nonzero(rates))
+
+    def test_save_and_load(self):
+        with TemporaryDirectory() as temp_dir:
+            self.schedule.save(pj(temp_dir, SCHEDULE_FILENAME))
+            loaded = LoadSchedule.load(pj(temp_dir, SCHEDULE_FILENAME))
+        self.assertEqual(self.schedule.buckets, loaded.buckets)
+        np.testing.assert_array_equal(self.schedule.rates, loaded.rates)
+        self.assertEqual(0, (self.schedule.shares != loaded.shares).nnz)
+        self.assertEqual(10, loaded.period_duration_seconds)
+
+    def test_summary(self):
+        summary = self.schedule.summary()
+        self.assertEqual({'min': 10.5, 'mean': 27.375, 'max': 44.0}, summary['host_pps'])
+        self.assertEqual(1, summary['peak_period'])
+        self.assertEqual(77.0, summary['peak_network_pps'])
+        self.assertEqual(int((32.5 + 77.0) * 10), summary['total_packets'])
+        self.assertEqual(1, summary['rates_below_one_pps'])
+        # the second host sends to itself in the second period
+        self.assertEqual(1, summary['self_destinations'])
+
+    def test_dry_run(self):
+        graphml_url = 'file://' + pj(dirname(abspath(__file__)), 'Aarnet.graphml')
+        config = {'runner': {'network': {'topology_creator': {'type': 'ITZ', 'graphml': graphml_url,
+                                                              'bandwidth': {'host_mbps': 10, 'switch_mbps': 100}}},
+                             'load_generator': {'type': 'NPING-UDP-IMIX', 'periods': 1200,
+                                                'period_duration_seconds': 30, 'pps_base_level': 1500,
+                                                'pps_amplitude': 1000, 'pps_wavelength': 25,
+                                                'rate_factor_by_hosts': True,
+                                                'period_shifter': {'strategy': 'host_index'}}}}
+        with TemporaryDirectory() as temp_dir:
+            config_path = pj(temp_dir, 'config.json')
+            with open(config_path, 'w') as f:
+                json.dump(config, f)
+            summary = dry_run(config_path, output_dir=pj(temp_dir, 'output'))
+            schedule = LoadSchedule.load(pj(temp_dir, 'output', SCHEDULE_FILENAME))
+            self.assertEqual(5, dry_run(config_path, hosts_count=5)['hosts'])
+            # a trace replay sends what its trace does, by no schedule
+            config['runner']['load_generator'] = {'type': 'TRACE-REPLAY', 'trace_path': pj(temp_dir, 'trace.bin')}
+            with open(config_path, 'w') as f:
+                json.dump(config, f)
+            self.assertEqual({'load_generator': 'TRACE-REPLAY', 'hosts': 5, 'schedule': None},
+                             dry_run(config_path, hosts_count=5))
+        self.assertEqual('NPING-UDP-IMIX', summary['load_generator'])
+        self.assertEqual(1200, summary['periods'])
+        self.assertEqual(19, summary['hosts'])
+        self.assertEqual(10.0, summary['duration_hours'])
+        self.assertEqual(0, summary['self_destinations'])
+        self.assertEqual(0, summary['rates_below_one_pps'])
+        self.assertEqual((1200, 19, 5), schedule.rates.shape)
+        self.assertLess(summary['schedule_seconds'], 1)
@@ -0,0 +1,106 @@
+import json
+import unittest
+from os.path import join as pj
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pandas as pd
+from numpy import datetime64
+from scipy.stats import iqr
+
+from sdnsandbox.stats import RunningStats, QuantileSketch, OnlineStatistics, OnlineStatisticsRecorder
+
+
+class StatsTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.sampling_df = pd.DataFrame.from_dict(
+            {1607902307: {'mean41': 4247.0, 'mean43': 6394.0, 'mean45': 3973.0},
+             1607902308: {'mean41': 15705.0, 'mean43': 17189.0, 'mean45': 14173.0},
+             1607902309: {'mean41': 23667.0, 'mean43': 20479.0, 'mean45': 26415.0},
+             1607902310: {'mean41': 33740.0, 'mean43': 22100.0, 'mean45': 35928.0},
+             1607902311: {'mean41': 50265.0, 'mean43': 24906.0, 'mean45': 51948.0}}, orient='index')
+        cls.sampling_df.index = cls.sampling_df.index.map(lambda time: datetime64(time, 's'))
+        cls.random_values = np.random.RandomState(0).lognormal(mean=3, sigma=1.5, size=(2000, 5))
+
+    def test_running_stats_match_batch_stats(self):
+        values = self.random_values.copy()
+        values[::7, 1] = np.nan
+        stats = RunningStats(values.shape[1])
+        for block in np.array_split(values, 13):
+            stats.update(block)
+        np.testing.assert_array_equal((~np.isnan(values)).sum(axis=0), stats.count)
+        np.testing.assert_allclose(np.nanmean(values, axis=0), stats.mean)
+        np.testing.assert_allclose(np.nanvar(values, axis=0, ddof=1), stats.variance)
+
+    def test_running_stats_merge(self):
+        first, second = RunningStats(5), RunningStats(5)
+        first.update(self.random_values[:300])
+        second.update(self.random_values[300:])
+        first.merge(second)
+        np.testing.assert_allclose(self.random_values.mean(axis=0), first.mean)
+        np.testing.assert_allclose(self.random_values.var(axis=0, ddof=1), first.variance)
+
+    def test_sketch_relative_accuracy(self):
+        values = np.concatenate([self.random_values.ravel(), -self.random_values[:100, 0], np.zeros(50)])
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for block in np.array_split(values, 7):
+            sketch.update(block)
+        self.assertEqual(values.size, sketch.count)
+        sorted_values = np.sort(values)
+        for q in [0, 0.01, 0.02, 0.25, 0.5, 0.75, 0.99, 1]:
+            expected = sorted_values[int(q * (values.size - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - expected), 0.01 * abs(expected) + 1e-12)
+
+    def test_sketch_merge(self):
+        merged, other, whole = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        merged.update(self.random_values[:1000] * 1000)
+        other.update(self.random_values[1000:] / 1000)
+        merged.merge(other)
+        whole.update(np.concatenate([self.random_values[:1000] * 1000, self.random_values[1000:] / 1000]))
+        self.assertEqual(whole.count, merged.count)
+        for q in [0.1, 0.25, 0.5, 0.75, 0.9]:
+            self.assertEqual(whole.quantile(q), merged.quantile(q))
+        with self.assertRaises(ValueError):
+            merged.merge(QuantileSketch(0.05))
+
+    def test_online_statistics_iqr_results(self):
+        stats = OnlineStatistics(['mean41', 'mean43', 'mean45', 'never_sampled'], relative_accuracy=0.01)
+        for i in range(len(self.sampling_df)):
+            stats.update(self.sampling_df.iloc[i:i + 1])
+        results = stats.iqr_results()
+        self.assertEqual(15, results['total_iqr']['instances_for_calc'])
+        self.assertEqual(5, results['second_means_iqr']['instances_for_calc'])
+        self.assertEqual(3, results['port_means_iqr']['instances_for_calc'])
+        self.assertAlmostEqual(iqr(self.sampling_df.mean(axis=0).to_numpy()), results['port_means_iqr']['result'])
+        # rank based quantiles of 15 and 5 values, each within the relative accuracy
+        values = np.sort(self.sampling_df.to_numpy().ravel())
+        self.assertAlmostEqual(values[10] - values[3], results['total_iqr']['result'],
+                               delta=0.01 * (values[10] + values[3]))
+        second_means = np.sort(self.sampling_df.mean(axis=1).to_numpy())
+        self.assertAlmostEqual(second_means[3] - second_means[1], results['second_means_iqr']['result'],
+                               delta=0.01 * (second_means[3] + second_means[1]))
+
+    def test_recorder_writes_snapshots(self):
+        now = [0]
+        with TemporaryDirectory() as temp_dir:
+            path = pj(temp_dir, 'stats.json')
+            recorder = OnlineStatisticsRecorder(OnlineStatistics(list(self.sampling_df.columns)), path,
+                                                interval_seconds=10, clock=lambda: now[0])
+            recorder(self.sampling_df.iloc[:2])
+            now[0] = 10
+            recorder(self.sampling_df.iloc[2:4])
+            with open(path) as f:
+                snapshot = json.load(f)
+            self.assertEqual(4, snapshot['seconds'])
+            self.assertEqual(4, snapshot['ports']['mean41']['count'])
+            self.assertAlmostEqual(self.sampling_df['mean41'][:4].mean(), snapshot['ports']['mean41']['mean'])
+            self.assertAlmostEqual(self.sampling_df['mean41'][:4].std(), snapshot['ports']['mean41']['std'])
+            recorder(self.sampling_df.iloc[4:])
+            recorder.close()
+            with open(path) as f:
+                self.assertEqual(5, json.load(f)['seconds'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+from os.path import join as pj, getsize
+from tempfile import TemporaryDirectory
+from timeit import repeat as timeit
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+
+from sdnsandbox.store import save_samples, select_samples, open_samples_store, append_samples, finish_samples, \
+    StoredSamples, iter_samples_chunks
+
+
+class TestStore(TestCase):
+    samples_df: pd.DataFrame
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        # slowly changing link loads in whole bytes per second, normalized to MB/s like the monitors' output
+        random = np.random.RandomState(0)
+        waves = 500000 + 400000 * np.sin(np.arange(36000)[:, np.newaxis] / 300.0 + random.rand(20))
+        loads = np.round(waves + random.normal(0, 5000, (36000, 20))) / 125000.0
+        cls.samples_df = pd.DataFrame(loads, columns=['s%d-s%d' % (i, i + 1) for i in range(20)],
+                                      index=pd.date_range('2020-12-13', periods=36000, freq='s',
+                                                          name='unixSecondsUTC'))
+        cls.samples_df.columns.name = 'ifIndex'
+
+    def test_table_round_trip(self):
+        with TemporaryDirectory() as temp_dir:
+            path = pj(temp_dir, 'samples.hd5')
+            save_samples(self.samples_df, path, 'samples', chunk_rows=5000)
+            pd.testing.assert_frame_equal(self.samples_df, select_samples(path, 'samples'))
+            start, end = self.samples_df.index[1000], self.samples_df.index[1600]
+            pd.testing.assert_frame_equal(self.samples_df.iloc[1000:1600][['s3-s4', 's7-s8']],
+                                          select_samples(path, 'samples', start, end, ['s3-s4', 's7-s8']))
+            # saving again replaces the samples
+            save_samples(self.samples_df[:10], path, 'samples')
+            self.assertEqual(10, len(pd.read_hdf(path, key='samples')))
+
+    def test_periodic_appends(self):
+        with TemporaryDirectory() as temp_dir:
+            path = pj(temp_dir, 'samples.hd5')
+            with open_samples_store(path) as store:
+                for start in range(0, 100, 7):
+                    append_samples(store, 'samples', self.samples_df.iloc[start:min(start + 7, 100)])
+                    store.flush()
+                    # readable while being written
+                    self.assertEqual(min(start + 7, 100), store.get_storer('samples').nrows)
+                finish_samples(store, 'samples')
+            pd.testing.assert_frame_equal(self.samples_df.iloc[:100], select_samples(path, 'samples'))
+
+    def test_iter_samples_chunks(self):
+        samples_df = self.samples_df.iloc[:1000]
+        chunks = list(iter_samples_chunks(samples_df, 300))
+        self.assertEqual([300, 300, 300, 100], [len(chunk) for chunk in chunks])
+        with TemporaryDirectory() as temp_dir:
+            for hd5_format in ['table', 'fixed']:
+                path = pj(temp_dir, hd5_format + '.hd5')
+                save_samples(samples_df, path, 'samples', hd5_format=hd5_format)
+                chunks = list(iter_samples_chunks(StoredSamples(path, 'samples'), 300))
+                self.assertEqual([300, 300, 300, 100], [len(chunk) for chunk in chunks])
+                pd.testing.assert_frame_equal(samples_df, pd.concat(chunks))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            save_samples(self.samples_df, 'samples.hd5', 'samples', hd5_format='csv')
+
+    def test_compare_formats(self, repetitions=5):
+        with TemporaryDirectory() as temp_dir:
+            fixed_path, table_path = pj(temp_dir, 'fixed.hd5'), pj(temp_dir, 'table.hd5')
+            # the former way of saving
+            self.samples_df.to_hdf(fixed_path, key='samples')
+            save_samples(self.samples_df, table_path, 'samples')
+            print("fixed size= {} table size= {} ratio= {:.2f}".format(getsize(fixed_path), getsize(table_path),
+                                                                         getsize(fixed_path) / getsize(table_path)))
+            start, end = self.samples_df.index[20000], self.samples_df.index[20600]
+
+            def read_fixed_window():
+                samples_df = pd.read_hdf(fixed_path, key='samples')
+                return samples_df[(samples_df.index >= start) & (samples_df.index < end)]
+
+            time_res = timeit(read_fixed_window, number=1, repeat=repetitions)
+            print("fixed window read took= {:.10f} [sec]".format(min(time_res)))
+            time_res = timeit(lambda: select_samples(table_path, 'samples', start, end), number=1, repeat=repetitions)
+            print("table window read took= {:.10f} [sec]".format(min(time_res)))
+            pd.testing.assert_frame_equal(read_fixed_window(), select_samples(table_path, 'samples', start, end),
+                                          check_names=False)
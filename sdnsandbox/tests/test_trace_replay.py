@@ -0,0 +1,150 @@
+import io
+import json
+import os
+from os.path import join as pj
+from tempfile import TemporaryDirectory
+from typing import List, Tuple
+from unittest import TestCase
+
+import numpy as np
+
+from sdnsandbox.trace_replay import write_trace, open_trace, convert_csv, TraceReplayer, iter_host_chunks, \
+    split_trace, prepare_host_traces, TRACE_DTYPE
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeSocket(object):
+    def __init__(self, clock: FakeClock):
+        self.clock = clock
+        self.sent: List[Tuple[float, int, Tuple[str, int]]] = []
+
+    def sendto(self, payload, address):
+        self.sent.append((self.clock.now, len(payload), address))
+
+
+class TestTraceReplay(TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        self.trace_path = pj(self.temp_dir.name, 'trace.bin')
+        # endpoints 0, 2 and 4 are mapped onto host 0 of 2, endpoints 1 and 3 onto host 1
+        write_trace(self.trace_path,
+                    times_ns=[0, 500000000, 500000000, 1250000000, 2000000000, 2100000000],
+                    srcs=[0, 2, 1, 4, 0, 2],
+                    dsts=[1, 3, 0, 3, 2, 1],
+                    sizes=[40, 1472, 576, 100000, 40, 576])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_write_and_open(self):
+        trace = open_trace(self.trace_path)
+        self.assertIsInstance(trace, np.memmap)
+        self.assertEqual(6, len(trace))
+        self.assertEqual(65507, trace['size'][3])
+        write_trace(self.trace_path, [3000000000], [1], [0], [40], append=True)
+        self.assertEqual(7, len(open_trace(self.trace_path)))
+
+    def test_open_empty_or_partial_trace(self):
+        empty_path = pj(self.temp_dir.name, 'empty.bin')
+        open(empty_path, 'wb').close()
+        self.assertEqual(0, len(open_trace(empty_path)))
+        self.assertEqual([], list(iter_host_chunks(open_trace(empty_path), 0, 2, chunk_records=4)))
+        with open(empty_path, 'wb') as f:
+            f.write(b'\0' * (TRACE_DTYPE.itemsize + 1))
+        with self.assertRaises(ValueError):
+            open_trace(empty_path)
+
+    def test_split_trace(self):
+        host_paths = [pj(self.temp_dir.name, 'trace-%d.bin' % host_index) for host_index in range(2)]
+        split_trace(open_trace(self.trace_path), host_paths, chunk_records=4)
+        # each host's trace has just its own records, which replay the same as from the whole trace
+        self.assertEqual([0, 2, 4, 2], open_trace(host_paths[0])['src'].tolist())
+        self.assertEqual([1], open_trace(host_paths[1])['src'].tolist())
+        for host_index, host_path in enumerate(host_paths):
+            whole = np.concatenate(list(iter_host_chunks(open_trace(self.trace_path), host_index, 2, 4)))
+            split = np.concatenate(list(iter_host_chunks(open_trace(host_path), host_index, 2, 4)))
+            self.assertEqual(whole.tolist(), split.tolist())
+
+    def test_prepare_host_traces(self):
+        host_paths = prepare_host_traces(self.trace_path, 2, chunk_records=4)
+        self.assertEqual([pj(self.trace_path + '.hosts-2', 'trace-%d.bin' % host_index) for host_index in range(2)],
+                         host_paths)
+        self.assertEqual([0, 2, 4, 2], open_trace(host_paths[0])['src'].tolist())
+        # the split is reused until the trace changes (here, until it is newer than the split)
+        split_inode = os.stat(host_paths[0]).st_ino
+        self.assertEqual(host_paths, prepare_host_traces(self.trace_path, 2))
+        self.assertEqual(split_inode, os.stat(host_paths[0]).st_ino)
+        write_trace(self.trace_path, [3000000000], [1], [0], [40], append=True)
+        os.utime(self.trace_path + '.hosts-2', (0, 0))
+        self.assertEqual(host_paths, prepare_host_traces(self.trace_path, 2))
+        self.assertEqual([1, 1], open_trace(host_paths[1])['src'].tolist())
+        self.assertEqual(['trace.bin', 'trace.bin.hosts-2'], sorted(os.listdir(self.temp_dir.name)))
+
+    def test_host_chunks(self):
+        chunks = list(iter_host_chunks(open_trace(self.trace_path), 0, 2, chunk_records=4))
+        self.assertEqual(2, len(chunks))
+        self.assertEqual([0.0, 0.5, 1.25], chunks[0]['offset'].tolist())
+        self.assertEqual([1, 1, 1], chunks[0]['dst'].tolist())
+        # the packet from endpoint 0 to 2 stays within host 0, so it is skipped
+        self.assertEqual([2.1], chunks[1]['offset'].tolist())
+
+    def test_replay_pacing_and_reports(self):
+        clock = FakeClock()
+        sock = FakeSocket(clock)
+        reports = io.StringIO()
+        replayer = TraceReplayer(open_trace(self.trace_path), 0, ['10.0.0.1', '10.0.0.2'], 10000, reports,
+                                 chunk_records=4, sock=sock, clock=clock.clock, sleep_function=clock.sleep)
+        replayer.replay()
+        self.assertEqual([(100.0, 40, ('10.0.0.2', 10000)), (100.5, 1472, ('10.0.0.2', 10000)),
+                          (101.25, 65507, ('10.0.0.2', 10000)), (102.1, 576, ('10.0.0.2', 10000))],
+                         [(round(now, 6), size, address) for now, size, address in sock.sent])
+        reports = [json.loads(line) for line in reports.getvalue().splitlines()]
+        self.assertEqual([0, 1, 2], [report['second'] for report in reports])
+        self.assertEqual([2, 1, 1], [report['sent'] for report in reports])
+        self.assertEqual([1512, 65507, 576], [report['bytes'] for report in reports])
+        self.assertEqual([0.0, 0.0, 0.0], [round(report['max_lag'], 6) for report in reports])
+
+    def test_replay_reports_lag(self):
+        clock = FakeClock()
+
+        def oversleep(seconds):
+            # a stall makes the second packet a quarter of a second late
+            clock.sleep(seconds + 0.25 if not clock.sleeps else seconds)
+
+        reports = io.StringIO()
+        replayer = TraceReplayer(open_trace(self.trace_path), 0, ['10.0.0.1', '10.0.0.2'], 10000, reports,
+                                 speed=2.0, sock=FakeSocket(clock), clock=clock.clock, sleep_function=oversleep)
+        replayer.replay()
+        reports = [json.loads(line) for line in reports.getvalue().splitlines()]
+        # at twice the speed the packets are due at 0, 0.25, 0.625 and 1.05 seconds
+        self.assertEqual([3, 1], [report['sent'] for report in reports])
+        self.assertAlmostEqual(0.25, reports[0]['max_lag'])
+        self.assertAlmostEqual(0.25 / 3, reports[0]['mean_lag'])
+        self.assertAlmostEqual(0.0, reports[1]['max_lag'])
+
+    def test_convert_csv(self):
+        csv_path = pj(self.temp_dir.name, 'trace.csv')
+        with open(csv_path, 'w') as f:
+            f.write('time,src,dst,size,proto\n1600000000.5,0,1,40,udp\n1600000001.25,1,0,576,udp\n'
+                    '1600000001.25,2,1,1472,udp\n')
+        convert_csv(csv_path, self.trace_path, chunk_rows=2)
+        trace = open_trace(self.trace_path)
+        self.assertEqual([0, 750000000, 750000000], trace['time_ns'].tolist())
+        self.assertEqual([0, 1, 2], trace['src'].tolist())
+        self.assertEqual([40, 576, 1472], trace['size'].tolist())
+        with open(csv_path, 'a') as f:
+            f.write('1600000001.0,0,1,40,udp\n')
+        with self.assertRaises(ValueError):
+            convert_csv(csv_path, self.trace_path, chunk_rows=2)
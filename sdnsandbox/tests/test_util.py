@@ -1,8 +1,16 @@
 import io
+from subprocess import Popen
+from time import monotonic, sleep, process_time
 from unittest import TestCase
+
+import numpy as np
+
 from sdnsandbox.util import countdown, \
     calculate_geodesic_latency, \
-    calculate_manual_geodesic_latency
+    calculate_manual_geodesic_latency, \
+    calculate_distances_km, \
+    optical_fibre_lightspeed_m_per_millisec, \
+    ChildExitWatcher
 
 
 class TestUtil(TestCase):
@@ -22,7 +30,57 @@ class TestUtil(TestCase):
         latency = calculate_manual_geodesic_latency(0, 0, 10, 10)
         self.assertAlmostEqual(7.581, latency, delta=0.001)
 
+    def test_calculate_distances_km(self):
+        distances = calculate_distances_km(np.array([0.0, 10.0, 32.1]), np.array([0.0, 10.0, 34.8]))
+        self.assertEqual((3, 3), distances.shape)
+        np.testing.assert_allclose(np.zeros(3), distances.diagonal(), atol=1e-3)
+        np.testing.assert_allclose(distances, distances.T)
+        # the same distance as the latency is calculated from
+        self.assertAlmostEqual(calculate_manual_geodesic_latency(0, 0, 10, 10),
+                               distances[0, 1] * 1000 / optical_fibre_lightspeed_m_per_millisec, places=6)
+
     def test_countdown(self):
         output = io.StringIO()
         countdown(output.write, 3, delay_func=lambda a: a)
         self.assertEqual('00:0300:0200:01Done!', output.getvalue())
+
+    def test_child_exit_watcher(self):
+        with ChildExitWatcher() as watcher:
+            quick, slow, done = Popen(['sleep', '0.2']), Popen(['sleep', '5']), Popen(['true'])
+            done.wait()
+            for process in [quick, slow, done]:
+                watcher.watch(process)
+            self.assertEqual([done], watcher.wait(1))
+            start = monotonic()
+            self.assertEqual([quick], watcher.wait(2))
+            self.assertLess(monotonic() - start, 1)
+            self.assertEqual([], watcher.wait(0.1))
+            watcher.unwatch(slow)
+            self.assertEqual({}, watcher.processes)
+            self.assertEqual({}, watcher.pidfds)
+            slow.kill()
+            slow.wait()
+            self.assertEqual([], watcher.wait(0.1))
+
+    def test_compare_child_exit_watcher_idle_cpu(self, children=300, seconds=1.0):
+        processes = [Popen(['sleep', str(seconds * 30)]) for _ in range(children)]
+        try:
+            # the former supervision, polling every sender 10 times a second
+            start_cpu, deadline = process_time(), monotonic() + seconds
+            while monotonic() < deadline:
+                for process in processes:
+                    process.poll()
+                sleep(0.1)
+            print("polling {} children took= {:.10f} [cpu sec]".format(children, process_time() - start_cpu))
+            with ChildExitWatcher() as watcher:
+                for process in processes:
+                    watcher.watch(process)
+                start_cpu, deadline = process_time(), monotonic() + seconds
+                while monotonic() < deadline:
+                    self.assertEqual([], watcher.wait(deadline - monotonic()))
+                print("watching {} children ({}) took= {:.10f} [cpu sec]".format(children, watcher.mode,
+                                                                                process_time() - start_cpu))
+        finally:
+            for process in processes:
+                process.kill()
+                process.wait()
@@ -0,0 +1,253 @@
+"""Replays a packet trace as UDP traffic, run once per host (inside its network namespace):
+
+    python -m sdnsandbox.trace_replay replay --trace trace.bin --host-index 0 --port 10000 10.0.0.1 10.0.0.2 ...
+    python -m sdnsandbox.trace_replay convert trace.csv trace.bin
+
+A trace is a file of packed TRACE_DTYPE records sorted by time: the nanoseconds since the trace started, the source
+and destination endpoints and the UDP payload size. Endpoints are mapped onto the hosts by their index modulo the
+number of hosts, and each replayer sends the packets of its own host's endpoints, skipping those between endpoints
+of the same host. The trace is memory-mapped and read a chunk of records at a time, so only the pages being
+replayed are in memory, and it can first be split into a trace per host (split_trace), so that each replayer only
+reads its own host's records. The split traces are kept next to the trace (prepare_host_traces), and reused by the
+replays of the same number of hosts until the trace changes. Every second the replayer writes a JSON line report on
+stdout, with how late (behind the trace's times) its packets were sent: {"second": 3, "sent": 1200, "bytes": 691200,
+"errors": 0, "mean_lag": 0.0004, "max_lag": 0.002}.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+from time import monotonic, sleep
+from typing import List, Optional, Callable, Dict, Iterator
+
+import numpy as np
+
+TRACE_DTYPE = np.dtype([('time_ns', '<u8'), ('src', '<u4'), ('dst', '<u4'), ('size', '<u2')])
+MAX_PAYLOAD_SIZE = 65507
+# packets due this close are sent at once, rather than sleeping for less than the clock can tell apart
+DUE_SLACK_SECONDS = 1e-6
+
+
+def open_trace(path: str) -> np.ndarray:
+    """The memory-mapped records of the trace, an empty array for an empty trace (which can't be memory-mapped)"""
+    size = os.path.getsize(path)
+    if size % TRACE_DTYPE.itemsize:
+        raise ValueError("%s is not a trace: its %d bytes are not whole %d byte records" %
+                         (path, size, TRACE_DTYPE.itemsize))
+    if size == 0:
+        return np.empty(0, dtype=TRACE_DTYPE)
+    return np.memmap(path, dtype=TRACE_DTYPE, mode='r')
+
+
+def write_trace(path: str, times_ns, srcs, dsts, sizes, append: bool = False):
+    """Writes (or appends) records to a trace, which must end up sorted by time"""
+    records = np.empty(len(times_ns), dtype=TRACE_DTYPE)
+    records['time_ns'] = times_ns
+    records['src'] = srcs
+    records['dst'] = dsts
+    records['size'] = np.minimum(sizes, MAX_PAYLOAD_SIZE)
+    with open(path, 'ab' if append else 'wb') as f:
+        records.tofile(f)
+
+
+def convert_csv(csv_path: str, trace_path: str, chunk_rows: int = 1000000):
+    """Converts a CSV of time (seconds), src, dst and size columns to a trace, a chunk of rows at a time"""
+    # only converting needs pandas, so the replayers start faster without it
+    import pandas as pd
+    chunks = pd.read_csv(csv_path, usecols=['time', 'src', 'dst', 'size'], chunksize=chunk_rows)
+    start, last = None, 0
+    open(trace_path, 'wb').close()
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        times = chunk['time'].to_numpy(dtype=np.float64)
+        if start is None:
+            start = times[0]
+        # subtracting the start first keeps the precision of (large) unix times
+        times_ns = np.round((times - start) * 1e9).astype(np.int64)
+        if times_ns[0] < last or (np.diff(times_ns) < 0).any():
+            raise ValueError("The rows of %s are not sorted by time" % csv_path)
+        last = times_ns[-1]
+        write_trace(trace_path, times_ns, chunk['src'].to_numpy(), chunk['dst'].to_numpy(),
+                    chunk['size'].to_numpy(), append=True)
+
+
+def split_trace(trace: np.ndarray, host_paths: List[str], chunk_records: int = 1000000):
+    """Splits the trace into a trace per host (by index) of just the records that host sends, in a single pass,
+    so that each host's replayer reads only its own records rather than the whole trace"""
+    hosts_count = len(host_paths)
+    host_files = [open(path, 'wb') for path in host_paths]
+    try:
+        for start in range(0, len(trace), chunk_records):
+            chunk = trace[start:start + chunk_records]
+            src_hosts = chunk['src'] % hosts_count
+            sent = src_hosts != chunk['dst'] % hosts_count
+            chunk, src_hosts = chunk[sent], src_hosts[sent]
+            # a stable sort keeps each host's records sorted by time
+            order = np.argsort(src_hosts, kind='stable')
+            bounds = np.searchsorted(src_hosts[order], np.arange(hosts_count + 1))
+            host_records = chunk[order]
+            for host_index, host_file in enumerate(host_files):
+                host_records[bounds[host_index]:bounds[host_index + 1]].tofile(host_file)
+    finally:
+        for host_file in host_files:
+            host_file.close()
+
+
+def prepare_host_traces(trace_path: str, hosts_count: int, chunk_records: int = 1000000) -> List[str]:
+    """The paths of the trace split per host (see split_trace), in a directory next to the trace named for the
+    number of hosts, which is split again only when missing or older than the trace"""
+    hosts_dir = '%s.hosts-%d' % (trace_path, hosts_count)
+    host_paths = [os.path.join(hosts_dir, 'trace-%d.bin' % host_index) for host_index in range(hosts_count)]
+    if os.path.isdir(hosts_dir) and os.path.getmtime(hosts_dir) >= os.path.getmtime(trace_path):
+        return host_paths
+    # split into a directory of its own, and only then put it in place, so a split cut short is never reused
+    split_dir = tempfile.mkdtemp(prefix=os.path.basename(hosts_dir) + '.', dir=os.path.dirname(hosts_dir) or '.')
+    try:
+        split_trace(open_trace(trace_path),
+                    [os.path.join(split_dir, os.path.basename(path)) for path in host_paths], chunk_records)
+        if os.path.isdir(hosts_dir):
+            shutil.rmtree(hosts_dir)
+        os.rename(split_dir, hosts_dir)
+    except BaseException:
+        shutil.rmtree(split_dir, ignore_errors=True)
+        raise
+    return host_paths
+
+
+class LagReport(object):
+    """The packets sent in a second of the replay, and how late they were"""
+
+    def __init__(self, second: int):
+        self.second = second
+        self.sent = 0
+        self.bytes = 0
+        self.errors = 0
+        self.lag_sum = 0.0
+        self.max_lag = 0.0
+
+    def add(self, lags: np.ndarray, sent: int, sent_bytes: int, errors: int):
+        self.sent += sent
+        self.bytes += sent_bytes
+        self.errors += errors
+        self.lag_sum += float(lags.sum())
+        self.max_lag = max(self.max_lag, float(lags.max()))
+
+    def to_dict(self) -> Dict:
+        packets = self.sent + self.errors
+        return {'second': self.second,
+                'sent': self.sent,
+                'bytes': self.bytes,
+                'errors': self.errors,
+                'mean_lag': self.lag_sum / packets if packets else 0.0,
+                'max_lag': self.max_lag}
+
+
+def iter_host_chunks(trace: np.ndarray, host_index: int, hosts_count: int, chunk_records: int) \
+        -> Iterator[np.ndarray]:
+    """The host's records to send, a chunk of the trace at a time"""
+    for start in range(0, len(trace), chunk_records):
+        chunk = trace[start:start + chunk_records]
+        dst_hosts = chunk['dst'] % hosts_count
+        mine = (chunk['src'] % hosts_count == host_index) & (dst_hosts != host_index)
+        if mine.any():
+            host_chunk = np.empty(int(mine.sum()), dtype=[('offset', '<f8'), ('dst', '<u4'), ('size', '<u2')])
+            host_chunk['offset'] = chunk['time_ns'][mine] / 1e9
+            host_chunk['dst'] = dst_hosts[mine]
+            host_chunk['size'] = chunk['size'][mine]
+            yield host_chunk
+
+
+class TraceReplayer(object):
+    """Sends a host's packets of a trace at their times, in batches of all the packets that are due"""
+
+    def __init__(self, trace: np.ndarray, host_index: int, addresses: List[str], port: int, report_file,
+                 speed: float = 1.0, chunk_records: int = 65536, sock: Optional[socket.socket] = None,
+                 clock: Callable[[], float] = monotonic, sleep_function: Callable[[float], None] = sleep):
+        self.trace = trace
+        self.host_index = host_index
+        self.addresses = [(address, port) for address in addresses]
+        self.report_file = report_file
+        self.speed = speed
+        self.chunk_records = chunk_records
+        self.sock = sock or socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.clock = clock
+        self.sleep = sleep_function
+        self.payload = memoryview(bytes(MAX_PAYLOAD_SIZE))
+        self.start = 0.0
+        self.report = LagReport(0)
+
+    def replay(self, start: Optional[float] = None):
+        """Replays the trace from the given clock time (or now), reporting every second until it is over"""
+        self.start = self.clock() if start is None else start
+        self.report = LagReport(0)
+        for host_chunk in iter_host_chunks(self.trace, self.host_index, len(self.addresses), self.chunk_records):
+            offsets = host_chunk['offset'] / self.speed
+            sent = 0
+            while sent < len(offsets):
+                now = self.clock() - self.start
+                self.report_until(now)
+                due = int(np.searchsorted(offsets, now + DUE_SLACK_SECONDS, side='right'))
+                if due <= sent:
+                    # wake up for the next packet, or the next report if it is earlier
+                    self.sleep(max(0.0, min(offsets[sent], self.report.second + 1) - now))
+                    continue
+                self.send(host_chunk[sent:due], np.maximum(now - offsets[sent:due], 0.0))
+                sent = due
+        self.report_until(self.clock() - self.start)
+        self.write_report()
+
+    def send(self, records: np.ndarray, lags: np.ndarray):
+        sent, sent_bytes, errors = 0, 0, 0
+        for dst, size in zip(records['dst'].tolist(), records['size'].tolist()):
+            try:
+                self.sock.sendto(self.payload[:size], self.addresses[dst])
+            except OSError:
+                # e.g. full socket buffers, the packet is dropped rather than delaying the rest
+                errors += 1
+                continue
+            sent += 1
+            sent_bytes += size
+        self.report.add(lags, sent, sent_bytes, errors)
+
+    def report_until(self, now: float):
+        while now >= self.report.second + 1:
+            self.write_report()
+            self.report = LagReport(self.report.second + 1)
+
+    def write_report(self):
+        self.report_file.write(json.dumps(self.report.to_dict()) + '\n')
+        self.report_file.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sdnsandbox.trace_replay")
+    subparsers = parser.add_subparsers(dest='mode')
+    replay_parser = subparsers.add_parser('replay', help="Send a host's packets of a trace, reporting on stdout")
+    replay_parser.add_argument("--trace", required=True, help="The trace file")
+    replay_parser.add_argument("--host-index", type=int, required=True, help="The index of this host's address")
+    replay_parser.add_argument("--port", type=int, required=True, help="The destination UDP port")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="How much faster than the trace to replay")
+    replay_parser.add_argument("--chunk-records", type=int, default=65536, help="Trace records read at once")
+    replay_parser.add_argument("--start-at", type=float, default=None,
+                               help="The monotonic clock time to start at, so all hosts start together")
+    replay_parser.add_argument("addresses", nargs='+', help="The addresses of all hosts, by index")
+    convert_parser = subparsers.add_parser('convert', help="Convert a CSV of time, src, dst and size to a trace")
+    convert_parser.add_argument("csv_path")
+    convert_parser.add_argument("trace_path")
+    args = parser.parse_args(argv)
+    if args.mode == 'replay':
+        replayer = TraceReplayer(open_trace(args.trace), args.host_index, args.addresses, args.port, sys.stdout,
+                                 args.speed, args.chunk_records)
+        replayer.replay(args.start_at)
+    elif args.mode == 'convert':
+        convert_csv(args.csv_path, args.trace_path)
+    else:
+        parser.error("A mode is required")
+
+
+if __name__ == '__main__':
+    main()
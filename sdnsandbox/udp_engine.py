@@ -0,0 +1,234 @@
+"""A long-lived UDP traffic engine, run once per host (inside its network namespace):
+
+    python -m sdnsandbox.udp_engine send
+    python -m sdnsandbox.udp_engine receive --port 10000 [--counts-path counts.csv]
+
+The sender reads JSON commands, one per line, from stdin. A command sets the rates of the next period:
+{"period": 3, "dest": "10.0.0.2", "port": 10000, "rates": {"40": 300.0, "1472": 150.0}}, with packets per second
+by payload size, or those of several destinations at once: {"period": 3, "port": 10000, "flows":
+[{"dest": "10.0.0.2", "rates": {...}}, {"dest": "10.0.0.3", "rates": {...}}]}.
+When a command arrives, the sender writes the report of the previous period as a JSON line on stdout:
+{"period": 2, "seconds": 30.0, "sent": {"40": 9000, ...}, "errors": 0, "pps": 449.9}.
+{"stop": true} reports the last period and exits.
+The receiver drains its socket in batches, counting the packets and bytes it received from every source address in
+every (unix time) second, which it appends as time,src,packets,bytes CSV rows to the counts file once the second is
+over.
+Only the standard library is used, so that the engine starts fast and light on every host.
+"""
+import argparse
+import json
+import os
+import selectors
+import signal
+import socket
+import sys
+from time import monotonic, time
+from typing import Dict, Optional, Callable, List, Tuple
+
+
+class LineReader(object):
+    """Splits what is read from a (selected) file descriptor into lines, without blocking for a whole line"""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.buffer = b''
+        self.closed = False
+
+    def read_lines(self) -> List[str]:
+        data = os.read(self.fd, 65536)
+        if not data:
+            self.closed = True
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b'\n')
+        return [line.decode('utf-8') for line in lines if line.strip()]
+
+
+class ImixSender(object):
+    """Paces UDP packets of several payload sizes, each at its own rate, sending whatever is due in batches"""
+
+    def __init__(self, sock: socket.socket, clock: Callable[[], float] = monotonic, max_batch_seconds: float = 0.1):
+        self.sock = sock
+        self.clock = clock
+        # how much of a backlog (e.g. after a stall) may be sent at once, in seconds of packets
+        self.max_batch_seconds = max_batch_seconds
+        self.period = None  # type: Optional[int]
+        # the address, rates by payload size and packets sent by payload size of every destination
+        self.flows = []  # type: List[Tuple[Tuple[str, int], Dict[int, float], Dict[int, int]]]
+        self.payloads = {}  # type: Dict[int, bytes]
+        self.errors = 0
+        self.start = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.period is not None and any(rate > 0 for _, rates, _ in self.flows for rate in rates.values())
+
+    def set_rates(self, period: int, port: int, flows: List[Tuple[str, Dict[int, float]]]) -> Optional[Dict]:
+        """Switches to the next period's rates of every destination at once,
+        returning the report of the period that ended"""
+        report = self.report()
+        self.period = period
+        self.flows = [((dest, port), rates, {size: 0 for size in rates}) for dest, rates in flows]
+        self.payloads = {size: self.payloads.get(size, bytes(size)) for _, rates in flows for size in rates}
+        self.errors = 0
+        self.start = self.clock()
+        return report
+
+    def report(self) -> Optional[Dict]:
+        if self.period is None:
+            return None
+        seconds = self.clock() - self.start
+        sent = {}  # type: Dict[int, int]
+        for _, _, flow_sent in self.flows:
+            for size, count in flow_sent.items():
+                sent[size] = sent.get(size, 0) + count
+        total = sum(sent.values())
+        return {'period': self.period,
+                'seconds': seconds,
+                'sent': {str(size): count for size, count in sent.items()},
+                'errors': self.errors,
+                'pps': total / seconds if seconds > 0 else 0.0}
+
+    def send_due(self):
+        elapsed = self.clock() - self.start
+        for address, rates, sent in self.flows:
+            for size, rate in rates.items():
+                due = min(int(rate * elapsed) - sent[size], int(rate * self.max_batch_seconds) + 1)
+                payload = self.payloads[size]
+                for _ in range(due):
+                    try:
+                        self.sock.sendto(payload, address)
+                    except OSError:
+                        # e.g. full socket buffers, the packet is counted as due again on the next batch
+                        self.errors += 1
+                        break
+                    sent[size] += 1
+
+
+def run_sender(control_fd: int, report_file, tick_seconds: float = 0.001, sock: Optional[socket.socket] = None):
+    sock = sock or socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = ImixSender(sock)
+    reader = LineReader(control_fd)
+    with selectors.DefaultSelector() as selector:
+        selector.register(control_fd, selectors.EVENT_READ)
+        while True:
+            if selector.select(tick_seconds if sender.active else None):
+                for line in reader.read_lines():
+                    command = json.loads(line)
+                    if command.get('stop'):
+                        reader.closed = True
+                        break
+                    flows = command.get('flows') or [{'dest': command['dest'], 'rates': command['rates']}]
+                    report = sender.set_rates(int(command['period']), int(command['port']),
+                                              [(flow['dest'], {int(size): float(rate)
+                                                               for size, rate in flow['rates'].items()})
+                                               for flow in flows])
+                    write_report(report_file, report)
+                if reader.closed:
+                    write_report(report_file, sender.report())
+                    return
+            if sender.active:
+                sender.send_due()
+
+
+def write_report(report_file, report: Optional[Dict]):
+    if report is not None:
+        report_file.write(json.dumps(report) + '\n')
+        report_file.flush()
+
+
+class ReceiveCounter(object):
+    """The packets and bytes received from every source address in the current second"""
+    COUNTS_HEADER = 'time,src,packets,bytes\n'
+
+    def __init__(self, counts_file=None):
+        self.counts_file = counts_file
+        self.second = None  # type: Optional[int]
+        # packets and bytes by source address
+        self.counts = {}  # type: Dict[str, List[int]]
+
+    def start_second(self, second: int):
+        """Writes the counts of the previous second, when a new one started"""
+        if second != self.second:
+            self.write_counts()
+            self.second = second
+
+    def add(self, src: str, size: int):
+        counts = self.counts.get(src)
+        if counts is None:
+            self.counts[src] = [1, size]
+        else:
+            counts[0] += 1
+            counts[1] += size
+
+    def write_counts(self):
+        if self.counts and self.counts_file is not None:
+            self.counts_file.write(''.join('%d,%s,%d,%d\n' % (self.second, src, packets, size)
+                                           for src, (packets, size) in self.counts.items()))
+            self.counts_file.flush()
+        self.counts = {}
+
+
+def receive_batch(sock: socket.socket, buffer: bytearray, counter: ReceiveCounter, max_packets: int) -> int:
+    """Receives the packets waiting on the (non blocking) socket, up to max_packets, returning how many there were"""
+    for received in range(max_packets):
+        try:
+            size, (src, _) = sock.recvfrom_into(buffer)
+        except BlockingIOError:
+            return received
+        counter.add(src, size)
+    return max_packets
+
+
+def run_receiver(port: int, ip: str = '0.0.0.0', buffer_bytes: int = 1 << 21, counts_file=None,
+                 batch_packets: int = 1024, clock: Callable[[], float] = time):
+    """Takes in the UDP packets sent to the port, so senders are not answered with ICMP errors,
+    counting them by source and second"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_bytes)
+    sock.bind((ip, port))
+    sock.setblocking(False)
+    buffer = bytearray(65536)
+    counter = ReceiveCounter(counts_file)
+    try:
+        with selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_READ)
+            while True:
+                now = clock()
+                counter.start_second(int(now))
+                # wake up when the second is over to write its counts, even with nothing to receive
+                if selector.select(int(now) + 1 - now if counter.counts else None):
+                    counter.start_second(int(clock()))
+                    receive_batch(sock, buffer, counter, batch_packets)
+    finally:
+        counter.write_counts()
+        sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sdnsandbox.udp_engine")
+    subparsers = parser.add_subparsers(dest='mode')
+    send_parser = subparsers.add_parser('send', help="Send at the rates given on stdin, reporting on stdout")
+    send_parser.add_argument("--tick-seconds", type=float, default=0.001, help="Pacing interval")
+    receive_parser = subparsers.add_parser('receive', help="Take in UDP packets sent to a port")
+    receive_parser.add_argument("--port", type=int, required=True)
+    receive_parser.add_argument("--counts-path", default=None,
+                                help="The CSV file to append the packets and bytes received every second to")
+    args = parser.parse_args(argv)
+    if args.mode == 'send':
+        run_sender(sys.stdin.fileno(), sys.stdout, args.tick_seconds)
+    elif args.mode == 'receive':
+        # terminating the receiver still writes the counts of the last second
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        if args.counts_path is None:
+            run_receiver(args.port)
+        else:
+            with open(args.counts_path, 'a') as counts_file:
+                if counts_file.tell() == 0:
+                    counts_file.write(ReceiveCounter.COUNTS_HEADER)
+                run_receiver(args.port, counts_file=counts_file)
+    else:
+        parser.error("A mode is required")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,20 @@
 import time
 import logging
 import math
+import os
+import selectors
+import signal
+import threading
 from shutil import which
+from typing import Dict, List, Optional
 
+import numpy as np
 from geopy.distance import geodesic
-from subprocess import run, PIPE
+from subprocess import run, PIPE, Popen
 from pkg_resources import resource_filename
 from os.path import join as pj
 
+logger = logging.getLogger(__name__)
 
 lightspeed_m_per_millisec = 299792.458
 optical_fibre_refraction_index = 1.4475
@@ -62,6 +69,16 @@ def calculate_manual_geodesic_latency(lat_src, long_src, lat_dst, long_dst):
     return (distance * 1000) / optical_fibre_lightspeed_m_per_millisec
 
 
+def calculate_distances_km(latitudes, longitudes) -> np.ndarray:
+    """The distances between each two of the locations, using the distance formula of
+    calculate_manual_geodesic_latency for all of them at once"""
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    cosines = np.sin(latitudes[:, None]) * np.sin(latitudes[None, :]) + \
+        np.cos(latitudes[:, None]) * np.cos(latitudes[None, :]) * np.cos(longitudes[None, :] - longitudes[:, None])
+    # rounding can take the cosines of (nearly) equal locations just over 1
+    return np.arccos(np.clip(cosines, -1.0, 1.0)) * 6378.137
+
+
 def run_script(script_name, info_print, err_print):
     script_path = resource_filename('sdnsandbox', pj("scripts", script_name))
     result = run(script_path, universal_newlines=True, stdout=PIPE, stderr=PIPE)
@@ -75,3 +92,110 @@ def run_script(script_name, info_print, err_print):
 def ensure_cmd_exists(cmd: str, doesnt_exist_meaning: str = ''):
     if which(cmd) is None:
         raise RuntimeError("Command %s is not available! %s" % (cmd, doesnt_exist_meaning))
+
+
+class ChildExitWatcher(object):
+    """Waits for any of the watched child processes to exit, staying idle until one does.
+    Exits are noticed through pidfds where the platform has them, otherwise through SIGCHLD (from the main thread),
+    and only as a last resort by polling the processes every poll_interval seconds."""
+
+    def __init__(self, poll_interval: float = 0.1):
+        self.poll_interval = poll_interval
+        self.processes: Dict[int, Popen] = {}
+        # the pidfd of every watched process, by its pid
+        self.pidfds: Dict[int, int] = {}
+        self.exited: List[Popen] = []
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_fds: Optional[tuple] = None
+        self.previous_wakeup_fd = None
+        self.previous_handler = None
+        if hasattr(os, 'pidfd_open'):
+            self.mode = 'pidfd'
+        elif threading.current_thread() is threading.main_thread():
+            self.mode = 'sigchld'
+            self.wakeup_fds = os.pipe()
+            for fd in self.wakeup_fds:
+                os.set_blocking(fd, False)
+            # the wakeup fd is only written for signals with a (Python level) handler
+            self.previous_handler = signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+            self.previous_wakeup_fd = signal.set_wakeup_fd(self.wakeup_fds[1])
+            self.selector.register(self.wakeup_fds[0], selectors.EVENT_READ)
+        else:
+            self.mode = 'poll'
+            logger.warning("Polling child processes every %.2f seconds, as only the main thread can be notified of "
+                           "their exit", poll_interval)
+
+    def watch(self, process: Popen):
+        if self.mode == 'pidfd':
+            try:
+                pidfd = os.pidfd_open(process.pid)  # type: ignore[attr-defined]  # only checked when os has it
+                self.selector.register(pidfd, selectors.EVENT_READ, process)
+                self.pidfds[process.pid] = pidfd
+            except ProcessLookupError:
+                pass
+        self.processes[process.pid] = process
+        # it may have exited before it was watched
+        if process.poll() is not None:
+            self.found_exit(process)
+
+    def unwatch(self, process: Popen):
+        self.processes.pop(process.pid, None)
+        pidfd = self.pidfds.pop(process.pid, None)
+        if pidfd is not None:
+            self.selector.unregister(pidfd)
+            os.close(pidfd)
+
+    def found_exit(self, process: Popen):
+        if process.pid in self.processes:
+            self.unwatch(process)
+            self.exited.append(process)
+
+    def wait(self, timeout: Optional[float] = None) -> List[Popen]:
+        """The watched processes that exited (no longer watched), waiting up to timeout seconds for one to"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.exited:
+            time_left = None if deadline is None else deadline - time.monotonic()
+            if time_left is not None and time_left <= 0:
+                break
+            if self.mode == 'poll':
+                time.sleep(self.poll_interval if time_left is None else min(self.poll_interval, time_left))
+                self.poll_all()
+                continue
+            for key, _ in self.selector.select(time_left):
+                if self.mode == 'pidfd':
+                    if key.data.poll() is not None:
+                        self.found_exit(key.data)
+                else:
+                    # SIGCHLD does not tell which child exited (or of how many, some perhaps not watched)
+                    self.drain_wakeup_fd()
+                    self.poll_all()
+        exited, self.exited = self.exited, []
+        return exited
+
+    def poll_all(self):
+        for process in list(self.processes.values()):
+            if process.poll() is not None:
+                self.found_exit(process)
+
+    def drain_wakeup_fd(self):
+        try:
+            while os.read(self.wakeup_fds[0], 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        for process in list(self.processes.values()):
+            self.unwatch(process)
+        if self.mode == 'sigchld':
+            signal.set_wakeup_fd(self.previous_wakeup_fd)
+            signal.signal(signal.SIGCHLD, self.previous_handler)
+            for fd in self.wakeup_fds:
+                os.close(fd)
+        self.selector.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()